@@ -0,0 +1,76 @@
+"""
+Concurrent throughput benchmark for the hot read endpoints.
+
+Drives a running server with `--concurrency` simultaneous clients per endpoint
+for `--duration` seconds and prints requests/second as JSON. Run it once against
+a build that uses the sync session (`get_db`) and once against the async session
+(`get_async_db`) with the same database to compare them, e.g.:
+
+    uvicorn main:app --workers 1 &
+    python -m benchmarks.concurrency --base-url http://127.0.0.1:8000 --slug my-product --token <jwt>
+"""
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+
+def endpoints(args):
+    items = {
+        "products": ("GET", "/api/v1/products/", {"paginate": {"page": 1, "size": 10}}),
+        "categories": ("GET", "/api/v1/categories/", None),
+    }
+    if args.slug:
+        items["product_info"] = ("GET", f"/api/v1/products/{args.slug}", None)
+    if args.token:
+        items["cart"] = ("GET", "/api/v1/carts/", None)
+    return items
+
+
+async def worker(client: httpx.AsyncClient, method: str, path: str, body, deadline: float, stats: dict):
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.request(method, path, json=body)
+            stats["requests"] += 1
+            if response.status_code >= 400:
+                stats["errors"] += 1
+        except httpx.HTTPError:
+            stats["requests"] += 1
+            stats["errors"] += 1
+
+
+async def run_endpoint(args, method: str, path: str, body) -> dict:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    stats = {"requests": 0, "errors": 0}
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[worker(client, method, path, body, deadline, stats) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rps"] = round(stats["requests"] / elapsed, 2) if elapsed else 0
+    return stats
+
+
+async def main(args):
+    results = {}
+    for name, (method, path, body) in endpoints(args).items():
+        results[name] = await run_endpoint(args, method, path, body)
+    print(json.dumps({"concurrency": args.concurrency, "duration": args.duration, "results": results}, indent=2))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--slug", help="product slug for the product detail endpoint")
+    parser.add_argument("--token", help="bearer token for the cart endpoint")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,88 @@
+"""
+Local stand-in for the Zarinpal v4 gateway, for running the pay/verify flow
+offline and under load.
+
+Implements `v4/payment/request.json`, `v4/payment/verify.json` and the
+`StartPay/<authority>` page under /pg/, with configurable latency and failure
+rate. Verification answers 100 the first time and 101 afterwards, like the real
+gateway; unknown authorities or amounts answer -51.
+
+    python -m benchmarks.mock_zarinpal --port 9000 --latency 0.05 --failure-rate 0.02
+    ZARINPAL_URL=http://127.0.0.1:9000/pg/ ZARINPAL_START_PAY_URL=http://127.0.0.1:9000/pg/StartPay/ uvicorn main:app
+    python -m benchmarks.load --manifest bench_manifest.json --scenarios payment
+"""
+import argparse
+import asyncio
+import itertools
+import random
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse
+
+
+def create_app(latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 42) -> FastAPI:
+    app = FastAPI(title="mock zarinpal")
+    rng = random.Random(seed)
+    counter = itertools.count(1)
+    # authority -> [amount, verified]
+    payments = {}
+    ref_ids = itertools.count(100000)
+
+    async def simulate():
+        """Sleep for the configured latency; returns an error response when the call should fail."""
+        await asyncio.sleep(max(latency + rng.uniform(-jitter, jitter), 0))
+        if rng.random() < failure_rate:
+            return JSONResponse({"data": [], "errors": {"code": -1, "message": "mock failure"}}, status_code=503)
+        return None
+
+    def error(code: int, message: str):
+        return JSONResponse({"data": [], "errors": {"code": code, "message": message}}, status_code=400)
+
+    @app.post("/pg/v4/payment/request.json")
+    async def request_payment(request: Request):
+        failed = await simulate()
+        if failed:
+            return failed
+        body = await request.json()
+        if not body.get("merchant_id") or not body.get("amount") or not body.get("callback_url"):
+            return error(-9, "validation error")
+        authority = f"A{next(counter):035d}"
+        payments[authority] = [int(body["amount"]), False]
+        return {"data": {"code": 100, "message": "Success", "authority": authority, "fee_type": "Merchant", "fee": 0}, "errors": []}
+
+    @app.post("/pg/v4/payment/verify.json")
+    async def verify_payment(request: Request):
+        failed = await simulate()
+        if failed:
+            return failed
+        body = await request.json()
+        payment = payments.get(body.get("authority"))
+        if payment is None or payment[0] != int(body.get("amount") or 0):
+            return error(-51, "session is not valid")
+        code = 101 if payment[1] else 100
+        payment[1] = True
+        return {"data": {"code": code, "message": "Verified", "ref_id": next(ref_ids), "card_pan": "502229******5995",
+                         "card_hash": "", "fee_type": "Merchant", "fee": 0}, "errors": []}
+
+    @app.get("/pg/StartPay/{authority}", response_class=HTMLResponse)
+    async def start_pay(authority: str):
+        return f"<html><body>mock payment page for {authority}</body></html>"
+
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    uvicorn.run(create_app(args.latency, args.jitter, args.failure_rate, args.seed), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,117 @@
+"""
+Response serialization benchmark: FastAPI's response_model path against the
+prebuilt serializers in core.responses.
+
+Loads one page of the home listing and one product from the database (seed it
+with `python -m benchmarks.seed` first) and times turning each into response
+bytes, without HTTP or database time:
+
+* `response_model`: a route returning `Result(...)` under `response_model`
+  (fastapi.routing.serialize_response followed by the JSON response class)
+* `serializer`: core.responses.ResultSerializer
+
+    python -m benchmarks.serialization --slug bench-product-1 --size 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy.orm import joinedload, selectinload
+from core.database import SessionLocal
+from core.responses import ResultSerializer
+from crud.product import product_service
+from models.product import Product, ProductAttribute, ProductVariation, VariationAttribute
+from schemas.product import Product as ProductSchema, ProductConfig, ProductListData
+from schemas.result import PaginationResult, Result
+
+MESSAGE = 'عملیات با موفقیت انجام شد!'
+
+
+async def time_per_call(fn, iterations: int, repeats: int) -> dict:
+    """Median and best microseconds per call over `repeats` runs of `iterations` calls."""
+    await fn()
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await fn()
+        runs.append((time.perf_counter() - started) / iterations * 1e6)
+    return {"median_us": round(statistics.median(runs), 1), "best_us": round(min(runs), 1)}
+
+
+def response_model_path(response_model, response_class):
+    field = create_response_field(name="benchmark_response", type_=response_model)
+
+    async def render(model):
+        content = await serialize_response(field=field, response_content=model)
+        return response_class(content).body
+    return render
+
+
+async def compare(name: str, response_model, fastapi_content, fast_content: dict, args) -> dict:
+    serializer = ResultSerializer(response_model)
+    stdlib = response_model_path(response_model, JSONResponse)
+    orjson = response_model_path(response_model, ORJSONResponse)
+
+    async def fast():
+        return serializer.dump(**fast_content)
+
+    results = {
+        "response_model+json": await time_per_call(lambda: stdlib(fastapi_content), args.iterations, args.repeats),
+        "response_model+orjson": await time_per_call(lambda: orjson(fastapi_content), args.iterations, args.repeats),
+        "serializer": await time_per_call(fast, args.iterations, args.repeats),
+    }
+    baseline = results["response_model+json"]["median_us"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["median_us"], 2) if result["median_us"] else None
+    results["bytes"] = len(serializer.dump(**fast_content))
+    return {name: results}
+
+
+async def main(args):
+    report = {}
+    with SessionLocal() as db:
+        config = ProductConfig.model_validate({"paginate": {"page": 1, "size": args.size}})
+        data, pagination = product_service.get_home_products(db, config)
+        content = dict(isDone=True, data=data, pagination=pagination, message=MESSAGE)
+        report.update(await compare(
+            "products", PaginationResult[ProductListData], PaginationResult(**content), content, args,
+        ))
+
+        if args.slug:
+            # the response_model path gets the ORM product, as the endpoint used to return it
+            product = db.query(Product).options(
+                selectinload(Product.files),
+                selectinload(Product.categories),
+                selectinload(Product.attributes).joinedload(ProductAttribute.attribute),
+                selectinload(Product.variations)
+                    .selectinload(ProductVariation.variation_attributes)
+                    .joinedload(VariationAttribute.product_attribute)
+                    .joinedload(ProductAttribute.attribute),
+                joinedload(Product.user),
+            ).filter(Product.slug == args.slug).one()
+            document = ProductSchema.model_validate(product, from_attributes=True)
+            report.update(await compare(
+                "product_info", Result[ProductSchema],
+                Result(isDone=True, data=product, message=MESSAGE),
+                dict(isDone=True, data=document, message=MESSAGE),
+                args,
+            ))
+    print(json.dumps({"iterations": args.iterations, "repeats": args.repeats, "results": report}, indent=2))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slug", help="product slug for the product detail payload")
+    parser.add_argument("--size", type=int, default=20, help="products on the listing page")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=5)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,52 @@
+"""
+Throughput benchmark for the SMS queue.
+
+Pushes `--messages` verification codes through an SmsQueue backed by the fake provider,
+which takes `--latency` seconds per message, and prints messages/second as
+JSON. Compare `--workers 1 --batch-size 1` (one message at a time, like the
+old synchronous send) with the defaults:
+
+    python -m benchmarks.sms --messages 500 --latency 0.05 --workers 8
+"""
+import argparse
+import json
+import time
+from external_services.sms_service import FakeProvider, SmsQueue
+
+
+def run(messages: int, workers: int, batch_size: int, latency: float, timeout: float = 600) -> dict:
+    provider = FakeProvider(latency=latency)
+    sms_queue = SmsQueue(provider, workers=workers, maxsize=messages, batch_size=batch_size)
+    sms_queue.start()
+    started = time.perf_counter()
+    for index in range(messages):
+        sms_queue.send_code(f"0912{index:07d}", "12345")
+    enqueued = time.perf_counter() - started
+    while provider.sent < messages and time.perf_counter() - started < timeout:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+    sms_queue.stop()
+    return {
+        "messages": messages,
+        "workers": workers,
+        "batch_size": batch_size,
+        "latency": latency,
+        "sent": provider.sent,
+        "enqueue_seconds": round(enqueued, 4),
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(provider.sent / elapsed, 1),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake provider seconds per message")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(json.dumps(run(args.messages, args.workers, args.batch_size, args.latency), indent=2))
@@ -0,0 +1,94 @@
+"""
+Cross-worker invalidation for the tagged in-process caches.
+
+Caches register themselves (anything with `invalidate_tags`, optionally
+`clear`); `invalidate` drops tags from every registered cache in this worker,
+and the tags are sent with NOTIFY on `cache_invalidated` so every worker's
+pg_listener drops them too:
+
+* `publish(db, *tags)` inside a transaction: other workers hear about it only
+  if the transaction commits (reservations, release batches)
+* `broadcast(*tags)` after a commit, on a connection of its own
+
+After the listener reconnects, notifications may have been missed and the
+registered caches are cleared. On databases other than Postgres invalidations
+stay local and the cache TTLs bound staleness elsewhere.
+"""
+import logging
+from typing import Iterable, List
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from core.database import engine
+from core.pg_listener import pg_listener
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = "cache_invalidated"
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7000
+
+
+class CacheBus:
+
+    def __init__(self, bind, listener):
+        self.bind = bind
+        self._caches: List = []
+        listener.subscribe(CACHE_CHANNEL, self._on_message)
+
+    def register(self, cache):
+        self._caches.append(cache)
+        return cache
+
+    def invalidate(self, *tags: str):
+        for cache in self._caches:
+            cache.invalidate_tags(*tags)
+
+    def publish(self, db: Session, *tags: str):
+        """Invalidate here now and in every worker once `db`'s transaction commits."""
+        if not tags:
+            return
+        self.invalidate(*tags)
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(self._notify_statement(tags))
+
+    def broadcast(self, *tags: str):
+        """Invalidate here and in every worker, for changes that are already committed."""
+        if not tags:
+            return
+        self.invalidate(*tags)
+        if self.bind.dialect.name != "postgresql":
+            return
+        try:
+            with self.bind.begin() as connection:
+                connection.execute(self._notify_statement(tags))
+        except Exception:
+            # the change is committed; other workers catch up when their TTLs run out
+            logger.exception("cache invalidation broadcast failed")
+
+    def _notify_statement(self, tags: Iterable[str]):
+        return select(*[func.pg_notify(CACHE_CHANNEL, payload) for payload in self._payloads(tags)])
+
+    @staticmethod
+    def _payloads(tags: Iterable[str]) -> List[str]:
+        payloads, current, size = [], [], 0
+        for tag in sorted(set(tags)):
+            if current and size + len(tag) > MAX_PAYLOAD:
+                payloads.append(",".join(current))
+                current, size = [], 0
+            current.append(tag)
+            size += len(tag) + 1
+        if current:
+            payloads.append(",".join(current))
+        return payloads
+
+    def _on_message(self, payload):
+        if payload is None:
+            for cache in self._caches:
+                clear = getattr(cache, "clear", None)
+                if clear is not None:
+                    clear()
+            return
+        self.invalidate(*payload.split(","))
+
+
+cache_bus = CacheBus(engine, pg_listener)
@@ -0,0 +1,86 @@
+"""
+Circuit breaker for calls to external services.
+
+After `failure_threshold` consecutive failures the circuit opens and calls fail
+fast with CircuitOpenError instead of waiting on a service that is down. After
+`reset_timeout` seconds one trial call is let through (half open): success
+closes the circuit, failure opens it for another `reset_timeout`. A trial that
+never reports back (cancelled, or failed in a way the caller did not record)
+is given up after `reset_timeout` and the next call becomes the trial.
+
+    breaker = CircuitBreaker("zarinpal", failure_threshold=5, reset_timeout=30)
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+    ... breaker.record_success() / breaker.record_failure()
+
+Breaker states are exported at /metrics (0 closed, 1 half open, 2 open).
+"""
+import threading
+import time
+from typing import Dict
+from core.metrics import registry
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers: Dict[str, "CircuitBreaker"] = {}
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, name: str):
+        super().__init__(f"circuit {name} is open")
+        self.name = name
+
+
+class CircuitBreaker:
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_at = 0.0
+        self._state = CLOSED
+        self._lock = threading.Lock()
+        _breakers[name] = self
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if (
+                self._state == OPEN and now - self._opened_at >= self.reset_timeout
+                or self._state == HALF_OPEN and now - self._trial_at >= self.reset_timeout
+            ):
+                # let a single trial call through
+                self._state = HALF_OPEN
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+registry.gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state (0 closed, 1 half open, 2 open)",
+    ["name"],
+    callback=lambda: {(name,): STATE_VALUES[breaker.state] for name, breaker in _breakers.items()},
+)
@@ -0,0 +1,89 @@
+"""
+Conditional GET support (ETag / Last-Modified, RFC 9110 section 13).
+
+Endpoints compute a cheap `Version` of the resource from ids, counts and
+`updated_at` stamps before building the response; when the client already holds
+that version they answer 304 without loading or serializing the resource.
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+from fastapi import Response
+from starlette import status
+
+# clients and CDNs may store the response but must revalidate it before reuse
+CACHE_CONTROL = "no-cache"
+
+
+def latest(*stamps: Optional[datetime]) -> Optional[datetime]:
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+@dataclass(frozen=True)
+class Version:
+    etag: str
+    last_modified: Optional[datetime]
+
+    @classmethod
+    def of(cls, *parts) -> "Version":
+        """Version identified by `parts`; the newest datetime among them is the Last-Modified."""
+        raw = "|".join(
+            "" if part is None else part.isoformat() if isinstance(part, datetime) else str(part)
+            for part in parts
+        )
+        digest = hashlib.sha1(raw.encode()).hexdigest()[:20]
+        return cls(etag=f'W/"{digest}"', last_modified=latest(*[part for part in parts if isinstance(part, datetime)]))
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(_utc(self.last_modified), usegmt=True)
+        return headers
+
+
+def is_not_modified(request_headers: Mapping[str, str], etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """Whether the client's If-None-Match / If-Modified-Since already match the current version."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+        return "*" in candidates or _opaque(etag) in {_opaque(candidate) for candidate in candidates}
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have second precision
+    return _utc(last_modified).replace(microsecond=0) <= since
+
+
+def not_modified(version: Version) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=version.headers())
+
+
+def parse_http_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _opaque(etag: str) -> str:
+    # weak comparison: W/"x" and "x" match
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _utc(stamp: datetime) -> datetime:
+    # naive stamps are written with datetime.now(), i.e. server local time
+    return stamp.astimezone(timezone.utc)
@@ -6,9 +6,62 @@ load_dotenv()
 
 class Settings(BaseSettings):
     database_url: str = os.getenv("DATABASE_URL")
+    async_database_url: str | None = os.getenv("ASYNC_DATABASE_URL")
+    database_replica_urls: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    read_your_writes_seconds: int = os.getenv("READ_YOUR_WRITES_SECONDS", 5)
+    db_pool_size: int = os.getenv("DB_POOL_SIZE", 5)
+    db_max_overflow: int = os.getenv("DB_MAX_OVERFLOW", 10)
+    db_pool_timeout: float = os.getenv("DB_POOL_TIMEOUT", 30)
+    db_pool_recycle: int = os.getenv("DB_POOL_RECYCLE", -1)
+    db_pool_pre_ping: bool = os.getenv("DB_POOL_PRE_PING", False)
+    db_statement_timeout_ms: int = os.getenv("DB_STATEMENT_TIMEOUT_MS", 0)
+    db_prepared_statement_cache_size: int = os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 100)
     secret_key: str = os.getenv("SECRET_KEY")
     algorithm: str = os.getenv("ALGORITHM")
     debug: bool = os.getenv("DEBUG")
     access_token_expire_minutes: int = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
+    bcrypt_rounds: int = os.getenv("BCRYPT_ROUNDS", 12)
+    password_hash_workers: int = os.getenv("PASSWORD_HASH_WORKERS", 2)
+    facet_index_ttl: int = os.getenv("FACET_INDEX_TTL", 300)
+    product_detail_cache_ttl: int = os.getenv("PRODUCT_DETAIL_CACHE_TTL", 300)
+    product_detail_cache_size: int = os.getenv("PRODUCT_DETAIL_CACHE_SIZE", 2048)
+    settings_cache_ttl: int = os.getenv("SETTINGS_CACHE_TTL", 60)
+    response_cache_url: str = os.getenv("RESPONSE_CACHE_URL", "")
+    response_cache_size: int = os.getenv("RESPONSE_CACHE_SIZE", 4096)
+    cart_snapshot_ttl: int = os.getenv("CART_SNAPSHOT_TTL", 60)
+    cart_snapshot_cache_size: int = os.getenv("CART_SNAPSHOT_CACHE_SIZE", 10000)
+    kv_store_url: str = os.getenv("KV_STORE_URL", "")
+    kv_store_size: int = os.getenv("KV_STORE_SIZE", 100000)
+    guest_cart_ttl: int = os.getenv("GUEST_CART_TTL", 7 * 24 * 3600)
+    request_profiling: bool = os.getenv("REQUEST_PROFILING", True)
+    server_timing: bool = os.getenv("SERVER_TIMING", True)
+    n_plus_one_threshold: int = os.getenv("N_PLUS_ONE_THRESHOLD", 10)
+    metrics_token: str = os.getenv("METRICS_TOKEN", "")
+    job_runner: bool = os.getenv("JOB_RUNNER", True)
+    job_poll_interval: float = os.getenv("JOB_POLL_INTERVAL", 5)
+    pending_order_ttl: int = os.getenv("PENDING_ORDER_TTL", 3600)
+    zarinpal_url: str = os.getenv("ZARINPAL_URL", "https://sandbox.zarinpal.com/pg/")
+    zarinpal_start_pay_url: str = os.getenv("ZARINPAL_START_PAY_URL", "https://sandbox.zarinpal.com/pg/StartPay/")
+    zarinpal_merchant_id: str = os.getenv("ZARINPAL_MERCHANT_ID", "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx")
+    payment_callback_url: str = os.getenv("PAYMENT_CALLBACK_URL", "http://127.0.0.1:4200/verify")
+    payment_connect_timeout: float = os.getenv("PAYMENT_CONNECT_TIMEOUT", 3)
+    payment_read_timeout: float = os.getenv("PAYMENT_READ_TIMEOUT", 10)
+    payment_max_connections: int = os.getenv("PAYMENT_MAX_CONNECTIONS", 20)
+    payment_verify_attempts: int = os.getenv("PAYMENT_VERIFY_ATTEMPTS", 3)
+    payment_circuit_failures: int = os.getenv("PAYMENT_CIRCUIT_FAILURES", 5)
+    payment_circuit_reset: float = os.getenv("PAYMENT_CIRCUIT_RESET", 30)
+    sms_provider: str = os.getenv("SMS_PROVIDER", "kavenegar")
+    kavenegar_api_key: str = os.getenv("KAVENEGAR_API_KEY", "")
+    sms_workers: int = os.getenv("SMS_WORKERS", 4)
+    sms_queue_size: int = os.getenv("SMS_QUEUE_SIZE", 10000)
+    sms_batch_size: int = os.getenv("SMS_BATCH_SIZE", 20)
+    sms_max_attempts: int = os.getenv("SMS_MAX_ATTEMPTS", 3)
+    fake_sms_latency: float = os.getenv("FAKE_SMS_LATENCY", 0.2)
+    otp_store: str = os.getenv("OTP_STORE", "kv")
+    otp_ttl: int = os.getenv("OTP_TTL", 600)
+    otp_max_attempts: int = os.getenv("OTP_MAX_ATTEMPTS", 5)
+    otp_resend_interval: int = os.getenv("OTP_RESEND_INTERVAL", 60)
+    otp_phone_hourly_limit: int = os.getenv("OTP_PHONE_HOURLY_LIMIT", 5)
+    otp_ip_hourly_limit: int = os.getenv("OTP_IP_HOURLY_LIMIT", 30)
 
 settings = Settings()
\ No newline at end of file
@@ -1,14 +1,206 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import itertools
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from core.config import settings
+from core.kv_store import kv_store
+from core.metrics import registry
+from core.security import token_user_id
 
-engine = create_engine(settings.database_url)
+READ_YOUR_WRITES_COOKIE = "bz_rw_until"
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+pool_wait_seconds = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["pool"],
+)
+pool_timeouts = registry.counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after pool_timeout",
+    ["pool"],
+)
+
+# name -> engine, read by the pool gauges on every scrape
+_engines = {}
+
+def async_database_url(url: str) -> str:
+    """Same database as `url`, addressed through its async driver."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+def _instrumented_pool(base, name: str):
+    """Pool class that records how long each checkout waited for a connection."""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return base._do_get(self)
+        except exc.TimeoutError:
+            pool_timeouts.inc(pool=name)
+            raise
+        finally:
+            pool_wait_seconds.observe(time.perf_counter() - started, pool=name)
+    return type(f"Instrumented{base.__name__}", (base,), {"_do_get": _do_get})
+
+def _engine_options(url: str, name: str, is_async: bool):
+    url = make_url(url)
+    options = {
+        "poolclass": _instrumented_pool(AsyncAdaptedQueuePool if is_async else QueuePool, name),
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if url.get_backend_name() != "postgresql":
+        return url, options
+
+    connect_args = {}
+    if is_async:
+        # asyncpg prepares statements server side; the dialect keeps a per-connection LRU of them
+        url = url.update_query_dict({"prepared_statement_cache_size": str(settings.db_prepared_statement_cache_size)})
+        if settings.db_statement_timeout_ms:
+            connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+    elif settings.db_statement_timeout_ms:
+        connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    if connect_args:
+        options["connect_args"] = connect_args
+    return url, options
+
+def build_engine(url: str, name: str):
+    url, options = _engine_options(url, name, is_async=False)
+    _engines[name] = created = create_engine(url, **options)
+    return created
+
+def build_async_engine(url: str, name: str):
+    url, options = _engine_options(url, name, is_async=True)
+    created = create_async_engine(url, **options)
+    _engines[name] = created.sync_engine
+    return created
+
+def _pool_stats(stat):
+    def collect():
+        values = {}
+        for name, pool_engine in _engines.items():
+            pool = pool_engine.pool
+            if isinstance(pool, QueuePool):
+                values[(name,)] = stat(pool)
+        return values
+    return collect
+
+def _saturation(pool) -> float:
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    return round(pool.checkedout() / capacity, 4) if capacity else 0
+
+registry.gauge("db_pool_size", "Configured pool size", ["pool"], callback=_pool_stats(lambda pool: pool.size()))
+registry.gauge("db_pool_checked_out", "Connections currently checked out", ["pool"], callback=_pool_stats(lambda pool: pool.checkedout()))
+registry.gauge("db_pool_overflow", "Overflow connections currently open", ["pool"], callback=_pool_stats(lambda pool: max(pool.overflow(), 0)))
+registry.gauge("db_pool_saturation", "Checked out connections / (pool_size + max_overflow)", ["pool"], callback=_pool_stats(_saturation))
+
+engine = build_engine(settings.database_url, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = build_async_engine(settings.async_database_url or async_database_url(settings.database_url), "primary_async")
+# objects are serialized after the session work is done, so they must not expire on commit
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Read replicas for catalog and listing traffic; without any, reads use the primary
+replica_urls = [url.strip() for url in settings.database_replica_urls.split(",") if url.strip()]
+replica_engines = [build_engine(url, f"replica_{index}") for index, url in enumerate(replica_urls)]
+async_replica_engines = [
+    build_async_engine(async_database_url(url), f"replica_{index}_async") for index, url in enumerate(replica_urls)
+]
+_replica_counter = itertools.count()
+
+@event.listens_for(Session, "after_commit")
+def _mark_write(session: Session):
+    session.info["wrote"] = True
+
+def _record_write(request: Request | None, db):
+    if request is not None and db.info.get("wrote"):
+        request.state.db_wrote = True
+
+def _read_your_writes_key(user_id: str) -> str:
+    return f"rw:{user_id}"
+
+def _use_primary(request: Request | None) -> bool:
+    """
+    Requests inside a client's read-your-writes window keep reading from the primary.
+
+    Authenticated clients are tracked by user id in the key-value store, so the
+    window holds for bearer-token clients and across workers; anonymous clients
+    carry it in a cookie.
+    """
+    if request is None:
+        return False
+    user_id = token_user_id(request.headers.get("authorization"))
+    if user_id is not None:
+        return kv_store.get(_read_your_writes_key(user_id)) is not None
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def _next_replica(engines: list):
+    return engines[next(_replica_counter) % len(engines)]
+
+async def read_your_writes(request: Request, call_next):
+    """
+    Middleware: after a request that committed on the primary, pin the client to
+    the primary for `read_your_writes_seconds` so it sees its own changes even
+    while replicas lag behind.
+    """
+    response = await call_next(request)
+    if replica_urls and getattr(request.state, "db_wrote", False):
+        user_id = token_user_id(request.headers.get("authorization"))
+        if user_id is not None:
+            await run_in_threadpool(kv_store.set, _read_your_writes_key(user_id), 1, settings.read_your_writes_seconds)
+        else:
+            until = time.time() + settings.read_your_writes_seconds
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, str(until), max_age=settings.read_your_writes_seconds, httponly=True)
+    return response
+
 # Dependency
-def get_db():
+def get_db(request: Request = None):
     db = SessionLocal()
     try:
         yield db
+        _record_write(request, db)
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Async dependency
+async def get_async_db(request: Request = None):
+    async with AsyncSessionLocal() as db:
+        yield db
+        _record_write(request, db)
+
+# Read-only dependencies: catalog and listing queries go to a replica
+def get_read_db(request: Request = None):
+    if not replica_engines or _use_primary(request):
+        yield from get_db(request)
+        return
+    db = SessionLocal(bind=_next_replica(replica_engines))
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request = None):
+    # the store lookup may go over the network, so it stays off the event loop
+    if not async_replica_engines or await run_in_threadpool(_use_primary, request):
+        async with AsyncSessionLocal() as db:
+            yield db
+            _record_write(request, db)
+        return
+    async with AsyncSessionLocal(bind=_next_replica(async_replica_engines)) as db:
+        yield db
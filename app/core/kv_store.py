@@ -0,0 +1,128 @@
+"""
+Key-value store with per-key TTL for short-lived state that should not be
+written to Postgres (guest carts, verification codes, ...). Values are JSON
+documents. Besides get/set, the store has the atomic operations counters and
+one-time values need: `incr` (counter expiring `ttl` seconds after its first
+increment, read back with `count`), `add` (set only if missing) and `pop_if`
+(delete only if the value matches).
+
+Without KV_STORE_URL the store lives in the worker's memory (LRU bounded by
+KV_STORE_SIZE), so with several workers a client may not find its state on the
+next request; point KV_STORE_URL at a Redis-compatible server to share it.
+"""
+import json
+import threading
+import time
+from typing import Any, Optional
+from core.cache import TTLCache
+from core.config import settings
+
+INCR_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end
+return count
+"""
+POP_IF_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class LocalStore:
+
+    def __init__(self, maxsize: int):
+        self.cache = TTLCache(maxsize=maxsize)
+        # serializes the read-modify-write operations below
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.cache.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: int):
+        # stored encoded so callers never share (and mutate) the cached object
+        with self._lock:
+            self.cache.set(key, json.dumps(value), ttl=ttl)
+
+    def pop(self, key: str) -> Optional[Any]:
+        raw = self.cache.pop(key)
+        return None if raw is None else json.loads(raw)
+
+    def delete(self, key: str):
+        with self._lock:
+            self.cache.delete(key)
+
+    def incr(self, key: str, ttl: int) -> int:
+        with self._lock:
+            entry = self.cache.get(key)
+            # counters are only read through incr and count; the window is fixed by the
+            # first increment, so later ones keep its expiry
+            count, expires_at = entry if entry else (0, time.monotonic() + ttl)
+            count += 1
+            self.cache.set(key, (count, expires_at), ttl=expires_at - time.monotonic())
+            return count
+
+    def count(self, key: str) -> int:
+        entry = self.cache.get(key)
+        return entry[0] if entry else 0
+
+    def add(self, key: str, value: Any, ttl: int) -> bool:
+        with self._lock:
+            if self.cache.get(key) is not None:
+                return False
+            self.cache.set(key, json.dumps(value), ttl=ttl)
+            return True
+
+    def pop_if(self, key: str, value: Any) -> bool:
+        with self._lock:
+            if self.cache.get(key) != json.dumps(value):
+                return False
+            self.cache.delete(key)
+            return True
+
+
+class RedisStore:
+
+    def __init__(self, url: str, prefix: str = "kv:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.prefix = prefix
+        self._incr = self.client.register_script(INCR_SCRIPT)
+        self._pop_if = self.client.register_script(POP_IF_SCRIPT)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: int):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def pop(self, key: str) -> Optional[Any]:
+        raw = self.client.getdel(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str, ttl: int) -> int:
+        return int(self._incr(keys=[self.prefix + key], args=[ttl]))
+
+    def count(self, key: str) -> int:
+        raw = self.client.get(self.prefix + key)
+        return int(raw) if raw is not None else 0
+
+    def add(self, key: str, value: Any, ttl: int) -> bool:
+        return bool(self.client.set(self.prefix + key, json.dumps(value), ex=ttl, nx=True))
+
+    def pop_if(self, key: str, value: Any) -> bool:
+        return bool(self._pop_if(keys=[self.prefix + key], args=[json.dumps(value)]))
+
+
+def _build_store():
+    if settings.kv_store_url:
+        return RedisStore(settings.kv_store_url)
+    return LocalStore(settings.kv_store_size)
+
+
+kv_store = _build_store()
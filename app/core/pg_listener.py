@@ -0,0 +1,93 @@
+import logging
+import select
+import threading
+from typing import Callable, Dict, List, Optional
+from core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# callback(payload); payload is None after a reconnect, when notifications may have been missed
+Callback = Callable[[Optional[str]], None]
+
+
+class PgListener:
+    """
+    Background thread that LISTENs on Postgres channels and dispatches NOTIFY payloads.
+
+    Used for cross-worker cache invalidation: a worker that changes data runs
+    `pg_notify(channel, payload)` in its transaction and every worker (itself
+    included) receives it once the transaction commits. The listener keeps its
+    own connection outside the pool. On databases other than Postgres it is a no-op.
+    """
+
+    def __init__(self, bind, poll_interval: float = 5.0, retry_interval: float = 5.0):
+        self.bind = bind
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._callbacks: Dict[str, List[Callback]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.bind.dialect.name == "postgresql"
+
+    def subscribe(self, channel: str, callback: Callback):
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval + 1)
+
+    def _connect(self):
+        cargs, cparams = self.bind.dialect.create_connect_args(self.bind.url)
+        connection = self.bind.dialect.dbapi.connect(*cargs, **cparams)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            for channel in self._callbacks:
+                cursor.execute(f'LISTEN "{channel}"')
+        return connection
+
+    def _dispatch(self, channel: str, payload: Optional[str]):
+        for callback in self._callbacks.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("pg listener callback failed for channel %s", channel)
+
+    def _run(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                # anything could have changed while we were not listening
+                for channel in self._callbacks:
+                    self._dispatch(channel, None)
+                while not self._stop.is_set():
+                    ready, _, _ = select.select([connection], [], [], self.poll_interval)
+                    if not ready:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception:
+                logger.exception("pg listener connection lost, retrying in %ss", self.retry_interval)
+                self._stop.wait(self.retry_interval)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+pg_listener = PgListener(engine)
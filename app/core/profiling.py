@@ -0,0 +1,203 @@
+"""
+Per-request timing and SQL instrumentation.
+
+RequestProfilerMiddleware (the outermost middleware) opens a RequestProfile for
+every HTTP request and SQLAlchemy cursor events on every engine add each
+statement's time and row count to it. Statements are attributed to the
+innermost function under crud/ or services/ on the stack, e.g.
+`crud.product.ProductService.get_info`; statements issued directly on an async
+session run in a separate greenlet and are reported as "-".
+
+For every request:
+
+* the response carries `Server-Timing: app;dur=..., db;dur=...;desc="N queries"`
+  (time until the response headers; set SERVER_TIMING=false to leave it out)
+* /metrics gets request time, DB time and statement count per route, and
+  statement time and rows per crud method (also for work outside requests)
+* a statement executed N_PLUS_ONE_THRESHOLD times or more within one request is
+  logged as a probable N+1 query, with the route and the crud method issuing it
+"""
+import logging
+import os
+import sys
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from core.config import settings
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Request wall time",
+    ["method", "route", "status"],
+)
+request_db_duration = registry.histogram(
+    "http_request_db_seconds",
+    "Time spent executing SQL statements per request",
+    ["route"],
+)
+request_queries = registry.histogram(
+    "http_request_db_queries",
+    "SQL statements executed per request",
+    ["route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+query_duration = registry.histogram(
+    "db_query_duration_seconds",
+    "SQL statement time by the crud method issuing it",
+    ["caller"],
+)
+query_rows = registry.counter(
+    "db_query_rows_total",
+    "Rows returned or affected by SQL statements by the crud method issuing them",
+    ["caller"],
+)
+n_plus_one = registry.counter(
+    "db_n_plus_one_total",
+    "Requests that repeated one statement N_PLUS_ONE_THRESHOLD times or more",
+    ["route", "caller"],
+)
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CALLER_DIRS = tuple(os.path.join(_APP_DIR, name) + os.sep for name in ("crud", "services"))
+
+# code object -> caller label, or None for code outside crud/ and services/
+_caller_labels: Dict[object, Optional[str]] = {}
+
+_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+@dataclass
+class RequestProfile:
+    started: float = field(default_factory=time.perf_counter)
+    db_time: float = 0.0
+    queries: int = 0
+    rows: int = 0
+    # statement -> [executions, caller of the first execution]
+    statements: Dict[str, List] = field(default_factory=dict)
+
+    def record(self, statement: str, caller: str, elapsed: float, rows: int, executemany: bool):
+        self.db_time += elapsed
+        self.queries += 1
+        self.rows += rows
+        if executemany:
+            return
+        seen = self.statements.get(statement)
+        if seen is None:
+            self.statements[statement] = [1, caller]
+        else:
+            seen[0] += 1
+
+    def repeated(self, threshold: int):
+        return [(statement, count, caller) for statement, (count, caller) in self.statements.items() if count >= threshold]
+
+    def server_timing(self) -> str:
+        elapsed = (time.perf_counter() - self.started) * 1000
+        return f'app;dur={elapsed:.1f}, db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"'
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _profile.get()
+
+
+def _label(code) -> Optional[str]:
+    filename = os.path.abspath(code.co_filename)
+    if not filename.startswith(_CALLER_DIRS):
+        return None
+    module = os.path.relpath(filename, _APP_DIR)[:-len(".py")].replace(os.sep, ".")
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _caller() -> str:
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        label = _caller_labels.get(code, False)
+        if label is False:
+            label = _caller_labels[code] = _label(code)
+        if label:
+            return label
+        frame = frame.f_back
+    return "-"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    caller = _caller()
+    # SELECT row counts are reported by psycopg2 and asyncpg; -1 where the driver doesn't know
+    rows = max(cursor.rowcount, 0)
+    query_duration.observe(elapsed, caller=caller)
+    if rows:
+        query_rows.inc(rows, caller=caller)
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(statement, caller, elapsed, rows, executemany)
+
+
+def _handle_error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engines():
+    """Listen to cursor events on every engine (sync and async); call once at startup."""
+    if event.contains(Engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+class RequestProfilerMiddleware:
+
+    def __init__(self, app, server_timing: bool = settings.server_timing, n_plus_one_threshold: int = settings.n_plus_one_threshold):
+        self.app = app
+        self.server_timing = server_timing
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = RequestProfile()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = [*message.get("headers", []), (b"server-timing", profile.server_timing().encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = _profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _profile.reset(token)
+            self._finish(scope, profile, status)
+
+    def _finish(self, scope, profile: RequestProfile, status: int):
+        # the route template, not the path, so metrics don't grow with ids and slugs
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        request_duration.observe(time.perf_counter() - profile.started, method=scope["method"], route=route, status=status)
+        request_db_duration.observe(profile.db_time, route=route)
+        request_queries.observe(profile.queries, route=route)
+        for statement, count, caller in profile.repeated(self.n_plus_one_threshold):
+            n_plus_one.inc(route=route, caller=caller)
+            logger.warning(
+                "possible N+1 query on %s %s: statement executed %d times from %s: %.200s",
+                scope["method"], route, count, caller, " ".join(statement.split()),
+            )
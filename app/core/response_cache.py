@@ -0,0 +1,353 @@
+"""
+Response cache for public, user-independent GET endpoints.
+
+Mark an endpoint with `@cache_response(...)` (below the router decorator) and the
+ResponseCacheMiddleware serves it from the cache, keyed on method, path, sorted
+query string and normalized JSON body. Entries carry tags: static ones from the
+decorator (formatted with the path params) plus any the handler adds at runtime
+with `tag_response`; CRUD services drop them through `core.cache_bus`.
+
+With `swr` set, an entry older than `ttl` but younger than `ttl + swr` is still
+served (X-Cache: STALE) while one background request refreshes it. Cached
+responses carrying an ETag or Last-Modified answer conditional requests with 304.
+
+Every invalidation moves a per-tag generation; a fill that started before one
+of its tags moved is not stored, so a slow request cannot write back a body
+that an invalidation has already dropped.
+
+The default backend is an in-process LRU per worker; invalidations reach the
+other workers through the cache bus (Postgres NOTIFY). Set RESPONSE_CACHE_URL to
+a redis:// URL to share the entries themselves between workers.
+"""
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Set, Union
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.routing import Match
+from core.cache import TTLCache
+from core.cache_bus import cache_bus
+from core.conditional import is_not_modified, parse_http_date
+from core.config import settings
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+cache_requests = registry.counter(
+    "response_cache_requests_total",
+    "Cacheable requests by result (hit, stale, miss)",
+    ["result"],
+)
+
+# validator headers kept on a 304 (RFC 9110 section 15.4.5)
+NOT_MODIFIED_HEADERS = {b"etag", b"last-modified", b"cache-control", b"vary"}
+CONDITIONAL_HEADERS = {b"if-none-match", b"if-modified-since"}
+
+# tags collected for the response currently being produced
+_response_tags: ContextVar[Optional[Set[str]]] = ContextVar("response_tags", default=None)
+
+TagSpec = Union[Iterable[str], Callable[[dict], Iterable[str]]]
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl: int
+    swr: int
+    tags: TagSpec
+
+    def static_tags(self, path_params: dict) -> Set[str]:
+        if callable(self.tags):
+            return set(self.tags(path_params))
+        return {tag.format(**path_params) for tag in self.tags}
+
+
+def cache_response(ttl: int, swr: int = 0, tags: TagSpec = ()):
+    """Mark a route endpoint as cacheable; apply it below the router decorator."""
+    def decorator(endpoint):
+        endpoint.__response_cache__ = CachePolicy(ttl=ttl, swr=swr, tags=tuple(tags) if not callable(tags) else tags)
+        return endpoint
+    return decorator
+
+
+def tag_response(*tags: str):
+    """Attach tags to the cached response being built (no-op outside a cached request)."""
+    collected = _response_tags.get()
+    if collected is not None:
+        collected.update(tags)
+
+
+class LocalBackend:
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        self.cache = TTLCache(maxsize=maxsize)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.cache.get(key)
+
+    def set(self, key: str, entry: dict, ttl: int, tags: Iterable[str]):
+        self.cache.set(key, entry, ttl=ttl, tags=tags)
+
+    def invalidate_tags(self, *tags: str):
+        self.cache.invalidate_tags(*tags)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class RedisBackend:
+    """Any server speaking the Redis protocol; errors are logged and treated as misses."""
+    blocking = True
+
+    tag_ttl = 86400
+
+    def __init__(self, url: str, prefix: str = "response_cache:"):
+        import redis
+
+        self.error = redis.RedisError
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            raw = self.client.get(self.prefix + key)
+        except self.error:
+            logger.warning("response cache get failed", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        entry["body"] = base64.b64decode(entry["body"])
+        entry["headers"] = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in entry["headers"]]
+        return entry
+
+    def set(self, key: str, entry: dict, ttl: int, tags: Iterable[str]):
+        payload = json.dumps({
+            **entry,
+            "body": base64.b64encode(entry["body"]).decode(),
+            "headers": [(name.decode("latin-1"), value.decode("latin-1")) for name, value in entry["headers"]],
+        })
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(self.prefix + key, payload, ex=ttl)
+            for tag in tags:
+                pipe.sadd(f"{self.prefix}tag:{tag}", key)
+                # tag sets outlive their entries; deleting a key that already expired is harmless
+                pipe.expire(f"{self.prefix}tag:{tag}", max(ttl, self.tag_ttl))
+            pipe.execute()
+        except self.error:
+            logger.warning("response cache set failed", exc_info=True)
+
+    def invalidate_tags(self, *tags: str):
+        try:
+            for tag in tags:
+                tag_key = f"{self.prefix}tag:{tag}"
+                keys = [self.prefix + key.decode() for key in self.client.smembers(tag_key)]
+                self.client.delete(tag_key, *keys)
+        except self.error:
+            logger.warning("response cache invalidation failed", exc_info=True)
+
+
+class ResponseCache:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._revalidating: Set[str] = set()
+        # the event loop keeps only weak references to tasks; these are held until done
+        self._tasks: Set[asyncio.Future] = set()
+        self._clock = itertools.count(1)
+        self._generations: Dict[str, int] = {}
+        self._cleared = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.backend.get, key)
+        return self.backend.get(key)
+
+    async def set(self, key: str, entry: dict, ttl: int, tags: Iterable[str], generation: int = 0) -> bool:
+        """Store `entry` unless one of its tags was invalidated after `generation`."""
+        tags = set(tags)
+        if generation and self.moved(tags, generation):
+            return False
+        if self.backend.blocking:
+            await run_in_threadpool(self.backend.set, key, entry, ttl, tags)
+            if generation and self.moved(tags, generation):
+                # invalidated while the write was in flight
+                await run_in_threadpool(self.backend.invalidate_tags, *tags)
+                return False
+        else:
+            self.backend.set(key, entry, ttl, tags)
+        return True
+
+    def generation(self) -> int:
+        """Stamp taken before a fill; compare it with `moved` before storing."""
+        return next(self._clock)
+
+    def moved(self, tags: Iterable[str], generation: int) -> bool:
+        if self._cleared > generation:
+            return True
+        return any(self._generations.get(tag, 0) > generation for tag in tags)
+
+    def invalidate_tags(self, *tags: str):
+        generation = next(self._clock)
+        for tag in tags:
+            self._generations[tag] = generation
+        if self.backend.blocking and _on_event_loop():
+            # a shared backend is a network round trip; keep it off the event loop
+            self._track(asyncio.get_running_loop().run_in_executor(None, self._invalidate_backend, tags))
+        else:
+            self._invalidate_backend(tags)
+
+    def _invalidate_backend(self, tags):
+        self.backend.invalidate_tags(*tags)
+
+    def clear(self):
+        self._cleared = next(self._clock)
+        # only the worker's own entries; a shared backend is invalidated by tag
+        clear = getattr(self.backend, "clear", None)
+        if clear is not None:
+            clear()
+
+    def _track(self, future: asyncio.Future) -> asyncio.Future:
+        self._tasks.add(future)
+        future.add_done_callback(self._tasks.discard)
+        return future
+
+    def policy_for(self, scope) -> Optional[tuple]:
+        """(policy, path params) of the route matching `scope`, if it is cacheable."""
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", ()):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                policy = getattr(getattr(route, "endpoint", None), "__response_cache__", None)
+                return (policy, child_scope.get("path_params", {})) if policy else None
+        return None
+
+    def key(self, scope, body: bytes) -> str:
+        query = "&".join(sorted(scope.get("query_string", b"").decode("latin-1").split("&")))
+        if body:
+            try:
+                body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+            except ValueError:
+                pass
+        digest = hashlib.sha256(body).hexdigest()[:32] if body else ""
+        return f"{scope['method']}:{scope['path']}?{query}#{digest}"
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _build_backend():
+    if settings.response_cache_url:
+        return RedisBackend(settings.response_cache_url)
+    return LocalBackend(settings.response_cache_size)
+
+
+response_cache = cache_bus.register(ResponseCache(_build_backend()))
+
+
+class ResponseCacheMiddleware:
+
+    def __init__(self, app, cache: ResponseCache = response_cache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        found = self.cache.policy_for(scope)
+        if found is None:
+            return await self.app(scope, receive, send)
+        policy, path_params = found
+
+        body = await self._read_body(receive)
+        key = self.cache.key(scope, body)
+        entry = await self.cache.get(key)
+        if entry is not None:
+            age = time.time() - entry["stored_at"]
+            if age <= policy.ttl:
+                cache_requests.inc(result="hit")
+                return await self._send(send, entry, "HIT", scope)
+            if age <= policy.ttl + policy.swr:
+                cache_requests.inc(result="stale")
+                if key not in self.cache._revalidating:
+                    self.cache._revalidating.add(key)
+                    self.cache._track(asyncio.create_task(self._revalidate(scope, body, key, policy, path_params)))
+                return await self._send(send, entry, "STALE", scope)
+
+        cache_requests.inc(result="miss")
+        entry = await self._fetch(scope, body, key, policy, path_params)
+        await self._send(send, entry, "MISS")
+
+    async def _fetch(self, scope, body: bytes, key: str, policy: CachePolicy, path_params: dict) -> dict:
+        """Run the request through the app, store a cacheable response and return it."""
+        messages = []
+
+        async def replay():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message):
+            messages.append(message)
+
+        generation = self.cache.generation()
+        tags = policy.static_tags(path_params)
+        token = _response_tags.set(tags)
+        try:
+            await self.app(scope, replay, capture)
+        finally:
+            _response_tags.reset(token)
+
+        start = next(message for message in messages if message["type"] == "http.response.start")
+        entry = {
+            "status": start["status"],
+            "headers": [(name, value) for name, value in start.get("headers", []) if name.lower() != b"x-cache"],
+            "body": b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body"),
+            "stored_at": time.time(),
+        }
+        if entry["status"] == 200 and not any(name.lower() == b"set-cookie" for name, _ in entry["headers"]):
+            await self.cache.set(key, entry, policy.ttl + policy.swr, tags, generation)
+        return entry
+
+    async def _revalidate(self, scope, body: bytes, key: str, policy: CachePolicy, path_params: dict):
+        # without the client's validators, so the app answers with a full (storable) response
+        headers = [(name, value) for name, value in scope["headers"] if name.lower() not in CONDITIONAL_HEADERS]
+        try:
+            await self._fetch({**scope, "headers": headers}, body, key, policy, path_params)
+        except Exception:
+            logger.exception("response cache revalidation failed for %s", key)
+        finally:
+            self.cache._revalidating.discard(key)
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _send(self, send, entry: dict, state: str, scope=None):
+        status, headers, body = entry["status"], entry["headers"], entry["body"]
+        if scope is not None and status == 200:
+            stored = Headers(raw=headers)
+            if is_not_modified(Headers(scope=scope), stored.get("etag"), parse_http_date(stored.get("last-modified"))):
+                status, body = 304, b""
+                headers = [(name, value) for name, value in headers if name.lower() in NOT_MODIFIED_HEADERS]
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [*headers, (b"x-cache", state.encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
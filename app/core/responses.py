@@ -0,0 +1,29 @@
+"""
+Fast JSON response path for hot read endpoints.
+
+For a route returning `Result[...]`, FastAPI dumps the returned model to Python
+objects, validates that dump again against `response_model`, serializes it a
+second time and finally encodes it with the JSON encoder. `ResultSerializer`
+builds the pydantic-core validator/serializer for the envelope once, validates
+the payload a single time (`from_attributes`, so ORM objects are read directly,
+and model instances are passed through without re-validation) and writes the
+JSON bytes in Rust. Routes keep `response_model` for the OpenAPI schema only.
+
+Everything else uses orjson through the app's default ORJSONResponse.
+"""
+from typing import Any, Dict, Optional
+from fastapi import Response
+from pydantic import TypeAdapter
+from starlette import status
+
+
+class ResultSerializer:
+
+    def __init__(self, response_model: Any):
+        self.adapter = TypeAdapter(response_model)
+
+    def dump(self, **content) -> bytes:
+        return self.adapter.dump_json(self.adapter.validate_python(content, from_attributes=True))
+
+    def response(self, status_code: int = status.HTTP_200_OK, headers: Optional[Dict[str, str]] = None, **content) -> Response:
+        return Response(self.dump(**content), status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,46 @@
+import re
+from typing import List, Optional
+
+# Arabic code points typed by Arabic keyboards (and found in imported data) mapped to
+# their Persian forms, Eastern Arabic and Persian digits to ASCII, ZWNJ to a word break
+_CHAR_MAP = str.maketrans({
+    "\u064a": "\u06cc",  # ي -> ی
+    "\u0649": "\u06cc",  # ى -> ی
+    "\u0643": "\u06a9",  # ك -> ک
+    "\u0629": "\u0647",  # ة -> ه
+    "\u0623": "\u0627",  # أ -> ا
+    "\u0625": "\u0627",  # إ -> ا
+    "\u0671": "\u0627",  # ٱ -> ا
+    "\u200c": " ",       # ZWNJ
+    "\u200d": "",        # ZWJ
+    "\u0640": "",        # tatweel
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+})
+# harakat, tanwin and superscript alef
+_DIACRITICS = re.compile("[\u064b-\u065f\u0670]")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercased, Persian-normalized text with punctuation folded into single spaces."""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", text.translate(_CHAR_MAP).lower())
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def tokens(text: Optional[str]) -> List[str]:
+    return normalize(text).split()
+
+
+def prefix_tsquery(keyword: Optional[str]) -> Optional[str]:
+    """to_tsquery input matching documents that contain every keyword term as a word prefix."""
+    terms = tokens(keyword)
+    return " & ".join(f"{term}:*" for term in terms) or None
+
+
+def matches(terms: List[str], document: str) -> bool:
+    """In-memory equivalent of the prefix tsquery over a normalized document."""
+    words = document.split()
+    return all(any(word.startswith(term) for word in words) for term in terms)
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
@@ -8,14 +10,30 @@ from starlette import status
 from core.config import settings
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/token")
 
+# bcrypt costs 100ms+ of CPU per call (and releases the GIL while hashing). Every hash
+# runs on this small pool so a burst of logins cannot take every core. Request
+# handlers await averify_password/ahash_password: while a hash waits in this queue no
+# threadpool slot is held, so `def` routes keep being served. The blocking
+# verify_password/hash_password are for scripts (benchmarks.seed) only; calling them
+# from a sync route parks a request thread for the whole wait.
+password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_executor.submit(pwd_context.verify, plain_password, hashed_password).result()
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_executor.submit(pwd_context.hash, password).result()
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password for async handlers, awaited without blocking the event loop."""
+    return await asyncio.wrap_future(password_executor.submit(pwd_context.verify, plain_password, hashed_password))
+
+async def ahash_password(password: str) -> str:
+    """hash_password for async handlers, awaited without blocking the event loop."""
+    return await asyncio.wrap_future(password_executor.submit(pwd_context.hash, password))
 
 def create_access_token(user_id: int, expires_delta: Optional[timedelta] = None):
     """
@@ -32,6 +50,16 @@ def create_access_token(user_id: int, expires_delta: Optional[timedelta] = None)
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
+def token_user_id(authorization: Optional[str]) -> Optional[str]:
+    """User id (`sub`) of a valid `Authorization: Bearer` header value, or None."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("sub")
+    except JWTError:
+        return None
+
 def get_current_user(token: str = Depends(oauth2_scheme)):
     """
     Extract the current user based on the JWT token sent.
@@ -0,0 +1,73 @@
+import secrets
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from crud.cart import cart_service
+from crud.category import category_service
+from crud.product import product_service
+from schemas.cart import CartBatch
+from schemas.product import ProductConfig
+from services.facet_index import facet_index
+
+# Async variants of the hot read paths.
+#
+# Each method hands the sync service method to AsyncSession.run_sync: the ORM code
+# is shared with the sync services, but every statement goes through the async
+# driver, so a slow query only suspends its own request instead of blocking the
+# event loop. Everything the response needs must be loaded inside run_sync, lazy
+# loads after it returns are not possible.
+
+
+class AsyncProductService:
+
+    async def get_home_products(self, db: AsyncSession, product_config: ProductConfig):
+        # the first facet index build blocks; it must not run inside run_sync
+        await facet_index.aensure()
+        return await db.run_sync(product_service.get_home_products, product_config)
+
+    async def get_info(self, db: AsyncSession, product_slug: str):
+        return await db.run_sync(product_service.get_info, product_slug)
+
+    async def get_info_version(self, db: AsyncSession, product_slug: str):
+        return await db.run_sync(product_service.get_info_version, product_slug)
+
+    async def get_home_version(self, db: AsyncSession, product_config: ProductConfig):
+        return await db.run_sync(product_service.get_home_version, product_config)
+
+
+class AsyncCartService:
+
+    async def get_or_create_cart(self, db: AsyncSession, user_id: int):
+        # the priced cart is an immutable snapshot, nothing is loaded lazily afterwards
+        return await db.run_sync(cart_service.get_or_create_cart, user_id)
+
+    # the key-value store client is blocking: it is called on a worker thread, never
+    # inside run_sync, which runs on the event loop
+
+    async def get_guest_cart(self, db: AsyncSession, token: Optional[str]):
+        lines = await run_in_threadpool(cart_service.guest_lines, token) if token else None
+        return await db.run_sync(cart_service.get_guest_cart, token, lines)
+
+    async def apply_guest_batch(self, db: AsyncSession, token: Optional[str], batch: CartBatch):
+        lines = (await run_in_threadpool(cart_service.guest_lines, token) if token else None) or {}
+        token = token or secrets.token_urlsafe(24)
+        lines, cart = await db.run_sync(cart_service.apply_guest_batch, lines, batch)
+        await run_in_threadpool(cart_service.save_guest_lines, token, lines)
+        return token, cart
+
+
+class AsyncCategoryService:
+
+    async def get_all(self, db: AsyncSession, page: int, size: int):
+        return await db.run_sync(category_service.get_all, page, size)
+
+    async def get(self, db: AsyncSession, category_id: int):
+        return await db.run_sync(category_service.get, category_id)
+
+    async def get_version(self, db: AsyncSession):
+        return await db.run_sync(category_service.get_version)
+
+
+async_product_service = AsyncProductService()
+async_cart_service = AsyncCartService()
+async_category_service = AsyncCategoryService()
@@ -3,21 +3,23 @@ from typing import Optional
 from fastapi import HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from core.utils import utils
+from crud.cart import cart_service
 from crud.user import user_service
 from schemas.auth import LoginRequest, RegisterRequest
 from models.user import User
-from core.security import verify_password
-from external_services.sms_service import send_sms
+from core.security import averify_password
+from external_services.sms_service import sms_queue
 from crud.verification_code import verification_code_service as vc_service
 from core.security import create_access_token
 from starlette import status
 
 class AuthService:
     
-    def authenticate_user(self, username: str, password: str, db: Session):
-        user = db.query(User).filter(User.username == username).first()
-        if not user or not verify_password(password, user.password):
+    async def authenticate_user(self, username: str, password: str, db: Session):
+        user = await run_in_threadpool(lambda: db.query(User).filter(User.username == username).first())
+        if not user or not await averify_password(password, user.password):
             return False
         return user
     
@@ -41,26 +43,27 @@ class AuthService:
         }
         return data
         
-    def send_code(self, db: Session, phone_number: str):
-        verification_code = vc_service.create_verification_code(db=db, phone_number=phone_number)
-        response = send_sms(phone_number=phone_number, code=verification_code.code)
-        if not response:
-            raise HTTPException(status_code=500, detail="ارسال پیام با خطا مواجه شد")
-        return response
+    def send_code(self, db: Session, phone_number: str, client_ip: Optional[str] = None):
+        code = vc_service.create_verification_code(db=db, phone_number=phone_number, client_ip=client_ip)
+        # پیام در صف قرار می‌گیرد و توسط workerها ارسال می‌شود
+        sms_queue.send_code(phone_number, code)
+        return True
 
-    def login(self, db: Session, login_in: LoginRequest):
+    async def login(self, db: Session, login_in: LoginRequest, guest_cart: Optional[str] = None):
+        # کارهای دیتابیسی روی threadpool و bcrypt روی pool مخصوص خودش اجرا می‌شود؛
+        # در زمان انتظار برای hash هیچ thread درخواستی اشغال نمی‌شود
         username_type = utils.get_username_type(login_in.username)
-        user = self.verify_user_by_type(db, username=login_in.username, username_type=username_type)
+        user = await run_in_threadpool(self.verify_user_by_type, db, login_in.username, username_type)
         if not user:
             raise HTTPException(status_code=404, detail="کاربری با شماره موبایل یا ایمیل وارد شده یافت نشد")
         if login_in.hasPassword:
-            if not verify_password(login_in.password, user.password):
+            if not await averify_password(login_in.password, user.password):
                 raise HTTPException(status_code=401, detail="کلمه عبور اشتباه است")
         else:
-            verification_code = vc_service.get_valid_code(db, login_in.username, login_in.password)
-            if not verification_code:
+            if not await run_in_threadpool(vc_service.consume_code, db, login_in.username, login_in.password):
                 raise HTTPException(status_code=401, detail="کد پیدا نشد")
-            vc_service.mark_code_as_used(db, verification_code.id)
+        # move the guest cart (if any) into the user's cart
+        await run_in_threadpool(cart_service.merge_guest_cart, db, user.id, guest_cart)
         # make a jwt token and send to user
         token = create_access_token(user.id)
         data = {
@@ -70,14 +73,13 @@ class AuthService:
         }
         return data
     
-    def register(self, db: Session, register_in: RegisterRequest):
-        verification_code = vc_service.get_valid_code(db=db, phone_number=register_in.username, code=register_in.password)
-        if not verification_code:
+    def register(self, db: Session, register_in: RegisterRequest, guest_cart: Optional[str] = None):
+        # check the code and mark it as used
+        if not vc_service.consume_code(db=db, phone_number=register_in.username, code=register_in.password):
             raise HTTPException(status_code=401, detail="کد پیدا نشد")
-        # mark the code as used
-        vc_service.mark_code_as_used(db, verification_code.id)
         # create a user with given number
         user = user_service.create_quick(db, register_in.username)
+        cart_service.merge_guest_cart(db, user.id, guest_cart)
         token = create_access_token(user.id)
         data = {
             "access_token": token,
@@ -86,8 +88,8 @@ class AuthService:
         }
         return data
     
-    def panel_login(self, db: Session, login_in: OAuth2PasswordRequestForm, type: Optional[str] = None):
-        user = auth_service.authenticate_user(login_in.username, login_in.password, db)
+    async def panel_login(self, db: Session, login_in: OAuth2PasswordRequestForm, type: Optional[str] = None):
+        user = await auth_service.authenticate_user(login_in.username, login_in.password, db)
         if not user:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='اطلاعات وارد شده اشتباه است')
         token = create_access_token(user_id=user.id, expires_delta=timedelta(minutes=120))
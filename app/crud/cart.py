@@ -1,133 +1,293 @@
+import secrets
+from dataclasses import replace
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.orm import Session, selectinload, joinedload
+from core.config import settings
 from core.exceptions import CustomHTTPException
+from core.kv_store import kv_store
 from models.cart import Cart, CartItem
+from models.product import ProductVariation
+from schemas.cart import CartBatch
 from crud.product import product_service
+from services.cart_pricing import PricedCart, cart_pricing, price_line
 from starlette import status
 
+# guest carts in the key-value store: {"items": {variation id: {"quantity", "accepted_price"}}}
+GUEST_CART_PREFIX = "guest_cart:"
+GUEST_CART_MERGE_PREFIX = "guest_cart_merge:"
+
 class CartService:
-    
+
     def get_cart(self, db: Session, user_id: int) -> Cart:
-        return db.query(Cart).filter(Cart.user_id == user_id).options(joinedload(Cart.cart_items)).first()
-    
+        return db.query(Cart).filter(Cart.user_id == user_id).options(
+            selectinload(Cart.cart_items).joinedload(CartItem.variation).joinedload(ProductVariation.product)
+        ).first()
+
     def create_cart(self, db: Session, user_id: int) -> Cart:
-        new_cart = Cart(user_id=user_id, total_amount=0.0)  # Initialize total_amount to 0
+        new_cart = Cart(user_id=user_id, total_amount=0)  # Initialize total_amount to 0
         db.add(new_cart)
         db.commit()
         db.refresh(new_cart)
         return new_cart
-          
+
+    def get_or_create_cart(self, db: Session, user_id: int) -> PricedCart:
+        # سبد قیمت‌گذاری‌شده از کش یا با یک کوئری؛ در صورت نبود، سبد خالی ساخته می‌شود
+        priced = cart_pricing.price(db, user_id)
+        if priced is None:
+            cart = self.create_cart(db=db, user_id=user_id)
+            priced = cart_pricing.store(PricedCart(id=cart.id, user_id=int(user_id)))
+        return priced
+
     def delete_cart(self, db: Session, user_id: int) -> bool:
         cart = self.get_cart(db=db, user_id=user_id)
         if not cart:
             return False
         db.delete(cart)
         db.commit()
+        cart_pricing.invalidate(user_id)
         return True
-    
-    def add_cart_item(self, db: Session, current_user: int, variation_id: int) -> Cart:
-        cart = self.get_cart(db=db, user_id=current_user)
-        if variation_id in [item.variation_id for item in cart.cart_items]:
+
+    def _priced_for_update(self, db: Session, user_id: int) -> PricedCart:
+        # تغییرات سبد همیشه روی قیمت و موجودی فعلی پایگاه داده انجام می‌شود، نه روی کش
+        priced = cart_pricing.price(db, user_id, fresh=True)
+        if priced is None:
+            cart = Cart(user_id=user_id, total_amount=0)
+            db.add(cart)
+            db.flush()
+            priced = PricedCart(id=cart.id, user_id=int(user_id))
+        return priced
+
+    def _save(self, db: Session, priced: PricedCart) -> PricedCart:
+        # جمع سبد دقیقاً برابر مجموع خطوط (Decimal) ذخیره می‌شود
+        db.execute(update(Cart).where(Cart.id == priced.id).values(total_amount=priced.total_amount))
+        db.commit()
+        return cart_pricing.store(priced)
+
+    def add_cart_item(self, db: Session, current_user: int, variation_id: int) -> PricedCart:
+        priced = self._priced_for_update(db, current_user)
+        if any(item.variation_id == variation_id for item in priced.cart_items):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='آیتم درون کارت وجود دارد')
-        total_price = product_service.get_variation_total_price(db=db, variation_id=variation_id, quantity=1)
-        cart.total_amount += total_price
-        new_item = CartItem(cart_id=cart.id, variation_id=variation_id, quantity=1, total_price=total_price)
+        variation = next(iter(product_service.get_variations_by_ids(db, [variation_id])), None)
+        if not variation:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='متغیر پیدا نشد')
+        if variation.quantity < 1:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='تعداد محصولات انتخابی بیشتر از موجودی است')
+        new_item = CartItem(cart_id=priced.id, variation_id=variation_id, quantity=1, total_price=variation.sales_price)
         db.add(new_item)
-        db.commit()
-        db.refresh(new_item)
-        return cart
+        db.flush()
+        line = price_line(new_item.id, 1, variation)
+        return self._save(db, priced.with_items([*priced.cart_items, line]))
 
-    def update_cart_item(self, db: Session, item_id: int, operation: str) -> CartItem:
-        item = db.query(CartItem).filter(CartItem.id == item_id).first()
+    def update_cart_item(self, db: Session, current_user: int, item_id: int, operation: str) -> PricedCart:
+        priced = self._priced_for_update(db, current_user)
+        item = priced.item(item_id)
         if not item:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='آیتم مورد نظر پیدا نشد')
-        variation = product_service.get_variation_by_id(db, item.variation_id)
         if operation == '+':
-            if variation.quantity > item.quantity:
-                item.quantity += 1
-                item.total_price += float(variation.sales_price)
-                item.cart.total_amount += float(variation.sales_price)
-            else:
+            if item.variation.quantity <= item.quantity:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='تعداد محصولات انتخابی بیشتر از موجودی است')
+            quantity = item.quantity + 1
         elif operation == '-':
-            if item.quantity > 1:
-                item.quantity -= 1
-                item.total_price -= float(variation.sales_price)
-                item.cart.total_amount -= float(variation.sales_price)
-            else:
+            if item.quantity <= 1:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='امکان کمتر کردن تعداد محصول وجود ندارد')
+            quantity = item.quantity - 1
         else:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='لطفا نوع عملیات را به درستی ارسال کنید')
-        db.commit()
-        db.refresh(item)
-        return item.cart
+        # تغییر تعداد، خط را با قیمت فعلی دوباره قیمت‌گذاری می‌کند
+        total_price = item.variation.sales_price * quantity
+        db.execute(update(CartItem).where(CartItem.id == item.id).values(quantity=quantity, total_price=total_price))
+        line = replace(item, quantity=quantity, total_price=total_price, accepted_price=total_price)
+        return self._save(db, priced.with_items(line if other.id == item.id else other for other in priced.cart_items))
 
-    def delete_cart_item(self, db: Session, item_id: int) -> bool:
-        item = db.query(CartItem).filter(CartItem.id == item_id).first()
-        if not item:
+    def delete_cart_item(self, db: Session, current_user: int, item_id: int) -> PricedCart:
+        priced = self._priced_for_update(db, current_user)
+        if not priced.item(item_id):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='آیتم مورد نظر پیدا نشد')
-        db.delete(item)
-        item.cart.total_amount -= item.total_price
-        db.commit()
-        return item.cart
-    
-    def delete_cart_items(self, db: Session, current_user: int):
-        cart = self.get_cart(db=db, user_id=current_user)
-        if not cart:
+        db.execute(delete(CartItem).where(CartItem.id == item_id))
+        return self._save(db, priced.with_items(item for item in priced.cart_items if item.id != item_id))
+
+    def apply_batch(self, db: Session, current_user: int, batch: CartBatch) -> PricedCart:
+        """
+        اعمال چند تغییر سبد در یک تراکنش: upsertها تعداد نهایی هر variation را تعیین می‌کنند
+        و deletes variationها را حذف می‌کند. قیمت و موجودی همه variationها با یک کوئری بررسی می‌شود
+        و در صورت هر خطا هیچ تغییری ذخیره نمی‌شود.
+        """
+        quantities = self._batch_quantities(batch)
+        priced = self._priced_for_update(db, current_user)
+        variations = self._variations(db, quantities)
+        self._check_stock(quantities, variations)
+        return self._apply(db, priced, quantities, variations, batch.deletes)
+
+    def _batch_quantities(self, batch: CartBatch) -> Dict[int, int]:
+        quantities = {}
+        for upsert in batch.upserts:
+            if upsert.variation_id in quantities or upsert.variation_id in batch.deletes:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'variation {upsert.variation_id} بیش از یک بار ارسال شده است')
+            quantities[upsert.variation_id] = upsert.quantity
+        return quantities
+
+    def _variations(self, db: Session, variation_ids: Iterable[int]) -> Dict[int, ProductVariation]:
+        variation_ids = list(variation_ids)
+        if not variation_ids:
+            return {}
+        return {variation.id: variation for variation in product_service.get_variations_by_ids(db, variation_ids)}
+
+    def _check_stock(self, quantities: Dict[int, int], variations: Dict[int, ProductVariation]):
+        errors = []
+        for variation_id, quantity in quantities.items():
+            variation = variations.get(variation_id)
+            if not variation:
+                errors.append({"variation_id": variation_id, "message": "Product Variation not found"})
+            elif variation.quantity < quantity:
+                errors.append({"variation_id": variation_id, "message": "Not enough stock", "available": variation.quantity})
+        if errors:
+            raise CustomHTTPException(status_code=status.HTTP_400_BAD_REQUEST, message='برخی از تغییرات سبد معتبر نیست', data={"errors": errors})
+
+    def _apply(self, db: Session, priced: PricedCart, quantities: Dict[int, int], variations: Dict[int, ProductVariation], deletes: Iterable[int] = ()) -> PricedCart:
+        deletes = list(deletes)
+        lines = {item.variation_id: item for item in priced.cart_items if item.variation_id not in deletes}
+        if deletes:
+            db.execute(delete(CartItem).where(CartItem.cart_id == priced.id, CartItem.variation_id.in_(deletes)))
+
+        updates = [
+            {"item_id": lines[variation_id].id, "quantity": quantity, "total_price": variations[variation_id].sales_price * quantity}
+            for variation_id, quantity in quantities.items() if variation_id in lines
+        ]
+        if updates:
+            table = CartItem.__table__
+            db.execute(
+                update(table).where(table.c.id == bindparam("item_id")).values(quantity=bindparam("quantity"), total_price=bindparam("total_price")),
+                updates,
+            )
+        item_ids = {variation_id: lines[variation_id].id for variation_id in quantities if variation_id in lines}
+        inserts = [
+            {"cart_id": priced.id, "variation_id": variation_id, "quantity": quantity, "total_price": variations[variation_id].sales_price * quantity}
+            for variation_id, quantity in quantities.items() if variation_id not in lines
+        ]
+        if inserts:
+            new_ids = db.scalars(insert(CartItem).returning(CartItem.id, sort_by_parameter_order=True), inserts).all()
+            item_ids.update(zip([row["variation_id"] for row in inserts], new_ids))
+
+        # سبد جدید در حافظه ساخته می‌شود؛ خطوط تغییرکرده با قیمت فعلی دوباره قیمت‌گذاری می‌شوند
+        for variation_id, quantity in quantities.items():
+            lines[variation_id] = price_line(item_ids[variation_id], quantity, variations[variation_id])
+        return self._save(db, priced.with_items(sorted(lines.values(), key=lambda item: item.id)))
+
+    def get_guest_cart(self, db: Session, token: Optional[str], lines: Optional[Dict[int, Tuple[int, Decimal]]]) -> Tuple[str, PricedCart]:
+        """
+        سبد مهمان از key-value store (بدون نوشتن در پایگاه داده)، قیمت‌گذاری‌شده با یک کوئری.
+        lines خروجی guest_lines است؛ برای توکن نامعتبر یا منقضی‌شده، توکن جدید با سبد خالی برگردانده می‌شود.
+        """
+        if lines is None:
+            token = secrets.token_urlsafe(24)
+            lines = {}
+        return token, cart_pricing.price_lines(db, lines)
+
+    def apply_guest_batch(self, db: Session, lines: Dict[int, Tuple[int, Decimal]], batch: CartBatch) -> Tuple[Dict[int, Tuple[int, Decimal]], PricedCart]:
+        """
+        اعمال batch روی خطوط سبد مهمان و قیمت‌گذاری آن؛ ذخیره خطوط در store با save_guest_lines بر عهده فراخواننده است.
+        """
+        quantities = self._batch_quantities(batch)
+        variations = self._variations(db, quantities)
+        self._check_stock(quantities, variations)
+        lines = dict(lines)
+        for variation_id in batch.deletes:
+            lines.pop(variation_id, None)
+        for variation_id, quantity in quantities.items():
+            lines[variation_id] = (quantity, variations[variation_id].sales_price * quantity)
+        return lines, cart_pricing.price_lines(db, lines)
+
+    def merge_guest_cart(self, db: Session, user_id: int, token: Optional[str]) -> Optional[PricedCart]:
+        """
+        انتقال سبد مهمان به سبد کاربر هنگام ورود یا ثبت‌نام، با یک commit.
+        تعداد هر variation با سبد فعلی کاربر جمع و به موجودی محدود می‌شود؛ variationهای حذف‌شده نادیده گرفته می‌شوند.
+        سبد مهمان فقط بعد از commit حذف می‌شود تا خطا در ادغام آن را از بین نبرد.
+        """
+        if not token:
+            return None
+        key = GUEST_CART_PREFIX + token
+        # دو ورود همزمان با یک سبد مهمان آن را دو بار ادغام نمی‌کنند
+        if not kv_store.add(GUEST_CART_MERGE_PREFIX + token, user_id, ttl=60):
+            return None
+        try:
+            raw = kv_store.get(key)
+            if not raw:
+                return None
+            priced = self._priced_for_update(db, user_id)
+            current = {item.variation_id: item.quantity for item in priced.cart_items}
+            guest = {int(variation_id): line["quantity"] for variation_id, line in raw["items"].items()}
+            variations = self._variations(db, guest)
+            quantities = {}
+            for variation_id, quantity in guest.items():
+                variation = variations.get(variation_id)
+                if variation:
+                    quantity = min(current.get(variation_id, 0) + quantity, variation.quantity)
+                    if quantity >= 1:
+                        quantities[variation_id] = quantity
+            merged = self._apply(db, priced, quantities, variations)
+            # اگر سبد مهمان در این فاصله تغییر کرده باشد، نسخه جدید آن باقی می‌ماند
+            kv_store.pop_if(key, raw)
+            return merged
+        finally:
+            kv_store.delete(GUEST_CART_MERGE_PREFIX + token)
+
+    def guest_lines(self, token: str) -> Optional[Dict[int, Tuple[int, Decimal]]]:
+        raw = kv_store.get(GUEST_CART_PREFIX + token)
+        if raw is None:
+            return None
+        return {
+            int(variation_id): (line["quantity"], Decimal(line["accepted_price"]))
+            for variation_id, line in raw["items"].items()
+        }
+
+    def save_guest_lines(self, token: str, lines: Dict[int, Tuple[int, Decimal]]):
+        items = {
+            str(variation_id): {"quantity": quantity, "accepted_price": str(accepted_price)}
+            for variation_id, (quantity, accepted_price) in lines.items()
+        }
+        kv_store.set(GUEST_CART_PREFIX + token, {"items": items}, ttl=settings.guest_cart_ttl)
+
+    def delete_cart_items(self, db: Session, current_user: int) -> PricedCart:
+        priced = cart_pricing.price(db, current_user, fresh=True)
+        if not priced:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='سبد خریدی برای این کاربر پیدا نشد')
-        # cart.created_at = cart.created_at.isoformat()
-        for item in cart.cart_items:
-            db.delete(item)
-        cart.total_amount = 0
-        db.commit()
-        return cart
-    
-    def validate(self, db: Session, user_id: int):
+        db.execute(delete(CartItem).where(CartItem.cart_id == priced.id))
+        return self._save(db, priced.with_items([]))
+
+    def validate(self, db: Session, user_id: int) -> PricedCart:
+
+        # قیمت و موجودی فعلی همه خطوط در یک کوئری (بدون کش)
+        cart = cart_pricing.price(db, user_id, fresh=True)
 
-        cart = self.get_cart(db, user_id)
-        
         if not cart:
             raise CustomHTTPException(status_code=404, message="Cart not found")
 
-        # Fetch all product variations in one query
-        variation_ids = [item.variation_id for item in cart.cart_items]
-        product_variations = product_service.get_variations_by_ids(db, variation_ids)
-        variation_map = {pv.id: pv for pv in product_variations}
-
         unvalidated_items = []
         for item in cart.cart_items:
-            product_variation = variation_map.get(item.variation_id)
-            if not product_variation:
+            product = item.variation.product
+            if not item.in_stock:
                 unvalidated_items.append({
-                    "product_id": None,
-                    "product_name": None,
+                    "product_id": product.id,
+                    "product_name": product.name,
                     "variation_id": item.variation_id,
-                    "message": "Product Variation not found"
-                })
-                continue
-
-            if product_variation.quantity < item.quantity:
-                unvalidated_items.append({
-                    "product_id": product_variation.product_id,
-                    "product_name": product_variation.product.name,
-                    "variation_id": product_variation.id,
                     "message": "Not enough stock"
                 })
 
-            if product_variation.sales_price != item.total_price / item.quantity:
+            if item.price_changed:
                 unvalidated_items.append({
-                    "product_id": product_variation.product_id,
-                    "product_name": product_variation.product.name,
-                    "variation_id": product_variation.id,
+                    "product_id": product.id,
+                    "product_name": product.name,
+                    "variation_id": item.variation_id,
                     "message": "Price changed"
                 })
-        
+
         if len(unvalidated_items) > 0:
             raise CustomHTTPException(status_code=400, message="Cart validation failed", data={"errors": unvalidated_items})
-        
+
         return cart
-        
-        
 
 
 # Initialize the cart service
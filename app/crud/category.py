@@ -1,11 +1,15 @@
 
 from datetime import datetime
 from fastapi import HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from starlette import status
 from models.collections import Category
+from core.conditional import Version
 from schemas.pagination import Pagination
 from schemas.category import CategoryCreate
+from services.facet_index import facet_index
+from core.cache_bus import cache_bus
 
 
 class CategoryService:
@@ -22,6 +26,11 @@ class CategoryService:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="دسته بندی مورد نظر یافت نشد!")
         return category
     
+    def get_version(self, db: Session) -> Version:
+        # نسخه همه دسته‌بندی‌ها؛ حذف با تغییر تعداد و ویرایش با updated_at دیده می‌شود
+        count, updated_at = db.query(func.count(Category.id), func.max(Category.updated_at)).one()
+        return Version.of("categories", count, updated_at)
+
     def create(self, db: Session, cat_in: CategoryCreate):
         category_item = db.query(Category).filter(Category.slug == cat_in.slug).first()
         if category_item:
@@ -36,6 +45,7 @@ class CategoryService:
         db.add(db_category)
         db.commit()
         db.refresh(db_category)
+        cache_bus.broadcast("categories")
         return db_category
     
     def update(self, db: Session, category_id: int, category_in: CategoryCreate):
@@ -49,6 +59,8 @@ class CategoryService:
         category_item.updated_at = datetime.now()
         db.commit()
         db.refresh(category_item)
+        facet_index.invalidate()
+        cache_bus.broadcast("categories", "products", f"category:{category_id}")
         return category_item
     
     def delete(self, db: Session, category_id: int):
@@ -57,6 +69,8 @@ class CategoryService:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="دسته بندی مورد نظر یافت نشد!")
         db.delete(category_item)
         db.commit()
+        facet_index.invalidate()
+        cache_bus.broadcast("categories", "products", f"category:{category_id}")
         return category_item
 
 
@@ -1,3 +1,4 @@
+import enum
 import json
 from fastapi import HTTPException
 from sqlalchemy import func
@@ -5,13 +6,22 @@ from sqlalchemy.orm import Session, joinedload
 from crud.product import product_service
 from crud.cart import cart_service
 from crud.setting import setting_service
-from models import Order, OrderItem, OrderStatus, CartItem, User
+from models import Order, OrderItem, OrderStatus, User
 from schemas.pagination import Pagination
 from schemas.order import CreateOrder
+from services.cart_pricing import PricedItem
+
+
+class FinalizeResult(enum.Enum):
+    FINALIZED = "finalized"
+    # پرداخت قبلاً ثبت و سفارش نهایی شده است (مثلاً تایید تکراری)
+    ALREADY_FINALIZED = "already_finalized"
+    # رزروها آزاد و سفارش لغو شده است؛ مبلغ پرداختی باید برگردانده شود
+    RELEASED = "released"
 
 
 class OrderService:
-    def get_all(self, db: Session, page: int, size: int):
+    def get_all(self, db: Session, page: int, size: int, cursor: bool = False, after: str = None, with_total: bool = False):
         # تعریف یک scalar subquery جهت محاسبه تعداد آیتم‌های سفارش به ازای هر Order
         items_count_subq = (
             db.query(func.count(OrderItem.id))
@@ -24,11 +34,15 @@ class OrderService:
         query = db.query(Order).options(
                   joinedload(Order.customer),
                   joinedload(Order.order_items)
-              ).order_by(Order.created_at.desc()).add_columns(items_count_subq.label('items_count'))
+              ).add_columns(items_count_subq.label('items_count'))
 
-        # صفحه‌بندی کوئری
-        paginated_query, total_items, total_pages = Pagination.paginate_query(query, page, size)
-        results = paginated_query.all()
+        # صفحه‌بندی کوئری (offset یا کرسری)
+        results, pagination = Pagination.fetch_page(
+            query,
+            [(Order.created_at, True), (Order.id, True)],
+            lambda row: (row[0].created_at, row[0].id),
+            page=page, size=size, cursor=cursor, after=after, with_total=with_total,
+        )
 
         # پردازش نتایج: هر نتیجه یک tuple شامل (Order, items_count) است.
         orders = []
@@ -46,14 +60,14 @@ class OrderService:
                 # سایر فیلدهای مورد نیاز سفارش را می‌توانید اضافه کنید
             })
 
-        pagination = Pagination(page=page, size=size, total_items=total_items, total_pages=total_pages)
         return orders, pagination
     
     def get(self, db: Session, order_id: int):
         pass
     
-    def add_order_item(self, db: Session, cart_item: CartItem, order_id: int) -> OrderItem:
-        product_item = product_service.get_by_id(db, cart_item.variation.product_id)
+    def add_order_item(self, db: Session, cart_item: PricedItem, order_id: int) -> OrderItem:
+        # variation و محصول آن در سبد قیمت‌گذاری‌شده موجود هستند
+        product_item = cart_item.variation.product
         order_item = OrderItem(
             order_id=order_id,
             product_id=product_item.id,
@@ -71,9 +85,9 @@ class OrderService:
         
         # Determine the tax amount based on the total amount of the cart if tax exist
         tax_amount = 0
-        tax = setting_service.get_value(db, 'tax')
+        tax = setting_service.get_value(db, 'tax', cast=int)
         if tax:
-            tax_amount = (int(tax) * cart.total_amount) / 100
+            tax_amount = (tax * cart.total_amount) / 100
 
         # Create a new order
         new_order = Order(
@@ -87,16 +101,26 @@ class OrderService:
             status=OrderStatus.PENDING,
         )
         db.add(new_order)
-        db.commit()
-        db.refresh(new_order)
+        db.flush()
 
-        # Reserve quantity of product_variation and add new order items to db
+        # Reserve all variations in one statement; the order and its items are
+        # committed together with the reservation or not at all
+        quantities = {}
+        for cart_item in cart.cart_items:
+            quantities[cart_item.variation_id] = quantities.get(cart_item.variation_id, 0) + cart_item.quantity
+        try:
+            product_service.reserve_quantities(db, quantities, order_id=new_order.id)
+        except HTTPException:
+            db.rollback()
+            raise
+
+        # add new order items to db
         for cart_item in cart.cart_items:
-            product_service.reserve_quantity(db, cart_item.variation_id, cart_item.quantity)
             new_order_item = self.add_order_item(db, cart_item, new_order.id)
             db.add(new_order_item)
 
         db.commit()
+        db.refresh(new_order)
         
         # clear cart
         # cart_service.delete_cart_items(db, current_user)
@@ -127,22 +151,43 @@ class OrderService:
     def delete(self, db: Session, order_id: int):
         pass
     
-    def finalize_order(self, db: Session, order_id: int):
-        # Assuming you have an Order model and a way to get the order by transaction_id
-        order = db.query(Order).filter_by(id=order_id).first()
-        
+    def finalize_order(self, db: Session, order_id: int) -> FinalizeResult:
+        """
+        نهایی کردن سفارش پرداخت‌شده: رزروهای آن نهایی و وضعیت سفارش processing می‌شود.
+
+        سفارشی که قبلاً نهایی شده تغییری نمی‌کند (ALREADY_FINALIZED). اگر سفارش لغو شده باشد یا
+        همه رزروهای آن فعال نباشند (مثلاً sweep انقضا آن‌ها را آزاد کرده و موجودی دوباره قابل فروش
+        است)، هیچ واحدی نهایی نمی‌شود، سفارش لغو می‌شود و RELEASED برمی‌گردد تا فراخواننده مبلغ
+        پرداختی را برگرداند. commit بر عهده فراخواننده است.
+        """
+        order = db.query(Order).options(joinedload(Order.order_items)).filter_by(id=order_id).first()
+
         if not order:
             raise HTTPException(status_code=404, detail="Order not found!")
+        if order.status in (OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.DELIVERED):
+            return FinalizeResult.ALREADY_FINALIZED
+        if order.status != OrderStatus.PENDING:
+            return FinalizeResult.RELEASED
 
-        # Finalize reserved products
-        for item in order.order_items:
-            variation_id = json.loads(item.product_metadata)
-            product_service.finalize_reserved_quantity(db, variation_id, item.quantity)
-            
+        expected = {}
+        for order_item in order.order_items:
+            variation_id = int(json.loads(order_item.product_metadata))
+            expected[variation_id] = expected.get(variation_id, 0) + order_item.quantity
 
-        # Update the order status to processing
-        order.status = OrderStatus.PROCESSING
-        db.add(order)  # Add the updated order back to the session
+        # رزروها و وضعیت سفارش با هم نهایی می‌شوند یا هیچ‌کدام
+        savepoint = db.begin_nested()
+        committed = product_service.commit_reservations(db, order.id)
+        processing = committed == expected and db.query(Order).filter(
+            Order.id == order.id, Order.status == OrderStatus.PENDING
+        ).update({Order.status: OrderStatus.PROCESSING}, synchronize_session=False)
+        if not processing:
+            savepoint.rollback()
+            db.query(Order).filter(Order.id == order.id, Order.status == OrderStatus.PENDING).update(
+                {Order.status: OrderStatus.CANCELED}, synchronize_session=False
+            )
+            return FinalizeResult.RELEASED
+        savepoint.commit()
+        return FinalizeResult.FINALIZED
 
     
 order_service = OrderService()
\ No newline at end of file
@@ -1,13 +1,30 @@
-from typing import List
+import json
+from dataclasses import replace
+from datetime import datetime
+from typing import Dict, List, Optional
 from fastapi import HTTPException
-from sqlalchemy import and_, or_, text, func
-from sqlalchemy.orm import Session, joinedload
-from models import File, User, Category
-from models.product import Attribute, Product, ProductAttribute, ProductType, ProductVariation, Status, VariationAttribute
+from sqlalchemy import Integer, and_, column, func, select, update, values
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from models import File, User, Category, product_categories
+from models.product import Attribute, Product, ProductAttribute, ProductSummary, ProductType, ProductVariation, Status, VariationAttribute
 from schemas.pagination import Pagination
-from schemas.product import ProductConfig, ProductCreate, ProductUpdate, AdminProductsRequest
+from schemas.product import ProductConfig, ProductCreate, ProductUpdate, AdminProductsRequest, Product as ProductSchema
+from services.facet_index import facet_index
+from services.product_search import product_search
+from services.product_summary import product_summary
+from services.stock_reservations import stock_reservations
+from core.cache import TTLCache
+from core.cache_bus import cache_bus
+from core.conditional import Version, latest
+from core.response_cache import tag_response
+from core.exceptions import CustomHTTPException
+from core.config import settings
 from starlette import status
 
+# cached product detail documents with their invalidation tags and version, keyed by slug
+product_detail_cache = cache_bus.register(TTLCache(maxsize=settings.product_detail_cache_size, ttl=settings.product_detail_cache_ttl))
+
 
 class ProductService:
     
@@ -25,7 +42,7 @@ class ProductService:
         query = db.query(Product).options(
             joinedload(Product.user).load_only(User.id, User.username),
             joinedload(Product.files),
-            joinedload(Product.variations),
+            joinedload(Product.summary).joinedload(ProductSummary.min_variation),
             joinedload(Product.categories).load_only(Category.id, Category.name, Category.slug, Category.parent_id)
         )
     
@@ -35,8 +52,9 @@ class ProductService:
         # اعمال فیلترهای داینامیک از search_params
         if product_request.search_params:
             if product_request.search_params.name:
-                query = query.filter(Product.name.ilike(f"%{product_request.search_params.name}%"))
+                query, _ = product_search.apply(query, product_request.search_params.name)
             if product_request.search_params.sku:
+                # ایندکس trigram روی sku این جستجو را بدون اسکن کامل جدول انجام می‌دهد
                 query = query.join(Product.variations).filter(ProductVariation.sku.ilike(f"%{product_request.search_params.sku}%"))
             if product_request.search_params.created_from:
                 query = query.filter(Product.created_at >= product_request.search_params.created_from)
@@ -51,42 +69,39 @@ class ProductService:
             "updated_at": Product.updated_at,
             "sales_price": None
         }
-        if product_request.order_by:
-            if product_request.order_by == "sales_price":
-                # زیرکوئری جهت بدست آوردن کمترین sales_price برای هر محصول
-                min_price_subq = (
-                    db.query(
-                        ProductVariation.product_id,
-                        func.min(ProductVariation.sales_price).label("min_sales_price")
-                    )
-                    .group_by(ProductVariation.product_id)
-                    .subquery()
-                )
-                query = query.join(min_price_subq, Product.id == min_price_subq.c.product_id)
-                col = min_price_subq.c.min_sales_price
-            else:
-                col = order_map.get(product_request.order_by)
-            
-            if col is not None:
-                if product_request.order_dir.lower() == "desc":
-                    query = query.order_by(col.desc())
-                else:
-                    query = query.order_by(col)
-            else:
-                query = query.order_by(Product.created_at.desc())
+        descending = (product_request.order_dir or "desc").lower() == "desc"
+        col = None
+        if product_request.order_by == "sales_price":
+            # کمترین sales_price هر محصول از جدول خلاصه (ایندکس‌شده) خوانده می‌شود
+            query = query.join(ProductSummary, ProductSummary.product_id == Product.id)
+            col = ProductSummary.min_sales_price
+            row_key = lambda product: (product.summary.min_sales_price, product.id)
+        elif product_request.order_by:
+            col = order_map.get(product_request.order_by)
+            row_key = lambda product: (getattr(product, product_request.order_by), product.id)
+
+        if col is not None:
+            sort_keys = [(col, descending), (Product.id, descending)]
         else:
-            query = query.order_by(Product.created_at.desc())
+            sort_keys = [(Product.created_at, True), (Product.id, True)]
+            row_key = lambda product: (product.created_at, product.id)
     
         # صفحه‌بندی
         paginate_config = product_request.paginate
-        paginated_query, total_items, total_pages = Pagination.paginate_query(query, paginate_config.page, paginate_config.size)
-        items = paginated_query.all()
+        items, pagination = Pagination.fetch_page(
+            query, sort_keys, row_key,
+            page=paginate_config.page,
+            size=paginate_config.size,
+            cursor=paginate_config.cursor,
+            after=paginate_config.after,
+            with_total=paginate_config.with_total,
+        )
     
-        # پردازش نهایی هر محصول: انتخاب variation با کمترین sales_price به صورت پایتون
+        # پردازش نهایی هر محصول: variation با کمترین sales_price از جدول خلاصه
         for product in items:
             product.categories = [cat for cat in product.categories if cat.parent_id is None]
-            if product.variations:
-                min_variation = min(product.variations, key=lambda var: var.sales_price)
+            min_variation = product.summary.min_variation if product.summary else None
+            if min_variation:
                 product.var_id = min_variation.id
                 product.sku = min_variation.sku
                 product.unit_price = min_variation.unit_price
@@ -95,65 +110,39 @@ class ProductService:
                 product.reserved_quantity = min_variation.reserved_quantity
                 product.var_status = min_variation.status
     
-        pagination = Pagination(page=paginate_config.page, size=paginate_config.size, total_items=total_items, total_pages=total_pages)
         return items, pagination
 
     def get_home_products(self, db: Session, product_config: ProductConfig):
         # تعریف alias ها
-        PV = ProductVariation
         P = Product
 
-        # زیرکوئری: انتخاب variationها همراه با شماره ردیف (row_number) بر اساس sales_price (صعودی)
-        # شرط: یا وضعیت variation برابر INSTOCK باشد یا محصول SIMPLE باشد
-        variation_subq = (
-            db.query(
-                PV.id.label("var_id"),
-                PV.sku,
-                PV.product_id,
-                PV.unit_price,
-                PV.sales_price,
-                PV.quantity,
-                PV.status.label("var_status"),
-                func.row_number().over(
-                    partition_by=PV.product_id,
-                    order_by=PV.sales_price
-                ).label("rn")
-            )
-            .join(P, P.id == PV.product_id)
-            .filter(
-                or_(
-                    PV.status == "INSTOCK",
-                    P.type == ProductType.SIMPLE
-                )
-            )
-            .subquery()
-        )
-
-        # کوئری اصلی: اتصال محصولات به زیرکوئری و انتخاب تنها ردیف‌هایی که rn == 1 دارند
+        # ارزان‌ترین variation قابل نمایش هر محصول (موجود، یا هر variation محصول SIMPLE)
+        # از جدول خلاصه product_summaries خوانده می‌شود؛ محصولات بدون آن نمایش داده نمی‌شوند
+        S = ProductSummary
         query = (
             db.query(
                 P,
-                variation_subq.c.var_id,
-                variation_subq.c.sku,
-                variation_subq.c.unit_price,
-                variation_subq.c.sales_price,
-                variation_subq.c.quantity,
-                variation_subq.c.var_status
+                S.variation_id.label("var_id"),
+                S.sku,
+                S.unit_price,
+                S.sales_price,
+                S.quantity,
+                S.status.label("var_status")
             )
             .select_from(P)
-            .join(variation_subq, variation_subq.c.product_id == P.id)
-            .filter(variation_subq.c.rn == 1)
+            .join(S, S.product_id == P.id)
+            .filter(S.variation_id.isnot(None))
             .options(
-                joinedload(P.categories).load_only(Category.id, Category.name, Category.slug, Category.parent_id),
+                joinedload(P.categories).load_only(Category.id, Category.name, Category.slug, Category.type, Category.parent_id),
                 joinedload(P.files)
             )
             .filter(P.status == Status.PUBLISHED)
         )
         
-        # **اعمال فیلتر جستجو بر اساس نام محصول**
-        if getattr(product_config, "keyword", None):
-            # استفاده از ilike برای جستجو به صورت case-insensitive
-            query = query.filter(P.name.icontains(f"%{product_config.keyword}%"))
+        # جستجوی متنی روی نام، توضیحات و مقادیر ویژگی‌ها (ایندکس tsvector) همراه با امتیاز ارتباط
+        query, rank = product_search.apply(query, getattr(product_config, "keyword", None))
+        if rank is not None:
+            query = query.add_columns(rank.label("rank"))
 
         # اعمال فیلتر بر اساس دسته‌بندی‌ها
         if product_config.categories:
@@ -163,27 +152,39 @@ class ProductService:
 
         # اعمال فیلتر قیمت (استفاده از sales_price variation انتخاب شده)
         if product_config.price_min is not None:
-            query = query.filter(variation_subq.c.sales_price >= product_config.price_min)
+            query = query.filter(S.sales_price >= product_config.price_min)
         if product_config.price_max is not None:
-            query = query.filter(variation_subq.c.sales_price <= product_config.price_max)
+            query = query.filter(S.sales_price <= product_config.price_max)
 
-        # مرتب‌سازی
-        if product_config.order_by == 'newest':
-            query = query.order_by(P.created_at.desc())
-        elif product_config.order_by == 'expensive':
-            query = query.order_by(variation_subq.c.sales_price.desc())
+        # مرتب‌سازی (شناسه محصول برای یکتا بودن ترتیب و صفحه‌بندی کرسری اضافه می‌شود)
+        # در جستجو، به جز مرتب‌سازی قیمتی، نتایج بر اساس میزان ارتباط مرتب می‌شوند
+        if product_config.order_by == 'expensive':
+            sort_keys = [(S.sales_price, True), (P.id, True)]
+            row_key = lambda row: (row.sales_price, row[0].id)
         elif product_config.order_by == 'cheapest':
-            query = query.order_by(variation_subq.c.sales_price)
+            sort_keys = [(S.sales_price, False), (P.id, False)]
+            row_key = lambda row: (row.sales_price, row[0].id)
+        elif rank is not None:
+            sort_keys = [(rank, True), (P.id, True)]
+            row_key = lambda row: (row.rank, row[0].id)
+        else:
+            sort_keys = [(P.created_at, True), (P.id, True)]
+            row_key = lambda row: (row[0].created_at, row[0].id)
 
         # صفحه‌بندی
-        paginated_query, total_items, total_pages = Pagination.paginate_query(
-            query, product_config.paginate.page, product_config.paginate.size
+        paginate_config = product_config.paginate
+        items, pagination = Pagination.fetch_page(
+            query, sort_keys, row_key,
+            page=paginate_config.page,
+            size=paginate_config.size,
+            cursor=paginate_config.cursor,
+            after=paginate_config.after,
+            with_total=paginate_config.with_total,
         )
-        items = paginated_query.all()
 
         # تبدیل نتایج به ساختار نهایی: اطلاعات محصول به همراه فیلدهای variation به صورت مسطح
         product_lists = []
-        for product, var_id, sku, unit_price, sales_price, quantity, var_status in items:
+        for product, var_id, sku, unit_price, sales_price, quantity, var_status, *_ in items:
             product_lists.append({
                 'id': product.id,
                 'name': product.name,
@@ -200,14 +201,7 @@ class ProductService:
                 'var_status': var_status,
             })
         
-        filters_data = self.get_products_filtering(db)
-
-        pagination = Pagination(
-            page=product_config.paginate.page,
-            size=product_config.paginate.size,
-            total_items=total_items,
-            total_pages=total_pages
-        )
+        filters_data = self.get_products_filtering(db, product_config)
 
         result = {
             "products": product_lists,
@@ -217,78 +211,98 @@ class ProductService:
         return result , pagination
 
     def get_info(self, db: Session, product_slug: str):
+        # سند سریال‌شده محصول از کش؛ در صورت نبود، یک بار ساخته و ذخیره می‌شود
+        cached = product_detail_cache.get(product_slug)
+        if cached is not None:
+            document, tags, _ = cached
+            tag_response(*tags)
+            return document
+
+        # selectinload برای مجموعه‌ها تا تعداد ردیف‌ها با تعداد variationها ضرب نشود
         product_item = db.query(Product).options(
             joinedload(Product.user).load_only(User.id, User.username),
-            joinedload(Product.files),
-            joinedload(Product.categories).load_only(Category.id, Category.name, Category.slug, Category.parent_id),
-            joinedload(Product.attributes).joinedload(ProductAttribute.attribute),
-            joinedload(Product.variations)
-                .joinedload(ProductVariation.variation_attributes)
+            selectinload(Product.files),
+            selectinload(Product.categories).load_only(Category.id, Category.name, Category.slug, Category.type, Category.parent_id),
+            selectinload(Product.attributes).joinedload(ProductAttribute.attribute),
+            selectinload(Product.variations)
+                .selectinload(ProductVariation.variation_attributes)
                 .joinedload(VariationAttribute.product_attribute)
                 .joinedload(ProductAttribute.attribute),
-            joinedload(Product.tags)
         ).filter(Product.slug == product_slug).first()
         
         if not product_item:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='محصول مورد نظر پیدا نشد')
         
-        # اضافه کردن لیست ویژگی‌ها به محصول
-        product_item.attributes_list = [
-            {'name': attr.attribute.name, 'value': attr.value} for attr in product_item.attributes
-        ]
-        
-        # features list of variation
-        for var in product_item.variations:
-            var.attributes_list = [
-                {
-                    'name': va.product_attribute.attribute.name,
-                    'value': va.product_attribute.value
-                } for va in var.variation_attributes
-            ]
-        
-        return product_item
+        # مدل ساخته‌شده (نه dict) کش می‌شود تا هنگام پاسخ دوباره اعتبارسنجی نشود
+        document = ProductSchema.model_validate(product_item, from_attributes=True)
+        tags = [f"product:{product_item.id}"]
+        tags += [f"variation:{var.id}" for var in product_item.variations]
+        tags += [f"category:{cat.id}" for cat in product_item.categories]
+        version = Version.of(
+            "product",
+            product_item.id,
+            product_item.updated_at,
+            latest(*[var.updated_at for var in product_item.variations]),
+            latest(*[cat.updated_at for cat in product_item.categories]),
+        )
+        product_detail_cache.set(product_slug, (document, tags, version), tags=tags)
+        tag_response(*tags)
+        return document
 
-    def get_products_filtering(self, db: Session):
-        
+    def get_info_version(self, db: Session, product_slug: str) -> Optional[Version]:
+        # نسخه محصول (ETag/Last-Modified) بدون ساختن سند؛ در صورت وجود سند در کش بدون کوئری
+        cached = product_detail_cache.get(product_slug)
+        if cached is not None:
+            return cached[2]
         PV = ProductVariation
-        P = Product
-        
-        # 1. محدوده قیمت: حداقل و حداکثر sales_price در میان variationهای فیلتر شده
-        price_range_query = (
-            db.query(
-                func.min(PV.sales_price),
-                func.max(PV.sales_price)
-            )
-            .join(P, P.id == PV.product_id)
-            .filter(P.status == Status.PUBLISHED)
-            .filter(
-                or_(
-                    PV.status == "INSTOCK",
-                    P.type == ProductType.SIMPLE
-                )
-            )
+        variations_updated = select(func.max(PV.updated_at)).where(PV.product_id == Product.id).scalar_subquery()
+        categories_updated = (
+            select(func.max(Category.updated_at))
+            .join(product_categories, product_categories.c.category_id == Category.id)
+            .where(product_categories.c.product_id == Product.id)
+            .scalar_subquery()
         )
-        # if product_config.categories:
-        #     price_range_query = price_range_query.filter(
-        #         and_(*[P.categories.any(Category.id == cat_id) for cat_id in product_config.categories])
-        #     )
-        min_price, max_price = price_range_query.first() or (0,0)
-
-        # 2. دسته‌بندی‌های موجود (برای محصولات فیلتر شده)
-        categories_query = (
-            db.query(Category)
-            .join(P.categories)
-            .filter(P.status == Status.PUBLISHED)
+        row = (
+            db.query(Product.id, Product.updated_at, variations_updated, categories_updated)
+            .filter(Product.slug == product_slug)
+            .first()
+        )
+        return Version.of("product", *row) if row else None
+
+    def get_home_version(self, db: Session, product_config: ProductConfig) -> Version:
+        # نسخه کل کاتالوگ برای لیست محصولات: تعداد و آخرین تغییر محصولات، خلاصه قیمت/موجودی و دسته‌بندی‌ها
+        # همه صفحه‌ها و فیلترها آدرس یکسانی دارند، پس فیلترها و صفحه هم بخشی از ETag هستند
+        config = product_config.model_dump(mode="json")
+        if config.get("categories"):
+            config["categories"] = sorted(config["categories"])
+        row = db.query(
+            select(func.count(Product.id)).scalar_subquery(),
+            select(func.max(Product.updated_at)).scalar_subquery(),
+            select(func.max(ProductSummary.updated_at)).scalar_subquery(),
+            select(func.count(Category.id)).scalar_subquery(),
+            select(func.max(Category.updated_at)).scalar_subquery(),
+        ).one()
+        version = Version.of("products", json.dumps(config, sort_keys=True), *row)
+        # Last-Modified به فیلترها وابسته نیست و If-Modified-Since صفحه دیگری را هم تایید می‌کرد
+        return replace(version, last_modified=None)
+
+    def get_products_filtering(self, db: Session, product_config: Optional[ProductConfig] = None):
+        # محدوده قیمت و تعداد محصولات هر دسته‌بندی از ایندکس درون حافظه (بدون کوئری روی جداول)
+        facets = facet_index.query(
+            db,
+            keyword=product_config.keyword if product_config else None,
+            categories=product_config.categories if product_config else None,
+            price_min=product_config.price_min if product_config else None,
+            price_max=product_config.price_max if product_config else None,
         )
-        available_categories = categories_query.distinct().all()
 
-        # 3. گزینه‌های مرتب‌سازی (ثابت)
+        # گزینه‌های مرتب‌سازی (ثابت)
         ordering_options = ["newest", "expensive", "cheapest"]
 
         filters_data = {
-            "min_price": min_price,
-            "max_price": max_price,
-            "categories": available_categories,
+            "min_price": facets["min_price"],
+            "max_price": facets["max_price"],
+            "categories": facets["categories"],
             "ordering_options": ordering_options,
         }
         
@@ -421,8 +435,13 @@ class ProductService:
                 
                 product.variations.append(variation)
 
+        db.flush()
+        product_search.refresh(db, [product.id])
+        product_summary.refresh(db, [product.id])
         db.commit()
         db.refresh(product)
+        facet_index.refresh_product(db, product.id)
+        cache_bus.broadcast("products")
         return product
     
     def update(self, db: Session, product_slug: str, product_in: ProductUpdate, current_user: str):
@@ -443,6 +462,8 @@ class ProductService:
         product_db.description = product_in.description
         product_db.body = product_in.body
         product_db.status = product_in.status
+        # تغییر variationها، تصاویر و ویژگی‌ها هم نسخه محصول را عوض می‌کند
+        product_db.updated_at = datetime.now()
         
         # Update categories
         if product_in.category_ids:
@@ -558,8 +579,13 @@ class ProductService:
                         variable.variation_attributes.append(variation_attr)
                 product_db.variations.append(variable)
                 
+        db.flush()
+        product_search.refresh(db, [product_db.id])
+        product_summary.refresh(db, [product_db.id])
         db.commit()
         db.refresh(product_db)
+        facet_index.refresh_product(db, product_db.id)
+        cache_bus.broadcast("products", f"product:{product_db.id}")
         return product_db
     
     def delete(self, db: Session, product_slug: str, current_user: str):
@@ -568,8 +594,11 @@ class ProductService:
         if not product_db:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='محصول مورد نظر یافت نشد')
         
+        product_id = product_db.id
         db.delete(product_db)
         db.commit()
+        facet_index.remove_product(product_id)
+        cache_bus.broadcast("products", f"product:{product_id}")
     
     def get_variation_by_id(self, db: Session, variation_id: int):
         variation_item = db.query(ProductVariation).filter(ProductVariation.id == variation_id).first()
@@ -578,40 +607,83 @@ class ProductService:
         return variation_item
     
     def get_variations_by_ids(self, db: Session, variation_ids: List[int]):
-        return db.query(ProductVariation).filter(ProductVariation.id.in_(variation_ids)).all()
+        return db.query(ProductVariation).options(joinedload(ProductVariation.product)).filter(ProductVariation.id.in_(variation_ids)).all()
     
-    def get_variation_total_price(self, db: Session, variation_id: int, quantity: int) -> float:
-        if not variation_id:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='شناسه متغیر اجباری می باشد')
-        
-        variation = self.get_variation_by_id(db, variation_id)
-        
-        return float(variation.sales_price * quantity)
-            
-    def reserve_quantity(self, db: Session, variation_id: int, quantity: int):
-        # Atomic query
+    def reserve_quantities(self, db: Session, quantities: Dict[int, int], order_id: Optional[int] = None):
+        """
+        رزرو موجودی چند variation در یک دستور UPDATE.
+
+        همه variationها رزرو می‌شوند یا هیچ‌کدام: در صورت کمبود موجودی برای هر کدام،
+        خطای 409 همراه با لیست SKUهای ناموفق برگردانده می‌شود. هر رزرو با زمان انقضا در
+        stock_reservations ثبت می‌شود. commit یا rollback بر عهده فراخواننده است.
+        """
+        if not quantities:
+            return
+        PV = ProductVariation
+        requested = values(
+            column("variation_id", Integer), column("quantity", Integer), name="requested"
+        ).data(list(quantities.items()))
+
         try:
-            db.execute(
-                text("UPDATE product_variations "
-                       "SET quantity = quantity - :quantity, reserved_quantity = reserved_quantity + :quantity "
-                       "WHERE id = :variation_id AND quantity >= :quantity"),
-                       {"quantity": quantity, "variation_id": variation_id}
+            reserved_ids = set(db.execute(
+                update(PV)
+                .where(PV.id == requested.c.variation_id, PV.quantity >= requested.c.quantity)
+                .values(
+                    quantity=PV.quantity - requested.c.quantity,
+                    reserved_quantity=PV.reserved_quantity + requested.c.quantity,
                 )
+                .returning(PV.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            product_summary.sync_stock(db, reserved_ids)
+        except SQLAlchemyError:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='عملیات رزرو تعداد محصول با خطا مواجه شد')
+
+        failed_ids = set(quantities) - reserved_ids
+        if failed_ids:
+            skus = dict(db.query(PV.id, PV.sku).filter(PV.id.in_(failed_ids)).all())
+            raise CustomHTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                message='موجودی برخی از محصولات کافی نیست',
+                data={"failed": [
+                    {"variation_id": variation_id, "sku": skus.get(variation_id), "quantity": quantities[variation_id]}
+                    for variation_id in sorted(failed_ids)
+                ]},
+            )
+        stock_reservations.record(db, quantities, order_id)
+        self._invalidate_variations(db, reserved_ids)
+
+    def commit_reservations(self, db: Session, order_id: int) -> Dict[int, int]:
+        """
+        نهایی کردن رزروهای فعال یک سفارش پرداخت‌شده: واحدها از reserved_quantity کسر می‌شوند.
+
+        تعداد واحدهای نهایی‌شده به ازای هر variation برگردانده می‌شود.
+        commit یا rollback بر عهده فراخواننده است.
+        """
+        committed = stock_reservations.commit(db, order_id)
+        product_summary.sync_stock(db, list(committed))
+        self._invalidate_variations(db, list(committed))
+        return committed
+
+    def release_expired_reservations(self, db: Session, batch_size: int = 500) -> int:
+        """
+        آزادسازی رزروهای منقضی‌شده در دسته‌های batch_size تایی (هر دسته یک دستور و یک تراکنش)؛
+        موجودی به variationها برمی‌گردد و سفارش‌های pending آن‌ها لغو می‌شوند. تعداد رزروهای آزادشده برگردانده می‌شود.
+        """
+        total = 0
+        while True:
+            released = stock_reservations.release_expired(db, batch_size)
+            if not released:
+                return total
+            variation_ids = [variation_id for variation_id, _, _ in released]
+            product_summary.sync_stock(db, variation_ids)
+            self._invalidate_variations(db, variation_ids)
             db.commit()
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'عملیات رزرو تعداد محصول با خطا مواجه شد')
-    
-    def finalize_reserved_quantity(self, db: Session, variation_id: int, quantity: int):
-        try:
-            product_variation = self.get_variation_by_id(db, variation_id)
-            product_variation.reserved_quantity -= quantity
-            db.add(product_variation)
-            db.commit()
-            db.refresh(product_variation)
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'عملیات رزرو تعداد محصول با خطا مواجه شد')
+            total += sum(reservations for _, _, reservations in released)
+
+    def _invalidate_variations(self, db: Session, variation_ids):
+        # کش‌های همه workerها پس از commit تراکنش جاری باطل می‌شوند
+        cache_bus.publish(db, *[f"variation:{variation_id}" for variation_id in variation_ids])
     
     def get_attributes(self, db: Session):
         attributes = db.query(Attribute).all()
@@ -1,10 +1,49 @@
 import json
+from typing import Any, Callable, Optional
 from fastapi import HTTPException
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
+from core.cache import TTLCache
+from core.config import settings as app_settings
+from core.pg_listener import pg_listener
+from core.response_cache import response_cache
 from models.setting import Setting
 from schemas.setting import SettingBase, SettingItem
 
+SETTINGS_CHANNEL = "settings_changed"
+
+_MISSING = object()
+
 class SettingService:
+    """
+    Settings rarely change but are read on hot paths (order creation, payments), so
+    decoded values are cached in-process. Changes drop the entry locally and are
+    broadcast to other workers with NOTIFY on `settings_changed`; the TTL bounds
+    staleness if a worker is not listening.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=256, ttl=app_settings.settings_cache_ttl)
+        pg_listener.subscribe(SETTINGS_CHANNEL, self._on_change)
+
+    def _on_change(self, setting_key: Optional[str]):
+        if setting_key:
+            self.cache.delete(setting_key)
+        else:
+            self.cache.clear()
+        response_cache.invalidate_tags("settings")
+
+    def _notify(self, db: Session, *setting_keys: str):
+        """Queue the change notification; Postgres delivers it only if the transaction commits."""
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        for setting_key in set(setting_keys):
+            db.execute(select(func.pg_notify(SETTINGS_CHANNEL, setting_key)))
+
+    def _invalidate(self, *setting_keys: str):
+        for setting_key in setting_keys:
+            self.cache.delete(setting_key)
+        response_cache.invalidate_tags("settings")
     
     def get_all(self, db: Session):
         settings = db.query(Setting).all()
@@ -21,13 +60,21 @@ class SettingService:
                 setting.value = json.loads(setting.value)
         return setting
     
-    def get_value(self, db: Session, setting_key: str):
-        setting = db.query(Setting).filter_by(key=setting_key).first()
-        if not setting:
-            return False
-        if isinstance(setting.value, str):
-                setting.value = json.loads(setting.value)
-        return setting.value
+    def get_value(self, db: Session, setting_key: str, cast: Optional[Callable[[Any], Any]] = None):
+        """
+        Decoded value of a setting, or False if it does not exist.
+        The value is shared between callers and must not be mutated.
+        """
+        value = self.cache.get(setting_key, _MISSING)
+        if value is _MISSING:
+            setting = db.query(Setting.value).filter_by(key=setting_key).first()
+            value = False
+            if setting:
+                value = json.loads(setting.value) if isinstance(setting.value, str) else setting.value
+            self.cache.set(setting_key, value)
+        if cast is not None and value is not False:
+            return cast(value)
+        return value
     
     def create(self, db: Session, data: SettingBase):
         new_setting = Setting(
@@ -37,7 +84,9 @@ class SettingService:
             is_active=True
         )
         db.add(new_setting)
+        self._notify(db, data.key)
         db.commit()
+        self._invalidate(data.key)
         db.refresh(new_setting)
         return new_setting
     
@@ -45,11 +94,14 @@ class SettingService:
         setting = db.query(Setting).filter_by(id=setting_id).first()
         if not setting:
             raise HTTPException(status_code=404, detail='setting item not found!')
+        old_key = setting.key
         setting.key = data.key
         setting.value = json.dumps(data.value)
         setting.description = data.description
         setting.is_active = data.is_active
+        self._notify(db, old_key, data.key)
         db.commit()
+        self._invalidate(old_key, data.key)
         db.refresh(setting)
         return setting
     
@@ -58,7 +110,10 @@ class SettingService:
         if not setting:
             raise HTTPException(status_code=404, detail='setting item not found!')
         
+        setting_key = setting.key
         db.delete(setting)
+        self._notify(db, setting_key)
         db.commit()
+        self._invalidate(setting_key)
     
 setting_service = SettingService()
\ No newline at end of file
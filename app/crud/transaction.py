@@ -4,11 +4,12 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session, joinedload
 from crud.setting import setting_service
 from crud.user import user_service
-from crud.order import order_service
+from crud.order import FinalizeResult, order_service
+from models.enums.transaction_enums import TransactionStatus
 from models.transaction import Transaction
 from schemas.pagination import Pagination
 from schemas.transaction import TransactionBase, VerifyTransaction, VerifyTransactionReq, VerifyTransactionRes, createTransaction
-from external_services.payment_service import Payment
+from external_services.payment_service import payment_gateway
 from services.payments.factory import PaymentFactory
 
 class TransactionService:
@@ -16,11 +17,14 @@ class TransactionService:
     def __init__(self, db: Session):
         self.db = db
     
-    def get_all(self, page: int, size: int, current_user: int) -> List[TransactionBase]:
-        query = self.db.query(Transaction).filter_by(user_id=current_user).order_by(Transaction.created_at.desc())
-        paginated_query, total_items, total_pages = Pagination.paginate_query(query, page, size)
-        items = paginated_query.all()
-        pagination = Pagination(page=page, size=size, total_items=total_items, total_pages=total_pages)
+    def get_all(self, page: int, size: int, current_user: int, cursor: bool = False, after: str = None, with_total: bool = False) -> List[TransactionBase]:
+        query = self.db.query(Transaction).filter_by(user_id=current_user)
+        items, pagination = Pagination.fetch_page(
+            query,
+            [(Transaction.created_at, True), (Transaction.id, True)],
+            lambda item: (item.created_at, item.id),
+            page=page, size=size, cursor=cursor, after=after, with_total=with_total,
+        )
         return items, pagination
     
     def get(self, transaction_id: int, current_user: int) -> TransactionBase:
@@ -62,7 +66,7 @@ class TransactionService:
         self.db.delete(transaction_item)
         self.db.commit()
     
-    def pay(self, transaction_id: int, current_user: int):
+    async def pay(self, transaction_id: int, current_user: int):
         
         transaction_item: TransactionBase = self.get(transaction_id, current_user)
         
@@ -82,26 +86,32 @@ class TransactionService:
         data = {"current_user": current_user}
         
         try:
-            pay_response = strategy.handle_payment(transaction_item, data)
+            pay_response = await strategy.handle_payment(transaction_item, data)
             self.db.commit()
             self.db.refresh(transaction_item)
             return pay_response
+        except HTTPException:
+            self.db.rollback()
+            raise
         except Exception as e:
             self.db.rollback()
             raise HTTPException(status_code=500, detail=str(e))
     
-    def verify(self, verify_data: VerifyTransactionReq, current_user: int):
-        transaction_item: TransactionBase = self.db.query(Transaction).options(joinedload(Transaction.order)).filter_by(res_number=verify_data.res_number, user_id=current_user).first()
+    async def verify(self, verify_data: VerifyTransactionReq, current_user: int):
+        transaction_item: TransactionBase = self.db.query(Transaction).options(joinedload(Transaction.order)).filter_by(res_number=verify_data.res_number, user_id=current_user).with_for_update(of=Transaction).first()
         if not transaction_item:
             raise HTTPException(status_code=404, detail="Transaction not found")
+        # تراکنشی که قبلاً تسویه شده دوباره تایید نمی‌شود؛ درگاه برای تایید تکراری هم کد 101 (موفق)
+        # برمی‌گرداند و بدون این بررسی مبلغ دوباره به کیف پول اضافه می‌شد
+        if transaction_item.status not in (None, TransactionStatus.Pending.value):
+            return transaction_item
         
         verify_data = VerifyTransaction(
             status=verify_data.status,
             res_number=verify_data.res_number,
             amount=transaction_item.amount
         )
-        payment_service = Payment()
-        verify_response: VerifyTransactionRes = payment_service.verify_pay(verify_data)
+        verify_response: VerifyTransactionRes = await payment_gateway.verify_pay(verify_data)
         
         transaction_item.status = verify_response.status
         transaction_item.portal_out = datetime.now()
@@ -114,10 +124,12 @@ class TransactionService:
             user = user_service.get(self.db, transaction_item.user_id)
             user.balance += transaction_item.amount
         
-        if transaction_item.transaction_type == "order":
+        if transaction_item.transaction_type == "order" and transaction_item.status == TransactionStatus.Success.value:
             # Finalize reserved products and set order status to processing
-            # Assuming you have a method to finalize products and update order status
-            order_service.finalize_order(self.db, transaction_item.order_id)
+            if order_service.finalize_order(self.db, transaction_item.order_id) == FinalizeResult.RELEASED:
+                # سفارش منقضی و لغو شده و موجودی آن آزاد شده است؛ مبلغ به کیف پول کاربر برمی‌گردد
+                user = user_service.get(self.db, transaction_item.user_id)
+                user.balance += transaction_item.amount
 
         try:
             self.db.commit()
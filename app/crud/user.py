@@ -1,7 +1,8 @@
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from models.user import User
 from schemas.user import UserCreate, UserUpdate
-from core.security import hash_password
+from core.security import ahash_password
 
 
 class UserService:
@@ -17,7 +18,9 @@ class UserService:
     def get_by_phone_number(self, db: Session, phone_number: str):
         return db.query(User).filter(User.phone_number == phone_number).first()
 
-    def create(self, db: Session, user_in: UserCreate):
+    async def create(self, db: Session, user_in: UserCreate):
+        # hash روی pool مخصوص bcrypt انجام می‌شود و در این مدت thread درخواستی اشغال نمی‌شود
+        password = await ahash_password(user_in.password)
         db_user = User(
         email = user_in.email,
         username = user_in.username,
@@ -25,12 +28,10 @@ class UserService:
         last_name = user_in.last_name,
         phone_number = user_in.phone_number,
         role_id = user_in.role_id,
-        password = hash_password(user_in.password),
+        password = password,
         is_active = True
         )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await run_in_threadpool(self._save, db, db_user)
     
     def create_quick(self, db: Session, username: str):
         db_user = User(phone_number=username, role_id=3, is_active=True)
@@ -39,10 +40,14 @@ class UserService:
         db.refresh(db_user)
         return db_user
 
-    def update(self, db: Session, db_user: User, user_in: UserUpdate):
+    async def update(self, db: Session, db_user: User, user_in: UserUpdate):
         if user_in.password:
-            db_user.password = hash_password(user_in.password)
+            db_user.password = await ahash_password(user_in.password)
         db_user.is_active = user_in.is_active
+        await run_in_threadpool(self._save, db, db_user)
+
+    def _save(self, db: Session, db_user: User):
+        db.add(db_user)
         db.commit()
         db.refresh(db_user)
 
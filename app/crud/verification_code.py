@@ -1,22 +1,129 @@
+"""
+Verification codes (OTP).
+
+With OTP_STORE=kv (default) codes live in the key-value store (core.kv_store)
+and never touch Postgres: a code is stored hashed under the phone number for
+OTP_TTL seconds, and verifying it is a single atomic delete-if-equal, so a code
+can be used once even under concurrent requests. Wrong guesses are counted and
+after OTP_MAX_ATTEMPTS the code is dropped. While the store cannot be reached,
+codes are written to and checked against the verification_codes table instead
+(and sending is not throttled); a phone with no code in the store is checked
+against the table too, so a code issued during an outage still works after the
+store is back. OTP_STORE=db always uses the table.
+
+Sending a code is throttled per phone (one per OTP_RESEND_INTERVAL seconds,
+OTP_PHONE_HOURLY_LIMIT per hour) and per client IP (OTP_IP_HOURLY_LIMIT per
+hour) with counters in the same store.
+"""
+import hashlib
+import logging
 from datetime import datetime
-from models.verification_code import VerificationCode as vc_model
+from typing import Optional
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from starlette import status
+from core.config import settings
+from core.kv_store import kv_store
+from core.metrics import registry
+from models.verification_code import VerificationCode as vc_model
+
+logger = logging.getLogger(__name__)
+
+otp_events = registry.counter(
+    "otp_events_total",
+    "Verification code events (issued, verified, rejected, locked, throttled, db_fallback)",
+    ["event"],
+)
+
+
+def _digest(phone_number: str, code: str) -> str:
+    return hashlib.sha256(f"{phone_number}:{code}".encode()).hexdigest()
+
 
 class VerificationCodeService:
-    
-    def create_verification_code(self, db: Session, phone_number: str):
-        return vc_model.create_code(db, phone_number)
-    
-    def get_valid_code(self, db: Session, phone_number:str, code: str):
-        return db.query(vc_model).filter(vc_model.phone_number == phone_number, vc_model.code == code, vc_model.expires_at > datetime.now()).first()
-    
-    def mark_code_as_used(self, db: Session, code_id: int):
-        verification_code = db.query(vc_model).filter(vc_model.id == code_id).first()
-        if verification_code:
-            verification_code.is_used = True
+
+    def create_verification_code(self, db: Session, phone_number: str, client_ip: Optional[str] = None) -> str:
+        # محدودیت ارسال قبل از ساخت کد بررسی می‌شود تا کد قبلی بی‌دلیل باطل نشود
+        self.throttle(phone_number, client_ip)
+        code = vc_model.generate_code()
+        if settings.otp_store == "kv":
+            try:
+                kv_store.set(f"otp:{phone_number}", _digest(phone_number, code), ttl=settings.otp_ttl)
+                kv_store.delete(f"otp-attempts:{phone_number}")
+                otp_events.inc(event="issued")
+                return code
+            except Exception:
+                logger.exception("kv store unavailable, storing verification code in the database")
+                otp_events.inc(event="db_fallback")
+        vc_model.create_code(db, phone_number, code=code, ttl=settings.otp_ttl)
+        otp_events.inc(event="issued")
+        return code
+
+    def consume_code(self, db: Session, phone_number: str, code: str) -> bool:
+        """کد را بررسی و در صورت درست بودن باطل می‌کند؛ هر کد فقط یک بار قابل استفاده است"""
+        if settings.otp_store == "kv":
+            try:
+                consumed = self._consume_kv(db, phone_number, code)
+            except HTTPException:
+                raise
+            except Exception:
+                # در زمان قطعی store کدها در دیتابیس ساخته شده‌اند
+                logger.exception("kv store unavailable, checking verification code in the database")
+                otp_events.inc(event="db_fallback")
+                consumed = self._consume_db(db, phone_number, code)
+        else:
+            consumed = self._consume_db(db, phone_number, code)
+        otp_events.inc(event="verified" if consumed else "rejected")
+        return consumed
+
+    def _consume_kv(self, db: Session, phone_number: str, code: str) -> bool:
+        # بعد از قفل شدن هیچ کدی پذیرفته نمی‌شود، نه از store و نه کد ساخته‌شده در دیتابیس
+        if kv_store.count(f"otp-attempts:{phone_number}") >= settings.otp_max_attempts:
+            self._lock_out(phone_number)
+        if kv_store.pop_if(f"otp:{phone_number}", _digest(phone_number, code)):
+            kv_store.delete(f"otp-attempts:{phone_number}")
+            return True
+        # کدی که در زمان قطعی store ساخته شده فقط در دیتابیس است
+        if kv_store.get(f"otp:{phone_number}") is None and self._consume_db(db, phone_number, code):
+            kv_store.delete(f"otp-attempts:{phone_number}")
+            otp_events.inc(event="db_fallback")
+            return True
+        attempts = kv_store.incr(f"otp-attempts:{phone_number}", ttl=settings.otp_ttl)
+        if attempts >= settings.otp_max_attempts:
+            self._lock_out(phone_number)
+        return False
+
+    def _lock_out(self, phone_number: str):
+        # بعد از تعداد مشخصی تلاش ناموفق کد باطل می‌شود و باید کد جدید گرفت
+        kv_store.delete(f"otp:{phone_number}")
+        otp_events.inc(event="locked")
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="تعداد تلاش‌های ناموفق بیش از حد مجاز است، کد جدید دریافت کنید")
+
+    def _consume_db(self, db: Session, phone_number: str, code: str) -> bool:
+        # بررسی و باطل کردن کد در یک دستور UPDATE انجام می‌شود
+        updated = db.query(vc_model).filter(
+            vc_model.phone_number == phone_number,
+            vc_model.code == code,
+            vc_model.is_used.is_(False),
+            vc_model.expires_at > datetime.now(),
+        ).update({vc_model.is_used: True, vc_model.updated_at: datetime.now()}, synchronize_session=False)
+        if updated:
             db.commit()
-            db.refresh(verification_code)
+        return bool(updated)
 
-verification_code_service = VerificationCodeService()
+    def throttle(self, phone_number: str, client_ip: Optional[str] = None):
+        try:
+            allowed = (
+                kv_store.add(f"otp-resend:{phone_number}", 1, ttl=settings.otp_resend_interval)
+                and kv_store.incr(f"otp-phone:{phone_number}", ttl=3600) <= settings.otp_phone_hourly_limit
+                and (not client_ip or kv_store.incr(f"otp-ip:{client_ip}", ttl=3600) <= settings.otp_ip_hourly_limit)
+            )
+        except Exception:
+            # نبودن store نباید ورود کاربران را متوقف کند
+            logger.exception("kv store unavailable, verification codes are not throttled")
+            return
+        if not allowed:
+            otp_events.inc(event="throttled")
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="درخواست ارسال پیام بیش از حد مجاز است، کمی بعد تلاش کنید")
 
-    
\ No newline at end of file
+verification_code_service = VerificationCodeService()
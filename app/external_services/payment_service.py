@@ -1,63 +1,171 @@
+"""
+Async Zarinpal gateway client.
+
+All calls share one pooled `httpx.AsyncClient` (keep-alive connections to the
+gateway, at most PAYMENT_MAX_CONNECTIONS) with connect and read timeouts, so a
+slow gateway costs a request its timeout instead of blocking the worker.
+
+`verify_pay` is idempotent on the gateway side (a repeated verification answers
+101, "already verified") and is retried with exponential backoff on transport
+errors and 5xx responses. `request_pay` is not retried. Both go through a
+circuit breaker that fails fast while the gateway keeps failing.
+
+Point ZARINPAL_URL and ZARINPAL_START_PAY_URL at `python -m benchmarks.mock_zarinpal`
+to exercise the pay/verify flow offline.
+"""
+import asyncio
+import time
+from typing import Optional, Tuple
+import httpx
+from fastapi import HTTPException
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from core.config import settings
+from core.metrics import registry
 from models.enums.transaction_enums import TransactionStatus
 from schemas.transaction import VerifyTransaction, PayTransactionRes, VerifyTransactionRes
-from fastapi import HTTPException
-import requests
 
-ZARINPAL_SANDBOX = "https://sandbox.zarinpal.com/pg/v4/payment/"
-MERCHANT_ID = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+# 101: the payment was verified before. It counts as success so a retried verify call
+# still succeeds; TransactionService.verify never settles a transaction twice, so a
+# replayed verification of a settled transaction does not pay out again
+VERIFIED_CODES = {100, 101}
+
+gateway_requests = registry.counter(
+    "payment_gateway_requests_total",
+    "Payment gateway calls by operation and result (ok, error, circuit_open)",
+    ["operation", "result"],
+)
+gateway_seconds = registry.histogram(
+    "payment_gateway_request_seconds",
+    "Payment gateway call time",
+    ["operation"],
+)
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or answered with a server error."""
+
+
+class ZarinpalGateway:
+
+    def __init__(self, base_url: str, start_pay_url: str, merchant_id: str, callback_url: str,
+                 timeout: httpx.Timeout, max_connections: int, verify_attempts: int, retry_backoff: float,
+                 breaker: CircuitBreaker):
+        self.base_url = base_url
+        self.start_pay_url = start_pay_url
+        self.merchant_id = merchant_id
+        self.callback_url = callback_url
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.verify_attempts = verify_attempts
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
 
-class Payment:
-    
-    def request_pay(self, amount: int, description: str) -> PayTransactionRes:
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, operation: str, path: str, body: dict) -> dict:
+        if not self.breaker.allow():
+            gateway_requests.inc(operation=operation, result="circuit_open")
+            raise CircuitOpenError(self.breaker.name)
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(path, json=body)
+            if response.status_code >= 500:
+                raise GatewayError(f"{operation} answered {response.status_code}")
+            payload = response.json()
+        except (httpx.HTTPError, ValueError, GatewayError) as e:
+            self.breaker.record_failure()
+            gateway_requests.inc(operation=operation, result="error")
+            raise GatewayError(str(e)) from e
+        except BaseException:
+            # cancelled (client disconnected) or unexpected: the call still has to report
+            # back, otherwise a half-open breaker keeps waiting for its trial
+            self.breaker.record_failure()
+            gateway_requests.inc(operation=operation, result="error")
+            raise
+        finally:
+            gateway_seconds.observe(time.perf_counter() - started, operation=operation)
+        self.breaker.record_success()
+        gateway_requests.inc(operation=operation, result="ok")
+        return payload
+
+    @staticmethod
+    def _result(payload: dict) -> Tuple[Optional[int], dict]:
+        """Result code and data of a gateway answer; failures carry the code under `errors`."""
+        data = payload.get("data") or {}
+        if isinstance(data, dict) and "code" in data:
+            return data["code"], data
+        errors = payload.get("errors") or {}
+        return (errors.get("code") if isinstance(errors, dict) else None), {}
+
+    async def request_pay(self, amount: int, description: str) -> PayTransactionRes:
         try:
-            # get callback_url from setting
-            callback_url = "http://127.0.0.1:4200/verify"
-            response = requests.post(
-                f"{ZARINPAL_SANDBOX}request.json",
-                json={
-                    "merchant_id": MERCHANT_ID,
-                    "amount": amount,
-                    "callback_url": callback_url,
-                    "description": description,
-                }
-            )
-            res_data = response.json()
-            
-            if res_data['data']["code"] != 100:
-                raise HTTPException(status_code=500, detail="payment Error!")
-            return PayTransactionRes(
-                status_code=res_data['data']["code"],
-                payment_url=f"https://sandbox.zarinpal.com/pg/StartPay/{res_data['data']['authority']}",
-                res_number=res_data['data']['authority']
-            )
-        except Exception as e:
+            payload = await self._post("request", "v4/payment/request.json", {
+                "merchant_id": self.merchant_id,
+                "amount": amount,
+                "callback_url": self.callback_url,
+                "description": description,
+            })
+        except CircuitOpenError:
+            raise HTTPException(status_code=503, detail="Payment gateway is unavailable, try again later")
+        except GatewayError:
+            raise HTTPException(status_code=500, detail="payment Error!")
+
+        code, data = self._result(payload)
+        if code != 100:
             raise HTTPException(status_code=500, detail="payment Error!")
+        return PayTransactionRes(
+            status_code=code,
+            payment_url=f"{self.start_pay_url}{data['authority']}",
+            res_number=data['authority'],
+        )
 
-    def verify_pay(self, data: VerifyTransaction) -> VerifyTransactionRes:
+    async def verify_pay(self, data: VerifyTransaction) -> VerifyTransactionRes:
         if data.status != "OK":
-            return VerifyTransactionRes(status=TransactionStatus.Canceled)
-        
-        try:
-            response = requests.post(
-                f"{ZARINPAL_SANDBOX}verify.json",
-                json={
-                    "merchant_id": MERCHANT_ID,
-                    "authority": data.res_number,
-                    "amount": data.amount,
-                }
-            )
-            res_data = response.json()
-            code = res_data['data'].get("code", None)  # Safely get the code
-            
-            if code is None:
-                raise HTTPException(status_code=500, detail="Invalid response structure")
-            
-            status = TransactionStatus.Success if code == 100 else TransactionStatus.Failed
-            return VerifyTransactionRes(
-                status=status,
-                ref_id=res_data.get("RefID", None),
-                fee=res_data.get("fee", None),
-                fee_type=res_data.get("fee_type", None),
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail="Payment verification error!")
\ No newline at end of file
+            return VerifyTransactionRes(status=TransactionStatus.Canceled.value)
+
+        body = {"merchant_id": self.merchant_id, "authority": data.res_number, "amount": data.amount}
+        for attempt in range(1, self.verify_attempts + 1):
+            try:
+                payload = await self._post("verify", "v4/payment/verify.json", body)
+                break
+            except CircuitOpenError:
+                raise HTTPException(status_code=503, detail="Payment gateway is unavailable, try again later")
+            except GatewayError:
+                if attempt == self.verify_attempts:
+                    raise HTTPException(status_code=500, detail="Payment verification error!")
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+        code, result = self._result(payload)
+        if code is None:
+            raise HTTPException(status_code=500, detail="Invalid response structure")
+
+        status = TransactionStatus.Success if code in VERIFIED_CODES else TransactionStatus.Failed
+        return VerifyTransactionRes(
+            status=status.value,
+            ref_id=result.get("ref_id"),
+            fee=result.get("fee"),
+            fee_type=result.get("fee_type"),
+        )
+
+
+payment_gateway = ZarinpalGateway(
+    base_url=settings.zarinpal_url,
+    start_pay_url=settings.zarinpal_start_pay_url,
+    merchant_id=settings.zarinpal_merchant_id,
+    callback_url=settings.payment_callback_url,
+    timeout=httpx.Timeout(settings.payment_read_timeout, connect=settings.payment_connect_timeout),
+    max_connections=settings.payment_max_connections,
+    verify_attempts=settings.payment_verify_attempts,
+    retry_backoff=0.5,
+    breaker=CircuitBreaker("zarinpal", settings.payment_circuit_failures, settings.payment_circuit_reset),
+)
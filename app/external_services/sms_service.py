@@ -1,20 +1,222 @@
-from kavenegar import *
-
-def send_sms(phone_number: str, code: str):
-    try:
-        api = KavenegarAPI('3661596A78414535756C6D4C307179395334707A436A486E7A5861345A5343452F5369566363336B4758633D')
-        params = {
-        'receptor': phone_number,
-        'token': code,
-        'template': 'verificationCode',
-        'type': 'sms'
-        }
-        response = api.verify_lookup(params)
-        print(response)
-        return True
-    except APIException as e:
-        print(str(e))
-        return False
-    except HTTPException as e:
-        print(str(e))
-        return False
\ No newline at end of file
+"""
+Outbound SMS queue.
+
+Requests only enqueue a message (`sms_queue.send_code(...)`) and return; a pool
+of SMS_WORKERS threads drains the queue and hands the provider up to
+SMS_BATCH_SIZE messages at a time. Transient provider failures are retried with
+backoff up to SMS_MAX_ATTEMPTS times. Callers throttle what they queue (see
+crud.verification_code for verification codes).
+
+Providers share one client for all messages:
+
+* `kavenegar`: Kavenegar's verify/lookup REST API over a pooled httpx.Client
+  (lookup has no bulk endpoint, so a batch is sent over one kept-alive connection)
+* `fake`: waits FAKE_SMS_LATENCY seconds per message and sends nothing, for
+  local and throughput testing (`python -m benchmarks.sms`)
+
+The queue lives in the worker's memory: messages still queued when a worker
+stops are lost, which is acceptable for verification codes (users ask again).
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+import httpx
+from fastapi import HTTPException
+from starlette import status
+from core.config import settings
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+sms_messages = registry.counter(
+    "sms_messages_total",
+    "Outbound SMS by result (sent, failed, retried, dropped)",
+    ["result"],
+)
+sms_send_seconds = registry.histogram(
+    "sms_send_seconds",
+    "Provider time per batch",
+)
+
+
+@dataclass
+class SmsMessage:
+    receptor: str
+    token: str
+    template: str = "verificationCode"
+    attempts: int = 0
+
+
+class SmsError(Exception):
+    """A send that may succeed if retried."""
+
+
+class SmsProvider:
+
+    def send_batch(self, messages: List[SmsMessage]) -> List[Optional[Exception]]:
+        """Send the messages; returns None per sent message and the error per failed one."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class KavenegarProvider(SmsProvider):
+
+    def __init__(self, api_key: str, timeout: float = 10.0, max_connections: int = 10):
+        self.client = httpx.Client(
+            base_url=f"https://api.kavenegar.com/v1/{api_key}/",
+            timeout=httpx.Timeout(timeout, connect=3.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def send(self, message: SmsMessage):
+        try:
+            response = self.client.post("verify/lookup.json", data={
+                "receptor": message.receptor,
+                "token": message.token,
+                "template": message.template,
+                "type": "sms",
+            })
+        except httpx.HTTPError as e:
+            raise SmsError(str(e)) from e
+        if response.status_code >= 500:
+            raise SmsError(f"kavenegar answered {response.status_code}")
+        if response.status_code != 200:
+            # invalid receptor, template, credit...: retrying won't help
+            raise ValueError(f"kavenegar answered {response.status_code}: {response.text[:200]}")
+
+    def send_batch(self, messages: List[SmsMessage]) -> List[Optional[Exception]]:
+        results = []
+        for message in messages:
+            try:
+                self.send(message)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        self.client.close()
+
+
+class FakeProvider(SmsProvider):
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages: List[SmsMessage]) -> List[Optional[Exception]]:
+        time.sleep(self.latency * len(messages))
+        results = [SmsError("fake failure") if random.random() < self.failure_rate else None for _ in messages]
+        with self._lock:
+            self.sent += results.count(None)
+        return results
+
+
+class SmsQueue:
+
+    def __init__(self, provider: SmsProvider, workers: int = 4, maxsize: int = 10000, batch_size: int = 20,
+                 max_attempts: int = 3, retry_backoff: float = 1.0):
+        self.provider = provider
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._queue: "queue.Queue[SmsMessage]" = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        registry.gauge("sms_queue_depth", "Messages waiting to be sent", callback=lambda: {(): self._queue.qsize()})
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"sms-{index}", daemon=True) for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self.provider.close()
+
+    def enqueue(self, message: SmsMessage):
+        """Queue a message; 503 when the queue is full."""
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            sms_messages.inc(result="dropped")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="ارسال پیام با خطا مواجه شد")
+
+    def send_code(self, phone_number: str, code: str):
+        self.enqueue(SmsMessage(receptor=phone_number, token=code))
+
+    def _next_batch(self) -> List[SmsMessage]:
+        try:
+            batch = [self._queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            while batch and not self._stop.is_set():
+                batch = self._send(batch)
+                if batch:
+                    # back off before retrying the messages that failed transiently
+                    self._stop.wait(self.retry_backoff * 2 ** (batch[0].attempts - 1))
+
+    def _send(self, batch: List[SmsMessage]) -> List[SmsMessage]:
+        """Send a batch; returns the messages to retry."""
+        started = time.perf_counter()
+        try:
+            results = self.provider.send_batch(batch)
+        except Exception as e:
+            results = [SmsError(str(e))] * len(batch)
+        sms_send_seconds.observe(time.perf_counter() - started)
+
+        retry = []
+        for message, error in zip(batch, results):
+            message.attempts += 1
+            if error is None:
+                sms_messages.inc(result="sent")
+            elif isinstance(error, SmsError) and message.attempts < self.max_attempts:
+                sms_messages.inc(result="retried")
+                retry.append(message)
+            else:
+                sms_messages.inc(result="failed")
+                logger.warning("sms to %s failed after %s attempts: %s", message.receptor, message.attempts, error)
+        return retry
+
+
+def _build_provider() -> SmsProvider:
+    if settings.sms_provider == "fake":
+        return FakeProvider(latency=settings.fake_sms_latency)
+    if not settings.kavenegar_api_key:
+        logger.warning("KAVENEGAR_API_KEY is not set, verification codes cannot be sent")
+    return KavenegarProvider(settings.kavenegar_api_key)
+
+
+sms_queue = SmsQueue(
+    _build_provider(),
+    workers=settings.sms_workers,
+    maxsize=settings.sms_queue_size,
+    batch_size=settings.sms_batch_size,
+    max_attempts=settings.sms_max_attempts,
+)
@@ -1,4 +1,6 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from routers.v1.users import user_router
@@ -14,11 +16,36 @@ from routers.v1.setting import setting_router
 from routers.v1.order import order_router
 from routers.v1.transaction import transaction_router
 from routers.v1.product_home import product_router
+from routers.v1.metrics import metrics_router
+from core.database import async_engine, async_replica_engines, read_your_writes
+from core.config import settings
+from core.pg_listener import pg_listener
+from core.profiling import RequestProfilerMiddleware, instrument_engines
+from core.response_cache import ResponseCacheMiddleware
+from core.security import password_executor
+from external_services.payment_service import payment_gateway
+from external_services.sms_service import sms_queue
+from tasks.runner import job_runner
 import os
 
 # Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pg_listener.start()
+    sms_queue.start()
+    if settings.job_runner:
+        job_runner.start()
+    yield
+    job_runner.stop()
+    sms_queue.stop()
+    pg_listener.stop()
+    password_executor.shutdown(wait=False)
+    await payment_gateway.aclose()
+    for engine in [async_engine, *async_replica_engines]:
+        await engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # اطمینان حاصل کن که مسیر uploads وجود داره
 if not os.path.exists("uploads"):
@@ -29,13 +56,21 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 origins = ["*"]
 
+# added first so it is the innermost middleware: CORS headers depend on the request, not the cached body
+app.add_middleware(ResponseCacheMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Guest-Cart"],
 )
+app.middleware("http")(read_your_writes)
+# added last so it is the outermost middleware and times everything below it
+if settings.request_profiling:
+    instrument_engines()
+    app.add_middleware(RequestProfilerMiddleware)
 
 app.include_router(auth_router, prefix="/api/v1")
 app.include_router(user_router, prefix="/api/v1")
@@ -49,4 +84,5 @@ app.include_router(address_router, prefix="/api/v1")
 app.include_router(shipping_router, prefix="/api/v1")
 app.include_router(setting_router, prefix="/api/v1")
 app.include_router(order_router, prefix="/api/v1")
-app.include_router(transaction_router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(transaction_router, prefix="/api/v1")
+app.include_router(metrics_router)
\ No newline at end of file
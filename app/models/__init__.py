@@ -3,13 +3,14 @@ from .user import User, Role, Permission
 from .verification_code import VerificationCode
 from .collections import Category, Tag
 from .file import File
-from .product import ProductType, InventoryStatus, Status, Product, ProductVariation, VariationAttribute, Attribute, ProductAttribute, product_categories, product_tags
+from .product import ProductType, InventoryStatus, Status, Product, ProductVariation, ProductSummary, ReservationStatus, StockReservation, VariationAttribute, Attribute, ProductAttribute, product_categories, product_tags
 from .cart import Cart, CartItem
 from .address import Country, City, Address
 from .shipping import ShippingMethod, ShippingArea
 from .setting import Setting
 from .order import Order, OrderItem, OrderStatus
 from .transaction import Transaction
+from .job import Job, JobStatus
 
 __all__ = [
     'User', 
@@ -24,6 +25,9 @@ __all__ = [
     'Status',
     'Product',
     'ProductVariation',
+    'ProductSummary',
+    'ReservationStatus',
+    'StockReservation',
     'VariationAttribute',
     'Attribute',
     'ProductAttribute',
@@ -41,5 +45,7 @@ __all__ = [
     'Order',
     'OrderItem',
     'Transaction',
+    'Job',
+    'JobStatus',
     'Base'
 ] 
\ No newline at end of file
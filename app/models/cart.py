@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric
 from sqlalchemy.orm import relationship
 from .base import Base
 
@@ -8,9 +8,9 @@ class Cart(Base):
     
     id = Column(Integer, primary_key=True, nullable=False, unique=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
-    total_amount = Column(Float, nullable=False)
+    total_amount = Column(Numeric(20, 0), nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     deleted_at = Column(DateTime, nullable=True)
     
     user = relationship("User", back_populates="carts")
@@ -24,7 +24,7 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
     variation_id = Column(Integer, ForeignKey("product_variations.id", ondelete="CASCADE"), nullable=False)
     quantity = Column(Integer, nullable=False)
-    total_price = Column(Float, nullable=False)
+    total_price = Column(Numeric(20, 0), nullable=False)
     
     cart = relationship("Cart", back_populates="cart_items")
     variation = relationship("ProductVariation", back_populates="cart_items")
\ No newline at end of file
@@ -14,7 +14,7 @@ class Category(Base):
     description = Column(String)
     parent_id = Column(Integer, ForeignKey('categories.id', ondelete='CASCADE'))
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     deleted_at = Column(DateTime)
     
     products = relationship('Product', secondary="product_categories", back_populates='categories')
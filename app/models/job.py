@@ -0,0 +1,38 @@
+import enum
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Enum, Index, Integer, String, Text
+from .base import Base
+
+class JobStatus(enum.Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class Job(Base):
+    """
+    A unit of background work, run by tasks.runner.
+
+    Runners claim queued jobs with `SELECT ... FOR UPDATE SKIP LOCKED`, so each job
+    runs once however many processes poll the table. `dedupe_key` is unique while
+    set: periodic jobs use their name so only one occurrence is ever queued.
+    """
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(128), nullable=False)
+    payload = Column(Text, nullable=True)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    run_at = Column(DateTime, nullable=False, default=datetime.now)
+    dedupe_key = Column(String(128), unique=True, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    locked_by = Column(String(128), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
@@ -1,9 +1,10 @@
 import enum
 from datetime import datetime
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, DateTime, Numeric, String, Enum, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, DateTime, Numeric, String, Enum, Table, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy import and_
+from sqlalchemy import and_, text
 from .file import File
 from .base import Base
 
@@ -35,8 +36,15 @@ class Product(Base):
     featured = Column(Boolean, default=False)
     status = Column(Enum(Status), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     deleted_at = Column(DateTime, nullable=True)
+    # normalized name, description and attribute values, maintained by services.product_search
+    search_text = deferred(Column(Text, nullable=True))
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+    
+    __table_args__ = (
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+    )
     
     user = relationship("User", back_populates="products")
     variations = relationship("ProductVariation", back_populates="product", cascade="all, delete-orphan")
@@ -44,6 +52,8 @@ class Product(Base):
     categories = relationship('Category', secondary="product_categories")
     tags = relationship('Tag', secondary="product_tags")
     files = relationship("File", back_populates="product")
+    # rows are written by services.product_summary and removed by the FK cascade
+    summary = relationship("ProductSummary", uselist=False, viewonly=True)
     
     @declared_attr
     def files(cls):
@@ -76,13 +86,76 @@ class ProductVariation(Base):
     low_stock_threshold = Column(Integer, default=5)
     status = Column(Enum(InventoryStatus), nullable=False)
     created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     deleted_at = Column(DateTime, nullable=True)
     
+    __table_args__ = (
+        # makes sku ilike '%...%' searches indexable (needs the pg_trgm extension)
+        Index("ix_product_variations_sku_trgm", "sku", postgresql_using="gin", postgresql_ops={"sku": "gin_trgm_ops"}),
+    )
+    
     product = relationship("Product", back_populates="variations")
     variation_attributes = relationship("VariationAttribute", back_populates="product_variation", cascade="all, delete-orphan")
     cart_items = relationship("CartItem", back_populates="variation")
 
+class ProductSummary(Base):
+    """
+    Per-product listing summary, maintained by services.product_summary.
+
+    The `variation_*` columns describe the cheapest listable variation (in stock, or
+    any variation of a simple product) and are empty when there is none; `min_*`
+    point at the cheapest variation regardless of stock, as shown in the admin list.
+    """
+    __tablename__ = 'product_summaries'
+    
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    variation_id = Column(Integer, ForeignKey('product_variations.id', ondelete='SET NULL'), nullable=True)
+    sku = Column(String(64), nullable=True)
+    unit_price = Column(Numeric(20, 0), nullable=True)
+    sales_price = Column(Numeric(20, 0), nullable=True)
+    quantity = Column(Integer, nullable=True)
+    reserved_quantity = Column(Integer, nullable=True)
+    status = Column(Enum(InventoryStatus), nullable=True)
+    min_variation_id = Column(Integer, ForeignKey('product_variations.id', ondelete='SET NULL'), nullable=True)
+    min_sales_price = Column(Numeric(20, 0), nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        Index("ix_product_summaries_sales_price", "sales_price", "product_id"),
+        Index("ix_product_summaries_min_sales_price", "min_sales_price", "product_id"),
+        Index("ix_product_summaries_variation_id", "variation_id"),
+    )
+    
+    min_variation = relationship("ProductVariation", foreign_keys=[min_variation_id], viewonly=True)
+
+class ReservationStatus(enum.Enum):
+    ACTIVE = 'active'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+
+class StockReservation(Base):
+    """
+    Ledger of units moved from `quantity` to `reserved_quantity`, maintained by
+    services.stock_reservations. An active reservation ends committed (the order
+    was paid) or released (it expired or was cancelled and the units went back).
+    """
+    __tablename__ = 'stock_reservations'
+    
+    id = Column(Integer, primary_key=True)
+    variation_id = Column(Integer, ForeignKey('product_variations.id', ondelete='CASCADE'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id', ondelete='SET NULL'), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    status = Column(Enum(ReservationStatus), nullable=False, default=ReservationStatus.ACTIVE)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    closed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # the sweeper only looks at active reservations, oldest expiry first
+        Index("ix_stock_reservations_active_expires_at", "expires_at", postgresql_where=text("status = 'ACTIVE'")),
+        Index("ix_stock_reservations_order_id", "order_id"),
+    )
+
 class Attribute(Base):
     __tablename__ = 'attributes'
     
@@ -15,9 +15,9 @@ class VerificationCode(Base):
     updated_at = Column(DateTime, default=datetime.now)
     
     @classmethod
-    def create_code(cls, db, phone_number:str):
-        code = cls.generate_code()
-        expires_at = datetime.now() + timedelta(minutes=10)
+    def create_code(cls, db, phone_number:str, code: str = None, ttl: int = 600):
+        code = code or cls.generate_code()
+        expires_at = datetime.now() + timedelta(seconds=ttl)
         verification_code = db.query(VerificationCode).filter_by(phone_number=phone_number).first()
         if verification_code:
             verification_code.is_used = False
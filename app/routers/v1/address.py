@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends
 from requests import Session
 
 from core.database import get_db
+from core.response_cache import cache_response
 from core.security import get_current_user
 from crud.address import address_service
 from schemas.address import Province, UserAddress, UserAddressBase, UserAddressCreate
@@ -19,11 +20,13 @@ async def get_address_list(db: Session = Depends(get_db), current_user: str = De
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
 
 @address_router.get('/provinces', response_model=Result[list[Province]])
+@cache_response(ttl=86400)
 async def get_provinces(db: Session = Depends(get_db)):
     data = address_service.get_provinces(db=db)
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
 
 @address_router.get('/cities/{province_id}', response_model=Result[list[Province]])
+@cache_response(ttl=86400)
 async def get_cities(province_id: int, db: Session = Depends(get_db)):
     data = address_service.get_cities(db=db, province_id=province_id)
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
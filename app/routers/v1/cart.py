@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Header
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from core.database import get_db
+from core.database import get_async_db, get_async_read_db, get_db
+from core.responses import ResultSerializer
 from core.security import get_current_user
+from crud.aio import async_cart_service
 from crud.cart import cart_service
-from schemas.cart import Cart
+from schemas.cart import Cart, CartBatch
 from schemas.result import Result
 
 cart_router = APIRouter(
@@ -11,29 +15,48 @@ cart_router = APIRouter(
     tags=['carts']
 )
 
+cart_serializer = ResultSerializer(Result[Cart])
+
+# opaque token of an anonymous cart; returned on every guest cart response and
+# sent back by the client, also on login/register to merge the cart
+GUEST_CART_HEADER = 'X-Guest-Cart'
+
 @cart_router.get('/', response_model=Result[Cart])
-async def get_cart(db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
-    cart = cart_service.get_cart(db=db, user_id=current_user)
-    if not cart:
-        cart = cart_service.create_cart(db=db, user_id=current_user)
-    return Result(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
+async def get_cart(db: AsyncSession = Depends(get_async_db), current_user: str = Depends(get_current_user)):
+    cart = await async_cart_service.get_or_create_cart(db=db, user_id=current_user)
+    return cart_serializer.response(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
 
 @cart_router.post('/add', response_model=Result[Cart])
 async def add_cart_item(variation_id: int, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
     cart = cart_service.add_cart_item(db=db, current_user=current_user, variation_id=variation_id)
-    return Result(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
+    return cart_serializer.response(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
 
 @cart_router.post('/update', response_model=Result[Cart])
 async def update_cart_item(cart_item_id: int, operation: str, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
-    cart = cart_service.update_cart_item(db=db, item_id=cart_item_id, operation=operation)
-    return Result(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
+    cart = cart_service.update_cart_item(db=db, current_user=current_user, item_id=cart_item_id, operation=operation)
+    return cart_serializer.response(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
+
+@cart_router.post('/batch', response_model=Result[Cart])
+async def apply_cart_batch(batch: CartBatch, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    cart = cart_service.apply_batch(db=db, current_user=current_user, batch=batch)
+    return cart_serializer.response(isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
 
 @cart_router.delete('/delete', response_model=Result[None])
 async def delete_cart_item(cart_item_id: int, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
-    cart_service.delete_cart_item(db=db, item_id=cart_item_id)
+    cart_service.delete_cart_item(db=db, current_user=current_user, item_id=cart_item_id)
     return Result(isDone=True, data=None ,message='عملیات با موفقیت انجام شد')
 
 @cart_router.delete('/delete_all', response_model=Result[None])
 async def delete_cart_items(db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
     cart_service.delete_cart_items(db=db, current_user=current_user)
     return Result(isDone=True, data=None, message='عملیات با موفقیت انجام شد')
+
+@cart_router.get('/guest', response_model=Result[Cart])
+async def get_guest_cart(db: AsyncSession = Depends(get_async_read_db), guest_cart: Optional[str] = Header(None, alias=GUEST_CART_HEADER)):
+    token, cart = await async_cart_service.get_guest_cart(db=db, token=guest_cart)
+    return cart_serializer.response(headers={GUEST_CART_HEADER: token}, isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
+
+@cart_router.post('/guest/batch', response_model=Result[Cart])
+async def apply_guest_cart_batch(batch: CartBatch, db: AsyncSession = Depends(get_async_read_db), guest_cart: Optional[str] = Header(None, alias=GUEST_CART_HEADER)):
+    token, cart = await async_cart_service.apply_guest_batch(db=db, token=guest_cart, batch=batch)
+    return cart_serializer.response(headers={GUEST_CART_HEADER: token}, isDone=True, data=cart, message='عملیات با موفقیت انجام شد')
@@ -1,9 +1,13 @@
 
 from typing import List
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from crud.aio import async_category_service
 from crud.category import category_service
-from core.database import get_db
+from core.conditional import is_not_modified, not_modified
+from core.database import get_async_read_db, get_db
+from core.response_cache import cache_response
 from schemas.category import Category, CategoryBase, CategoryCreate
 from schemas.result import PaginationResult, Result
 from starlette import status
@@ -15,14 +19,24 @@ category_router = APIRouter(
 )
 
 @category_router.get('/', response_model=PaginationResult[List[Category]])
-async def get_all(db: Session = Depends(get_db), page: int = Query(1, ge=1), size: int = Query(10, ge=1)):
-    items, pagination = category_service.get_all(db=db, page=page, size=size)
+@cache_response(ttl=300, tags=["categories"])
+async def get_all(request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db), page: int = Query(1, ge=1), size: int = Query(10, ge=1)):
+    version = await async_category_service.get_version(db=db)
+    if is_not_modified(request.headers, version.etag, version.last_modified):
+        return not_modified(version)
+    items, pagination = await async_category_service.get_all(db=db, page=page, size=size)
+    response.headers.update(version.headers())
     return PaginationResult(isDone=True, data=items, pagination=pagination, message='عملیات با موفقیت انجام شد')
 
 
 @category_router.get('/{category_id}', response_model=Result[Category])
-async def get_category(category_id: int, db: Session = Depends(get_db)):
-    data = category_service.get(db=db, category_id=category_id)
+@cache_response(ttl=300, tags=["categories"])
+async def get_category(category_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
+    version = await async_category_service.get_version(db=db)
+    if is_not_modified(request.headers, version.etag, version.last_modified):
+        return not_modified(version)
+    data = await async_category_service.get(db=db, category_id=category_id)
+    response.headers.update(version.headers())
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
 
 
@@ -0,0 +1,26 @@
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette import status
+from core.config import settings
+from core.metrics import registry
+
+metrics_router = APIRouter(
+    tags=['metrics']
+)
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    """
+    /metrics is only served with `Authorization: Bearer <METRICS_TOKEN>`; without
+    METRICS_TOKEN the endpoint does not exist.
+    """
+    if not settings.metrics_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), settings.metrics_token.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"})
+
+@metrics_router.get('/metrics', response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
@@ -1,5 +1,5 @@
 
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from core.security import get_current_user
@@ -16,8 +16,10 @@ order_router = APIRouter(
 )
 
 @order_router.get('/', response_model=PaginationResult[List[OrderListSchema]])
-async def get_all(db: Session = Depends(get_db), page: int = Query(1, ge=1), size: int = Query(10, ge=1), current_user: UserBase = Depends(get_current_user)):
-    items, pagination = order_service.get_all(db=db, page=page, size=size)
+async def get_all(db: Session = Depends(get_db), page: int = Query(1, ge=1), size: int = Query(10, ge=1),
+                  cursor: bool = Query(False), after: Optional[str] = Query(None), with_total: bool = Query(False),
+                  current_user: UserBase = Depends(get_current_user)):
+    items, pagination = order_service.get_all(db=db, page=page, size=size, cursor=cursor, after=after, with_total=with_total)
     return PaginationResult(isDone=True, data=items, pagination=pagination, message='عملیات با موفقیت انجام شد')
 
 @order_router.get('/{order_id}', response_model=Result[CreateOrder])
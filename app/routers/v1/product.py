@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from core.security import get_current_user
-from core.database import get_db
+from core.database import SessionLocal, get_db, get_read_db
 from sqlalchemy.orm import Session
 from crud.product import product_service
-from schemas.product import AdminProductsRequest, AttributeSchema, Product, ProductCreate, ProductUpdate, ProductList
+from schemas.product import AdminProductsRequest, AttributeSchema, Product, ProductCreate, ProductImportResult, ProductUpdate, ProductList
+from services.product_bulk import product_bulk
 from schemas.result import PaginationResult, Result
 from typing import List
 
@@ -28,13 +31,32 @@ async def create_attribute(attribute_name: str, db: Session = Depends(get_db), c
 
 
 @admin_product_router.post("/", response_model=PaginationResult[List[ProductList]], status_code=status.HTTP_200_OK)
-async def get_products(product_request: AdminProductsRequest, db: Session = Depends(get_db), current_user: UserBase = Depends(get_current_user)):
+async def get_products(product_request: AdminProductsRequest, db: Session = Depends(get_read_db), current_user: UserBase = Depends(get_current_user)):
     items, pagination = product_service.get_admin_products(db, product_request)
     return PaginationResult(isDone=True, data=items, pagination=pagination, message='عملیات با موفقیت انجام شد!')
 
 
+@admin_product_router.post("/import", response_model=Result[ProductImportResult], status_code=status.HTTP_200_OK)
+async def import_products(file: UploadFile = File(...), format: str = Query(None, pattern="^(csv|jsonl)$"), db: Session = Depends(get_db), current_user: UserBase = Depends(get_current_user)):
+    file_format = format or ("csv" if (file.filename or "").lower().endswith(".csv") else "jsonl")
+    # the upload is already spooled to disk; parsing and inserting run off the event loop
+    report = await run_in_threadpool(product_bulk.import_file, db, file.file, file_format, current_user)
+    return Result(isDone=True, data=vars(report), message=f'{report.imported} محصول وارد شد')
+
+
+@admin_product_router.get("/export", status_code=status.HTTP_200_OK)
+def export_products(format: str = Query("jsonl", pattern="^(csv|jsonl)$"), current_user: UserBase = Depends(get_current_user)):
+    def stream():
+        # the response outlives request dependencies, so the export owns its session
+        with SessionLocal() as db:
+            yield from product_bulk.export(db, format)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="products.{format}"'}
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
+
+
 @admin_product_router.get("/{product_slug}", response_model=Result[Product], status_code=status.HTTP_200_OK)
-async def get_product(product_slug: str, db: Session = Depends(get_db), current_user: UserBase = Depends(get_current_user)):
+async def get_product(product_slug: str, db: Session = Depends(get_read_db), current_user: UserBase = Depends(get_current_user)):
     product_item = product_service.get(db=db, product_slug=product_slug)
     return Result(isDone=True, data=product_item, message='عملیات با موفقیت انجام شد!')
 
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from starlette import status
-from core.database import get_db
-from sqlalchemy.orm import Session
-from crud.product import product_service
+from core.conditional import is_not_modified, not_modified
+from core.database import get_async_read_db
+from core.response_cache import cache_response
+from core.responses import ResultSerializer
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud.aio import async_product_service
 from schemas.product import Product, ProductConfig, ProductListData
 from schemas.result import PaginationResult, Result
 from typing import List
@@ -14,13 +17,28 @@ product_router = APIRouter(
     tags=['products']
 )
 
+product_list_serializer = ResultSerializer(PaginationResult[ProductListData])
+product_serializer = ResultSerializer(Result[Product])
+
 @product_router.get("/", response_model=PaginationResult[ProductListData], status_code=status.HTTP_200_OK)
-async def get_products(product_config: ProductConfig, db: Session = Depends(get_db)):
-    result, pagination = product_service.get_home_products(db, product_config)
-    return PaginationResult(isDone=True, data=result, pagination=pagination, message='عملیات با موفقیت انجام شد!')
+@cache_response(ttl=30, swr=30, tags=["products"])
+async def get_products(product_config: ProductConfig, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    version = await async_product_service.get_home_version(db, product_config)
+    if is_not_modified(request.headers, version.etag, version.last_modified):
+        return not_modified(version)
+    result, pagination = await async_product_service.get_home_products(db, product_config)
+    return product_list_serializer.response(
+        headers=version.headers(), isDone=True, data=result, pagination=pagination, message='عملیات با موفقیت انجام شد!'
+    )
 
 
 @product_router.get("/{product_slug}", response_model=Result[Product], status_code=status.HTTP_200_OK)
-async def get_info(product_slug: str, db: Session = Depends(get_db)):
-    product_item = product_service.get_info(db=db, product_slug=product_slug)
-    return Result(isDone=True, data=product_item, message='عملیات با موفقیت انجام شد!')
\ No newline at end of file
+@cache_response(ttl=300, swr=60)
+async def get_info(product_slug: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    version = await async_product_service.get_info_version(db=db, product_slug=product_slug)
+    if version is not None and is_not_modified(request.headers, version.etag, version.last_modified):
+        return not_modified(version)
+    product_item = await async_product_service.get_info(db=db, product_slug=product_slug)
+    return product_serializer.response(
+        headers=version.headers() if version else None, isDone=True, data=product_item, message='عملیات با موفقیت انجام شد!'
+    )
\ No newline at end of file
@@ -1,6 +1,7 @@
 from typing import List
 from fastapi import APIRouter, Depends
 from core.database import get_db
+from core.response_cache import cache_response
 from crud.setting import setting_service
 from sqlalchemy.orm import Session
 from schemas.result import Result
@@ -13,11 +14,13 @@ setting_router = APIRouter(
 )
 
 @setting_router.get('/', response_model=Result[List[SettingBase]])
+@cache_response(ttl=60, tags=["settings"])
 async def get_all(db: Session = Depends(get_db)):
     data = setting_service.get_all(db)
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
 
 @setting_router.get('/{setting_key}', response_model=Result[SettingItem])
+@cache_response(ttl=60, tags=["settings"])
 async def get(setting_key: str, db: Session = Depends(get_db)):
     data = setting_service.get(db, setting_key)
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
@@ -1,5 +1,5 @@
 
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from core.security import get_current_user
@@ -16,9 +16,11 @@ transaction_router = APIRouter(
 )
 
 @transaction_router.get('/', response_model=PaginationResult[List[TransactionSchema]])
-async def get_all(db: Session = Depends(get_db), page: int = Query(1, ge=1), size: int = Query(10, ge=1), current_user = Depends(get_current_user)):
+async def get_all(db: Session = Depends(get_db), page: int = Query(1, ge=1), size: int = Query(10, ge=1),
+                  cursor: bool = Query(False), after: Optional[str] = Query(None), with_total: bool = Query(False),
+                  current_user = Depends(get_current_user)):
     transaction_service = TransactionService(db)
-    items, pagination = transaction_service.get_all(page, size, current_user)
+    items, pagination = transaction_service.get_all(page, size, current_user, cursor=cursor, after=after, with_total=with_total)
     return PaginationResult(isDone=True, data=items, pagination=pagination, message='عملیات با موفقیت انجام شد')
 
 @transaction_router.get('/{transaction_id}', response_model=Result[TransactionBase])
@@ -48,12 +50,12 @@ async def delete_transaction(transaction_id: int, db: Session = Depends(get_db),
 @transaction_router.post('/pay/{transaction_id}', response_model=Result[PayTransactionRes], status_code=status.HTTP_201_CREATED)
 async def pay_transaction(transaction_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     transaction_service = TransactionService(db)
-    data = transaction_service.pay(transaction_id, current_user)
+    data = await transaction_service.pay(transaction_id, current_user)
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
 
 @transaction_router.post('/verify', response_model=Result[transaction_order])
 async def verify_transaction(verify_data: VerifyTransactionReq, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
     transaction_service = TransactionService(db)
-    data = transaction_service.verify(verify_data, current_user)
+    data = await transaction_service.verify(verify_data, current_user)
     return Result(isDone=True, data=data, message='عملیات با موفقیت انجام شد')
 
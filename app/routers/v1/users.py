@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from core.security import get_current_user
 from core.database import get_db
 from models.user import User
@@ -27,24 +28,24 @@ async def get_user(user_id: int, db: Session = Depends(get_db), current_user: Us
     return Result(isDone=True, data=user, message='')
 
 @user_router.post("/create", response_model=Result[None], status_code=status.HTTP_201_CREATED)
-def create_user(user_in: UserCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_user(user_in: UserCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     if user_in.email:
-        user = user_service.get_by_email(db, email=user_in.email)
+        user = await run_in_threadpool(user_service.get_by_email, db, email=user_in.email)
         if user:
             raise HTTPException(status_code=400, detail="Email already registered")
     if user_in.phone_number:
-        user = user_service.get_by_phone_number(db, phone_number=user_in.phone_number)
+        user = await run_in_threadpool(user_service.get_by_phone_number, db, phone_number=user_in.phone_number)
         if user:
             raise HTTPException(status_code=400, detail="Phone number already registered")
-    user_service.create(db, user_in=user_in)
+    await user_service.create(db, user_in=user_in)
     return Result(isDone=True, data=None, message='user created successfully')
 
 @user_router.put("/update/{user_id}", response_model=Result[None], status_code=status.HTTP_200_OK)
-def update_user(user_id: int, user_in: UserUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    user = user_service.get(db, user_id=user_id)
+async def update_user(user_id: int, user_in: UserUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    user = await run_in_threadpool(user_service.get, db, user_id=user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    user_service.update(db, db_user=user, user_in=user_in)
+    await user_service.update(db, db_user=user, user_in=user_in)
     return Result(isDone=True, data=None, message='user updated successfully')
 
 @user_router.delete("/delete/{user_id}", response_model=Result[None], status_code=status.HTTP_200_OK)
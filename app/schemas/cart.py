@@ -1,5 +1,5 @@
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from schemas.product import ProductVariation
 
@@ -16,4 +16,12 @@ class Cart(BaseModel):
     cart_items: List[CartItem]
     
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class CartItemUpsert(BaseModel):
+    variation_id: int
+    quantity: int = Field(ge=1, description="تعداد نهایی این variation در سبد")
+
+class CartBatch(BaseModel):
+    upserts: List[CartItemUpsert] = []
+    deletes: List[int] = Field(default=[], description="شناسه variationهایی که از سبد حذف می‌شوند")
@@ -1,19 +1,30 @@
-from typing import Optional
-from fastapi import Query
+import base64
+import hashlib
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Query
 from pydantic import BaseModel
+from sqlalchemy import and_, false, or_, tuple_
+from starlette import status
 
 
 class paginationConfig(BaseModel):
     page: int = Query(1, ge=1)
     size: Optional[int] = Query(10, ge=1)
+    cursor: bool = False              # صفحه‌بندی بر اساس کرسر (keyset) به جای offset
+    after: Optional[str] = None       # کرسر دریافتی از next_cursor صفحه قبل
+    with_total: bool = False          # در حالت کرسر، شمارش کل آیتم‌ها فقط در صورت درخواست انجام می‌شود
 
 class Pagination(BaseModel):
     page: int
     size: int
-    total_pages: int
-    total_items: int
-    
-    
+    total_pages: Optional[int] = None
+    total_items: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
     @staticmethod
     def paginate_query(query, page: int, size: int):
         offset = (page - 1) * size
@@ -22,7 +33,143 @@ class Pagination(BaseModel):
         total_pages = (total_items + size - 1) // size
         return paginated_query, total_items, total_pages
 
+    @staticmethod
+    def paginate_keyset(query, keys: Sequence[Tuple[Any, bool]], size: int, after: Optional[str] = None, with_total: bool = False):
+        """
+        Keyset (cursor) pagination.
+
+        `keys` is the ordering as a list of (column, descending) pairs and must end
+        with a unique column (usually the primary key). NULLs of nullable keys sort
+        last in both directions. One extra row is fetched so `keyset_page` can
+        tell whether a next page exists; the count query only runs when
+        `with_total` is set. Cursors carry a signature of `keys`, so a cursor
+        from another ordering is rejected instead of returning the wrong rows.
+        """
+        total_items = query.order_by(None).count() if with_total else None
+        total_pages = (total_items + size - 1) // size if total_items is not None else None
+        if after:
+            query = query.filter(Pagination._after(keys, Pagination.decode_cursor(after, keys)))
+        paginated_query = query.order_by(None).order_by(*Pagination.ordering(keys)).limit(size + 1)
+        return paginated_query, total_items, total_pages
+
+    @staticmethod
+    def keyset_page(rows: list, size: int, row_key: Callable[[Any], Sequence[Any]], keys: Sequence[Tuple[Any, bool]]):
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            next_cursor = Pagination.encode_cursor(row_key(rows[-1]), keys)
+        return rows, next_cursor
+
+    @staticmethod
+    def fetch_page(
+        query,
+        keys: Sequence[Tuple[Any, bool]],
+        row_key: Callable[[Any], Sequence[Any]],
+        page: int = 1,
+        size: int = 10,
+        cursor: bool = False,
+        after: Optional[str] = None,
+        with_total: bool = False,
+    ):
+        """
+        Order `query` by `keys` and return (rows, pagination) either with
+        offset/limit (default) or in cursor mode when `cursor` or `after` is given.
+        """
+        if not (cursor or after):
+            query = query.order_by(*Pagination.ordering(keys))
+            paginated_query, total_items, total_pages = Pagination.paginate_query(query, page, size)
+            rows = paginated_query.all()
+            return rows, Pagination(page=page, size=size, total_items=total_items, total_pages=total_pages)
+
+        paginated_query, total_items, total_pages = Pagination.paginate_keyset(query, keys, size, after, with_total)
+        rows, next_cursor = Pagination.keyset_page(paginated_query.all(), size, row_key, keys)
+        return rows, Pagination(page=page, size=size, total_items=total_items, total_pages=total_pages, next_cursor=next_cursor)
 
+    @staticmethod
+    def ordering(keys: Sequence[Tuple[Any, bool]]) -> list:
+        ordering = []
+        for column, descending in keys:
+            clause = column.desc() if descending else column.asc()
+            # a single NULL placement in both directions, matching `_after`
+            ordering.append(clause.nulls_last() if Pagination._nullable(column) else clause)
+        return ordering
 
+    @staticmethod
+    def sort_signature(keys: Sequence[Tuple[Any, bool]]) -> str:
+        description = ";".join(f"{column}:{'desc' if descending else 'asc'}" for column, descending in keys)
+        return hashlib.sha1(description.encode()).hexdigest()[:12]
+
+    @staticmethod
+    def encode_cursor(values: Sequence[Any], keys: Sequence[Tuple[Any, bool]]) -> str:
+        payload = json.dumps(
+            {"s": Pagination.sort_signature(keys), "v": [Pagination._dump_value(value) for value in values]},
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
 
-    
\ No newline at end of file
+    @staticmethod
+    def decode_cursor(cursor: str, keys: Sequence[Tuple[Any, bool]]) -> List[Any]:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded))
+            signature = payload["s"]
+            values = [Pagination._load_value(value) for value in payload["v"]]
+        except (ValueError, TypeError, ArithmeticError, KeyError):
+            values = None
+        if not values or len(values) != len(keys):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='کرسر صفحه‌بندی معتبر نیست')
+        if signature != Pagination.sort_signature(keys):
+            # کرسر مربوط به مرتب‌سازی دیگری است
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='کرسر صفحه‌بندی با مرتب‌سازی درخواست شده مطابقت ندارد')
+        return values
+
+    @staticmethod
+    def _nullable(column) -> bool:
+        # mapped columns know; other expressions (labels, functions) may be NULL
+        return getattr(getattr(column, "expression", column), "nullable", True)
+
+    @staticmethod
+    def _after(keys: Sequence[Tuple[Any, bool]], values: Sequence[Any]):
+        directions = {descending for _, descending in keys}
+        nullable = any(Pagination._nullable(column) for column, _ in keys)
+        if len(directions) == 1 and not nullable:
+            # same direction on every key: a row comparison can use a composite index
+            left = tuple_(*[column for column, _ in keys])
+            right = tuple_(*values)
+            return left < right if directions.pop() else left > right
+        # NULLs sort last: after a value come the greater/smaller values and then
+        # the NULLs; after a NULL only NULLs remain, which are equal on this key
+        clauses = []
+        for index, (column, descending) in enumerate(keys):
+            equal = [Pagination._equal(keys[i][0], values[i]) for i in range(index)]
+            clauses.append(and_(*equal, Pagination._beyond(column, descending, values[index])))
+        return or_(*clauses)
+
+    @staticmethod
+    def _equal(column, value):
+        return column.is_(None) if value is None else column == value
+
+    @staticmethod
+    def _beyond(column, descending: bool, value):
+        if value is None:
+            return false()
+        beyond = column < value if descending else column > value
+        return or_(beyond, column.is_(None)) if Pagination._nullable(column) else beyond
+
+    @staticmethod
+    def _dump_value(value: Any):
+        if isinstance(value, datetime):
+            return {"dt": value.isoformat()}
+        if isinstance(value, Decimal):
+            return {"dec": str(value)}
+        return value
+
+    @staticmethod
+    def _load_value(value: Any):
+        if isinstance(value, dict):
+            if "dt" in value:
+                return datetime.fromisoformat(value["dt"])
+            if "dec" in value:
+                return Decimal(value["dec"])
+            raise ValueError("unknown cursor value")
+        return value
@@ -116,10 +116,13 @@ class Products(ProductBase):
     var_status: Optional[str] = ''
     categories: Optional[List[SimpleCategory]] = None
 
+class CategoryFacet(SimpleCategory):
+    count: int = 0
+
 class ProductFilters(BaseModel):
     min_price: Optional[int] = 0
     max_price: Optional[int] = 0
-    categories: Optional[List[SimpleCategory]] = None
+    categories: Optional[List[CategoryFacet]] = None
     ordering_options: list[str]
     
 class ProductListData(BaseModel):
@@ -141,6 +144,16 @@ class AttributeSchema(BaseModel):
     name: str
     
 
+class ProductImportError(BaseModel):
+    line: int
+    slug: Optional[str] = None
+    error: str
+
+class ProductImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ProductImportError]
+
 class ProductConfig(BaseModel):
     keyword:Optional[str] = None
     categories: Optional[list[int]] = None
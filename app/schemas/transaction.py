@@ -16,7 +16,7 @@ class TransactionBase(BaseModel):
     status: str
 
 class transaction_order(TransactionBase):
-    order: OrderItemSchema
+    order: Optional[OrderItemSchema] = None
     
     
 class TransactionSchema(TransactionBase):
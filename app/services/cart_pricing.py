@@ -0,0 +1,258 @@
+"""
+Cart pricing engine.
+
+A cart is priced by one query over carts, cart_items, product_variations and
+products: every line total is `sales_price * quantity` computed by the database
+on Numeric values and the cart total is their exact Decimal sum, so nothing is
+accumulated in floats and totals cannot drift from the catalog.
+
+The result is an immutable `PricedCart` snapshot cached per user. CartService
+invalidates it on cart changes and ProductService on price or stock changes of
+the variations in it (tags `cart:<user id>`, `variation:<id>`, `product:<id>`);
+the TTL bounds staleness across workers. Checkout always prices with `fresh=True`.
+Guest carts live in the key-value store and are priced by `price_lines`.
+
+`carts.total_amount` and `cart_items.total_price` are kept as Numeric: the cart
+total at the last change and the line total at the price the customer last
+accepted. Convert them on an existing database and recompute them with:
+
+    python -m services.cart_pricing --migrate
+"""
+import argparse
+from dataclasses import dataclass, field, replace
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+from sqlalchemy import bindparam, text, update
+from sqlalchemy.orm import Session, joinedload
+from core.cache import TTLCache
+from core.cache_bus import cache_bus
+from core.config import settings
+from models.cart import Cart, CartItem
+from models.product import Product, ProductVariation
+
+ZERO = Decimal(0)
+
+SCHEMA_STATEMENTS = [
+    "ALTER TABLE carts ALTER COLUMN total_amount TYPE numeric(20, 0) USING round(total_amount::numeric)",
+    "ALTER TABLE cart_items ALTER COLUMN total_price TYPE numeric(20, 0) USING round(total_price::numeric)",
+]
+
+
+@dataclass(frozen=True)
+class PricedProduct:
+    id: int
+    name: str
+    slug: str
+
+
+@dataclass(frozen=True)
+class PricedVariation:
+    id: int
+    sku: str
+    unit_price: Decimal
+    sales_price: Decimal
+    quantity: int
+    status: str
+    product: PricedProduct
+
+
+@dataclass(frozen=True)
+class PricedItem:
+    id: int
+    quantity: int
+    # line total at the current price
+    total_price: Decimal
+    # line total stored when the customer last added or changed the line
+    accepted_price: Decimal
+    variation: PricedVariation
+
+    @property
+    def variation_id(self) -> int:
+        return self.variation.id
+
+    @property
+    def price_changed(self) -> bool:
+        return self.accepted_price != self.total_price
+
+    @property
+    def in_stock(self) -> bool:
+        return self.variation.quantity >= self.quantity
+
+
+@dataclass(frozen=True)
+class PricedCart:
+    id: int
+    user_id: int
+    cart_items: Tuple[PricedItem, ...] = ()
+    total_amount: Decimal = field(default=ZERO)
+
+    def item(self, item_id: int) -> Optional[PricedItem]:
+        return next((item for item in self.cart_items if item.id == item_id), None)
+
+    def with_items(self, cart_items) -> "PricedCart":
+        cart_items = tuple(cart_items)
+        return replace(self, cart_items=cart_items, total_amount=sum((item.total_price for item in cart_items), ZERO))
+
+    def tags(self):
+        tags = [f"cart:{self.user_id}"]
+        for item in self.cart_items:
+            tags += [f"variation:{item.variation.id}", f"product:{item.variation.product.id}"]
+        return tags
+
+
+def price_line(item_id: int, quantity: int, variation: ProductVariation, accepted_price: Optional[Decimal] = None) -> PricedItem:
+    """Price a line from a loaded variation (with its product)."""
+    product = variation.product
+    total_price = variation.sales_price * quantity
+    return PricedItem(
+        id=item_id,
+        quantity=quantity,
+        total_price=total_price,
+        accepted_price=total_price if accepted_price is None else accepted_price,
+        variation=PricedVariation(
+            id=variation.id,
+            sku=variation.sku,
+            unit_price=variation.unit_price,
+            sales_price=variation.sales_price,
+            quantity=variation.quantity,
+            status=variation.status.value,
+            product=PricedProduct(id=product.id, name=product.name, slug=product.slug),
+        ),
+    )
+
+
+class CartPricing:
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=settings.cart_snapshot_cache_size, ttl=settings.cart_snapshot_ttl)
+
+    def price(self, db: Session, user_id: int, fresh: bool = False) -> Optional[PricedCart]:
+        """The user's priced cart, or None if they have no cart; one query on a cache miss."""
+        user_id = int(user_id)
+        if not fresh:
+            cached = self.cache.get(user_id)
+            if cached is not None:
+                return cached
+        PV = ProductVariation
+        rows = (
+            db.query(
+                Cart.id.label("cart_id"),
+                CartItem.id.label("item_id"),
+                CartItem.quantity,
+                CartItem.total_price.label("accepted_price"),
+                (PV.sales_price * CartItem.quantity).label("line_total"),
+                PV.id.label("variation_id"), PV.sku, PV.unit_price, PV.sales_price,
+                PV.quantity.label("stock"), PV.status,
+                Product.id.label("product_id"), Product.name, Product.slug,
+            )
+            .select_from(Cart)
+            .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+            .outerjoin(PV, PV.id == CartItem.variation_id)
+            .outerjoin(Product, Product.id == PV.product_id)
+            .filter(Cart.user_id == user_id)
+            .order_by(Cart.id, CartItem.id)
+            .all()
+        )
+        if not rows:
+            return None
+        cart_id = rows[0].cart_id
+        items = [
+            PricedItem(
+                id=row.item_id,
+                quantity=row.quantity,
+                total_price=Decimal(row.line_total),
+                accepted_price=Decimal(row.accepted_price),
+                variation=PricedVariation(
+                    id=row.variation_id,
+                    sku=row.sku,
+                    unit_price=row.unit_price,
+                    sales_price=row.sales_price,
+                    quantity=row.stock,
+                    status=row.status.value,
+                    product=PricedProduct(id=row.product_id, name=row.name, slug=row.slug),
+                ),
+            )
+            # a user has one cart; ignore items of duplicates left by older code
+            for row in rows if row.item_id is not None and row.cart_id == cart_id
+        ]
+        return self.store(PricedCart(id=cart_id, user_id=user_id).with_items(items))
+
+    def price_lines(self, db: Session, lines: Dict[int, Tuple[int, Decimal]]) -> PricedCart:
+        """
+        Price lines kept outside the carts table (guest carts), given as
+        {variation id: (quantity, accepted line total)}; one query. Lines use the
+        variation id as item id and variations that no longer exist are dropped.
+        """
+        variations = (
+            db.query(ProductVariation).options(joinedload(ProductVariation.product))
+            .filter(ProductVariation.id.in_(lines)).all()
+        ) if lines else []
+        items = [
+            price_line(variation.id, lines[variation.id][0], variation, lines[variation.id][1])
+            for variation in sorted(variations, key=lambda variation: variation.id)
+        ]
+        return PricedCart(id=0, user_id=0).with_items(items)
+
+    def store(self, priced: PricedCart) -> PricedCart:
+        self.cache.set(priced.user_id, priced, tags=priced.tags())
+        return priced
+
+    def invalidate(self, user_id: int):
+        self.cache.delete(int(user_id))
+
+    def invalidate_tags(self, *tags: str):
+        self.cache.invalidate_tags(*tags)
+
+    def clear(self):
+        self.cache.clear()
+
+    def recompute(self, db: Session, batch_size: int = 500) -> int:
+        """Rewrite every stored cart total and line total from current prices."""
+        last_id, total = 0, 0
+        while True:
+            cart_ids = [cart_id for (cart_id,) in db.query(Cart.id).filter(Cart.id > last_id).order_by(Cart.id).limit(batch_size)]
+            if not cart_ids:
+                return total
+            line_totals: Dict[int, Decimal] = {}
+            items = (
+                db.query(CartItem.id, CartItem.cart_id, ProductVariation.sales_price * CartItem.quantity)
+                .join(ProductVariation, ProductVariation.id == CartItem.variation_id)
+                .filter(CartItem.cart_id.in_(cart_ids))
+                .all()
+            )
+            if items:
+                db.execute(
+                    update(CartItem.__table__).where(CartItem.__table__.c.id == bindparam("item_id")).values(total_price=bindparam("line_total")),
+                    [{"item_id": item_id, "line_total": line_total} for item_id, _, line_total in items],
+                )
+            for _, cart_id, line_total in items:
+                line_totals[cart_id] = line_totals.get(cart_id, ZERO) + line_total
+            db.execute(
+                update(Cart.__table__).where(Cart.__table__.c.id == bindparam("cart_id")).values(total_amount=bindparam("total")),
+                [{"cart_id": cart_id, "total": line_totals.get(cart_id, ZERO)} for cart_id in cart_ids],
+            )
+            db.commit()
+            last_id, total = cart_ids[-1], total + len(cart_ids)
+
+    def ensure_schema(self, db: Session):
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        for statement in SCHEMA_STATEMENTS:
+            db.execute(text(statement))
+        db.commit()
+
+
+cart_pricing = cache_bus.register(CartPricing())
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="convert the cart total columns to numeric and recompute them")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.migrate:
+        with SessionLocal() as session:
+            cart_pricing.ensure_schema(session)
+            print(f"repriced {cart_pricing.recompute(session, args.batch_size)} carts")
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from core.config import settings
+from core.database import SessionLocal
+from core.search import matches, normalize, tokens
+from models import Category, Product, ProductVariation, product_categories
+from models.product import InventoryStatus, ProductType, Status
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ProductFacets:
+    search_text: str
+    min_price: Decimal
+    max_price: Decimal
+    category_ids: FrozenSet[int]
+
+
+class FacetIndex:
+    """
+    In-memory facet index for the storefront listing.
+
+    Holds, for every listable product (published and with at least one in-stock
+    variation, or simple), its normalized search text, its price range and its category ids,
+    so price ranges and category counts for a filter set are answered without
+    touching the database. The index is kept up to date by
+    ProductService.create/update/delete and fully rebuilt every `ttl` seconds (or
+    after `invalidate`) to pick up changes made by other workers.
+
+    Only the first build runs on the request path; concurrent first requests
+    wait for it instead of building their own. Async callers build it with
+    `aensure` on a worker thread before querying from inside `run_sync`, which
+    runs on the event loop where waiting for another build would block the loop.
+    Later rebuilds run on a background thread, one at a time, while queries keep
+    using the current index.
+    """
+
+    def __init__(self, ttl: int, session_factory: Optional[Callable[[], Session]] = None):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._lock = threading.RLock()
+        # held by whichever thread is building, so at most one build runs
+        self._build_lock = threading.Lock()
+        self._products: Dict[int, ProductFacets] = {}
+        self._categories: Dict[int, dict] = {}
+        self._built_at: Optional[float] = None
+        # bumped by invalidate so a build that started earlier does not count as fresh
+        self._generation = 0
+        self._built_generation = -1
+
+    @property
+    def built(self) -> bool:
+        return self._built_at is not None
+
+    def is_stale(self) -> bool:
+        return (
+            self._built_at is None
+            or self._built_generation != self._generation
+            or time.monotonic() - self._built_at > self.ttl
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+
+    def ensure(self, db: Session):
+        if not self.built:
+            if _on_event_loop():
+                # a blocked loop could never finish the build this call would wait for
+                raise RuntimeError("facet index is not built; await facet_index.aensure() before querying from async code")
+            with self._build_lock:
+                if not self.built:
+                    self.rebuild(db)
+            return
+        if self.is_stale() and self._build_lock.acquire(blocking=False):
+            try:
+                threading.Thread(target=self._rebuild_in_background, name="facet-index", daemon=True).start()
+            except Exception:
+                self._build_lock.release()
+                raise
+
+    async def aensure(self):
+        """Build the index on a worker thread (with its own session) if it was never built."""
+        if not self.built:
+            await run_in_threadpool(self._build_once)
+
+    def _build_once(self):
+        with self._build_lock:
+            if not self.built:
+                with self.session_factory() as session:
+                    self.rebuild(session)
+
+    def _rebuild_in_background(self):
+        try:
+            with self.session_factory() as session:
+                self.rebuild(session)
+        except Exception:
+            # the current index is kept and the next query tries again
+            logger.exception("facet index rebuild failed")
+        finally:
+            self._build_lock.release()
+
+    def rebuild(self, db: Session):
+        generation = self._generation
+        products = self._load_products(db)
+        categories = self._load_categories(db)
+        with self._lock:
+            self._products = products
+            self._categories = categories
+            self._built_at = time.monotonic()
+            self._built_generation = generation
+
+    def refresh_product(self, db: Session, product_id: int):
+        if not self.built:
+            # nothing to patch, the next query builds the whole index
+            return
+        facets = self._load_products(db, product_ids=[product_id]).get(product_id)
+        missing = set(facets.category_ids) - set(self._categories) if facets else set()
+        categories = self._load_categories(db, category_ids=missing) if missing else {}
+        with self._lock:
+            self._categories.update(categories)
+            if facets:
+                self._products[product_id] = facets
+            else:
+                self._products.pop(product_id, None)
+
+    def remove_product(self, product_id: int):
+        with self._lock:
+            self._products.pop(product_id, None)
+
+    def query(
+        self,
+        db: Session,
+        keyword: Optional[str] = None,
+        categories: Optional[List[int]] = None,
+        price_min: Optional[int] = None,
+        price_max: Optional[int] = None,
+    ) -> dict:
+        """
+        Price range and category counts for the given filter set.
+
+        The price range ignores the price filter itself so the client can widen it
+        again; category counts are computed over products matching every filter.
+        """
+        self.ensure(db)
+        terms = tokens(keyword)
+        required = set(categories or [])
+
+        with self._lock:
+            products = list(self._products.values())
+            category_map = dict(self._categories)
+
+        min_price = max_price = None
+        counts: Dict[int, int] = {}
+        for facets in products:
+            if terms and not matches(terms, facets.search_text):
+                continue
+            if required and not required.issubset(facets.category_ids):
+                continue
+            if min_price is None or facets.min_price < min_price:
+                min_price = facets.min_price
+            if max_price is None or facets.max_price > max_price:
+                max_price = facets.max_price
+            # listing filters on the cheapest listable variation
+            if price_min is not None and facets.min_price < price_min:
+                continue
+            if price_max is not None and facets.min_price > price_max:
+                continue
+            for category_id in facets.category_ids:
+                counts[category_id] = counts.get(category_id, 0) + 1
+
+        category_facets = [
+            {**category_map[category_id], "count": count}
+            for category_id, count in counts.items()
+            if category_id in category_map
+        ]
+        category_facets.sort(key=lambda item: (-item["count"], item["name"]))
+
+        return {
+            "min_price": min_price,
+            "max_price": max_price,
+            "categories": category_facets,
+        }
+
+    def _load_products(self, db: Session, product_ids: Optional[Iterable[int]] = None) -> Dict[int, ProductFacets]:
+        P = Product
+        PV = ProductVariation
+
+        product_query = db.query(P.id, P.name, P.search_text, P.type).filter(P.status == Status.PUBLISHED)
+        variation_query = (
+            db.query(PV.product_id, PV.sales_price, PV.status)
+            .join(P, P.id == PV.product_id)
+            .filter(P.status == Status.PUBLISHED)
+        )
+        category_query = db.query(product_categories.c.product_id, product_categories.c.category_id)
+        if product_ids is not None:
+            product_ids = list(product_ids)
+            product_query = product_query.filter(P.id.in_(product_ids))
+            variation_query = variation_query.filter(PV.product_id.in_(product_ids))
+            category_query = category_query.filter(product_categories.c.product_id.in_(product_ids))
+
+        # same document the database search matches against; the name alone until it is indexed
+        product_types = {
+            product_id: (search_text or normalize(name), product_type)
+            for product_id, name, search_text, product_type in product_query
+        }
+
+        prices: Dict[int, List[Decimal]] = {}
+        for product_id, sales_price, var_status in variation_query:
+            _, product_type = product_types.get(product_id, (None, None))
+            if var_status == InventoryStatus.INSTOCK or product_type == ProductType.SIMPLE:
+                prices.setdefault(product_id, []).append(sales_price)
+
+        category_ids: Dict[int, set] = {}
+        for product_id, category_id in category_query:
+            category_ids.setdefault(product_id, set()).add(category_id)
+
+        return {
+            product_id: ProductFacets(
+                search_text=product_types[product_id][0],
+                min_price=min(product_prices),
+                max_price=max(product_prices),
+                category_ids=frozenset(category_ids.get(product_id, ())),
+            )
+            for product_id, product_prices in prices.items()
+            if product_id in product_types
+        }
+
+    def _load_categories(self, db: Session, category_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+        query = db.query(Category.id, Category.name, Category.slug, Category.type, Category.parent_id)
+        if category_ids is not None:
+            query = query.filter(Category.id.in_(list(category_ids)))
+        return {
+            row.id: {
+                "id": row.id,
+                "name": row.name,
+                "slug": row.slug,
+                "type": row.type,
+                "parent_id": row.parent_id,
+            }
+            for row in query
+        }
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+facet_index = FacetIndex(ttl=settings.facet_index_ttl, session_factory=SessionLocal)
@@ -0,0 +1,381 @@
+"""
+Bulk product import and export for the admin catalog.
+
+Import reads a JSONL file (one ProductCreate document per line) or a CSV file (one
+variation per row, rows of the same product consecutive) as a stream and handles
+it in batches. Each batch checks slugs, SKUs, categories and attributes with one
+query apiece and writes every table with one multi-row INSERT. Valid products of a
+batch are committed together; invalid ones are reported by line and skipped.
+
+Export streams the catalog in the same formats, so an export can be edited and
+imported into another database. JSONL is lossless; CSV only carries attributes
+that are used by a variation.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, selectinload
+from models import Attribute, Category, File, Product, ProductAttribute, ProductVariation, VariationAttribute, product_categories
+from models.product import InventoryStatus, ProductType, Status
+from core.cache_bus import cache_bus
+from schemas.product import ProductCreate
+from services.facet_index import facet_index
+from services.product_search import product_search
+from services.product_summary import product_summary
+
+CSV_COLUMNS = [
+    "slug", "name", "description", "body", "featured", "status", "category_ids",
+    "sku", "cost_price", "unit_price", "sales_price", "quantity", "low_stock_threshold", "weight",
+    "variation_status", "attributes",
+]
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def error(self, line: int, slug: Optional[str], message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "slug": slug, "error": message})
+
+
+class ProductBulkService:
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+
+    # ----- import -----
+
+    def import_file(self, db: Session, file: IO[bytes], file_format: str, current_user: str) -> ImportReport:
+        report = ImportReport()
+        seen_slugs, seen_skus = set(), set()
+        documents = self._read_jsonl(file) if file_format == "jsonl" else self._read_csv(file)
+        batch: List[Tuple[int, ProductCreate]] = []
+        for line, document in documents:
+            if isinstance(document, str):
+                report.error(line, None, document)
+                continue
+            try:
+                product_in = ProductCreate.model_validate(document)
+            except ValidationError as error:
+                first = error.errors(include_url=False, include_input=False)[0]
+                slug = document.get("slug") if isinstance(document, dict) else None
+                report.error(line, slug, f"{'.'.join(str(part) for part in first['loc'])}: {first['msg']}")
+                continue
+            batch.append((line, product_in))
+            if len(batch) >= self.batch_size:
+                self._import_batch(db, batch, int(current_user), report, seen_slugs, seen_skus)
+                batch = []
+        if batch:
+            self._import_batch(db, batch, int(current_user), report, seen_slugs, seen_skus)
+        if report.imported:
+            facet_index.invalidate()
+            cache_bus.broadcast("products")
+        return report
+
+    def _import_batch(self, db: Session, batch, user_id: int, report: ImportReport, seen_slugs: set, seen_skus: set):
+        slugs = [product_in.slug for _, product_in in batch]
+        skus = [var.sku for _, product_in in batch for var in product_in.variations]
+        category_ids = {cat_id for _, product_in in batch for cat_id in product_in.category_ids}
+        attribute_ids = {attr.attribute_id for _, product_in in batch for attr in product_in.attributes}
+        attribute_ids |= {va.attribute_id for _, product_in in batch for var in product_in.variations for va in var.variation_attributes}
+
+        existing_slugs = {slug for (slug,) in db.query(Product.slug).filter(Product.slug.in_(slugs))}
+        existing_skus = {sku for (sku,) in db.query(ProductVariation.sku).filter(ProductVariation.sku.in_(skus))} if skus else set()
+        known_categories = {cat_id for (cat_id,) in db.query(Category.id).filter(Category.id.in_(category_ids))} if category_ids else set()
+        known_attributes = {attr_id for (attr_id,) in db.query(Attribute.id).filter(Attribute.id.in_(attribute_ids))} if attribute_ids else set()
+
+        valid: List[ProductCreate] = []
+        for line, product_in in batch:
+            error = self._validate(product_in, existing_slugs | seen_slugs, existing_skus | seen_skus, known_categories, known_attributes)
+            if error:
+                report.error(line, product_in.slug, error)
+                continue
+            seen_slugs.add(product_in.slug)
+            seen_skus.update(var.sku for var in product_in.variations)
+            valid.append(product_in)
+        if not valid:
+            return
+
+        try:
+            product_ids = self._insert(db, valid, user_id)
+            product_search.refresh(db, product_ids)
+            product_summary.refresh(db, product_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        report.imported += len(valid)
+
+    def _validate(self, product_in: ProductCreate, taken_slugs: set, taken_skus: set, categories: set, attributes: set) -> Optional[str]:
+        if product_in.slug in taken_slugs:
+            return 'لینک ارسالی تکراری می باشد'
+        if not product_in.variations:
+            return 'محصول باید حداقل یک متغیر داشته باشد'
+        if product_in.status not in Status.__members__:
+            return f'وضعیت {product_in.status} معتبر نیست'
+        skus = [var.sku for var in product_in.variations]
+        duplicated = next((sku for sku in skus if sku in taken_skus or skus.count(sku) > 1), None)
+        if duplicated:
+            return f'متفیر با شناسه {duplicated} تکراری می باشد'
+        invalid_status = next((var.status for var in product_in.variations if var.status not in InventoryStatus.__members__), None)
+        if invalid_status:
+            return f'وضعیت {invalid_status} معتبر نیست'
+        missing_category = next((cat_id for cat_id in product_in.category_ids if cat_id not in categories), None)
+        if missing_category is not None:
+            return f'دسته‌بندی {missing_category} پیدا نشد'
+        used_attributes = [attr.attribute_id for attr in product_in.attributes]
+        used_attributes += [va.attribute_id for var in product_in.variations for va in var.variation_attributes]
+        missing_attribute = next((attr_id for attr_id in used_attributes if attr_id not in attributes), None)
+        if missing_attribute is not None:
+            return f'ویژگی {missing_attribute} پیدا نشد'
+        return None
+
+    def _insert(self, db: Session, products: List[ProductCreate], user_id: int) -> List[int]:
+        """Insert a validated batch with one multi-row INSERT per table, returns the product ids."""
+        rows = db.execute(
+            insert(Product).returning(Product.id, Product.slug, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": user_id,
+                    "name": product_in.name,
+                    "slug": product_in.slug,
+                    "type": ProductType.VARIABLE if len(product_in.variations) > 1 else ProductType.SIMPLE,
+                    "description": product_in.description,
+                    "body": product_in.body,
+                    "featured": product_in.featured,
+                    "status": Status[product_in.status],
+                }
+                for product_in in products
+            ],
+        ).all()
+        product_ids = {slug: product_id for product_id, slug in rows}
+
+        category_rows = [
+            {"product_id": product_ids[product_in.slug], "category_id": cat_id}
+            for product_in in products for cat_id in dict.fromkeys(product_in.category_ids)
+        ]
+        if category_rows:
+            db.execute(insert(product_categories), category_rows)
+
+        file_rows = [
+            {**image.model_dump(), "entity_type": "product", "entity_id": product_ids[product_in.slug]}
+            for product_in in products for image in product_in.files
+        ]
+        if file_rows:
+            db.execute(insert(File), file_rows)
+
+        # product attributes: the declared ones plus any only used by a variation
+        attribute_keys: Dict[Tuple[int, int, str], bool] = {}
+        for product_in in products:
+            product_id = product_ids[product_in.slug]
+            for attr in product_in.attributes:
+                attribute_keys[(product_id, attr.attribute_id, attr.value)] = attr.show_top
+            for var in product_in.variations:
+                for va in var.variation_attributes:
+                    attribute_keys.setdefault((product_id, va.attribute_id, va.value), False)
+        product_attribute_ids = {}
+        if attribute_keys:
+            attribute_rows = db.execute(
+                insert(ProductAttribute).returning(
+                    ProductAttribute.id, ProductAttribute.product_id, ProductAttribute.attribute_id, ProductAttribute.value,
+                    sort_by_parameter_order=True,
+                ),
+                [
+                    {"product_id": product_id, "attribute_id": attribute_id, "value": value, "show_top": show_top}
+                    for (product_id, attribute_id, value), show_top in attribute_keys.items()
+                ],
+            ).all()
+            product_attribute_ids = {(row.product_id, row.attribute_id, row.value): row.id for row in attribute_rows}
+
+        variation_rows = db.execute(
+            insert(ProductVariation).returning(ProductVariation.id, ProductVariation.sku, sort_by_parameter_order=True),
+            [
+                {
+                    "product_id": product_ids[product_in.slug],
+                    "sku": var.sku,
+                    "cost_price": var.cost_price,
+                    "unit_price": var.unit_price,
+                    "sales_price": var.sales_price,
+                    "quantity": var.quantity,
+                    "reserved_quantity": 0,
+                    "low_stock_threshold": var.low_stock_threshold,
+                    "weight": var.weight,
+                    "status": InventoryStatus[var.status],
+                }
+                for product_in in products for var in product_in.variations
+            ],
+        ).all()
+        variation_ids = {sku: variation_id for variation_id, sku in variation_rows}
+
+        variation_attribute_rows = [
+            {
+                "product_variation_id": variation_ids[var.sku],
+                "product_attribute_id": product_attribute_ids[(product_ids[product_in.slug], va.attribute_id, va.value)],
+            }
+            for product_in in products for var in product_in.variations for va in var.variation_attributes
+        ]
+        if variation_attribute_rows:
+            db.execute(insert(VariationAttribute), variation_attribute_rows)
+
+        return list(product_ids.values())
+
+    def _read_jsonl(self, file: IO[bytes]) -> Iterator[Tuple[int, object]]:
+        for line, raw in enumerate(io.TextIOWrapper(file, encoding="utf-8-sig"), start=1):
+            if not raw.strip():
+                continue
+            try:
+                yield line, json.loads(raw)
+            except ValueError:
+                yield line, 'سطر JSON معتبر نیست'
+
+    def _read_csv(self, file: IO[bytes]) -> Iterator[Tuple[int, object]]:
+        """Group consecutive rows of the same slug into one ProductCreate document."""
+        reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+        document, first_line = None, None
+        for row in reader:
+            line = reader.line_num
+            if document is not None and row.get("slug") == document["slug"]:
+                self._add_csv_variation(document, row)
+                continue
+            if document is not None:
+                yield first_line, document
+            document, first_line = self._csv_product(row), line
+            self._add_csv_variation(document, row)
+        if document is not None:
+            yield first_line, document
+
+    def _csv_product(self, row: dict) -> dict:
+        return {
+            "slug": row.get("slug"),
+            "name": row.get("name"),
+            "description": row.get("description") or None,
+            "body": row.get("body") or None,
+            "featured": (row.get("featured") or "").strip().lower() in ("1", "true", "yes"),
+            "status": row.get("status"),
+            "category_ids": [cat_id for cat_id in (row.get("category_ids") or "").split("|") if cat_id.strip()],
+            "attributes": [],
+            "files": [],
+            "variations": [],
+        }
+
+    def _add_csv_variation(self, document: dict, row: dict):
+        variation_attributes = []
+        for pair in (row.get("attributes") or "").split("|"):
+            if ":" in pair:
+                attribute_id, value = pair.split(":", 1)
+                variation_attributes.append({"attribute_id": attribute_id.strip(), "value": value.strip()})
+        document["variations"].append({
+            "sku": row.get("sku"),
+            "cost_price": row.get("cost_price") or 0,
+            "unit_price": row.get("unit_price"),
+            "sales_price": row.get("sales_price"),
+            "quantity": row.get("quantity") or 0,
+            "low_stock_threshold": row.get("low_stock_threshold") or 5,
+            "weight": row.get("weight") or None,
+            "status": row.get("variation_status"),
+            "variation_attributes": variation_attributes,
+        })
+
+    # ----- export -----
+
+    def export(self, db: Session, file_format: str) -> Iterator[str]:
+        """Stream every product as JSONL lines or CSV rows, loading `batch_size` products at a time."""
+        if file_format == "csv":
+            yield self._csv_line(CSV_COLUMNS)
+        for products in self._product_batches(db):
+            for product in products:
+                if file_format == "csv":
+                    for row in self._csv_rows(product):
+                        yield self._csv_line(row)
+                else:
+                    yield json.dumps(self._document(product), ensure_ascii=False) + "\n"
+            # drop the batch from the identity map before loading the next one
+            db.expunge_all()
+
+    def _product_batches(self, db: Session) -> Iterator[List[Product]]:
+        last_id = 0
+        while True:
+            products = (
+                db.query(Product)
+                .options(
+                    selectinload(Product.categories),
+                    selectinload(Product.files),
+                    selectinload(Product.attributes),
+                    selectinload(Product.variations)
+                        .selectinload(ProductVariation.variation_attributes)
+                        .joinedload(VariationAttribute.product_attribute),
+                )
+                .filter(Product.id > last_id)
+                .order_by(Product.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not products:
+                return
+            last_id = products[-1].id
+            yield products
+
+    def _document(self, product: Product) -> dict:
+        return {
+            "slug": product.slug,
+            "name": product.name,
+            "description": product.description,
+            "body": product.body,
+            "featured": bool(product.featured),
+            "status": product.status.name,
+            "category_ids": [category.id for category in product.categories],
+            "attributes": [
+                {"attribute_id": attr.attribute_id, "value": attr.value, "show_top": bool(attr.show_top)}
+                for attr in product.attributes
+            ],
+            "files": [
+                {"url": file.url, "alt": file.alt, "is_thumbnail": bool(file.is_thumbnail), "order": file.order, "type": file.type}
+                for file in product.files
+            ],
+            "variations": [
+                {
+                    "sku": var.sku,
+                    "cost_price": int(var.cost_price or 0),
+                    "unit_price": int(var.unit_price),
+                    "sales_price": int(var.sales_price),
+                    "quantity": var.quantity,
+                    "low_stock_threshold": var.low_stock_threshold,
+                    "weight": var.weight,
+                    "status": var.status.name,
+                    "variation_attributes": [
+                        {"attribute_id": va.product_attribute.attribute_id, "value": va.product_attribute.value}
+                        for va in var.variation_attributes
+                    ],
+                }
+                for var in product.variations
+            ],
+        }
+
+    def _csv_rows(self, product: Product) -> Iterable[list]:
+        document = self._document(product)
+        for var in document["variations"]:
+            yield [
+                document["slug"], document["name"], document["description"] or "", document["body"] or "",
+                "true" if document["featured"] else "false", document["status"],
+                "|".join(str(cat_id) for cat_id in document["category_ids"]),
+                var["sku"], var["cost_price"], var["unit_price"], var["sales_price"], var["quantity"],
+                var["low_stock_threshold"], var["weight"] if var["weight"] is not None else "", var["status"],
+                "|".join(f"{va['attribute_id']}:{va['value']}" for va in var["variation_attributes"]),
+            ]
+
+    def _csv_line(self, row: list) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(row)
+        return buffer.getvalue()
+
+
+product_bulk = ProductBulkService()
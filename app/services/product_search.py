@@ -0,0 +1,132 @@
+"""
+Full-text product search.
+
+Every product keeps a normalized search document (name, description and attribute
+values) in `products.search_text` and, on Postgres, a weighted `tsvector` in
+`products.search_vector` behind a GIN index, so keyword searches are index lookups
+ranked with ts_rank_cd instead of `ilike '%...%'` scans. Documents are refreshed by
+ProductService.create/update in the same transaction as the change.
+
+Prepare an existing database (columns, pg_trgm, indexes) and backfill every product:
+
+    python -m services.product_search --reindex
+"""
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Text, bindparam, cast, func, literal, text, update
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Query, Session
+from core.search import normalize, prefix_tsquery, tokens
+from models.product import Product, ProductAttribute
+
+# no stemming: Postgres ships no Persian dictionary and prefix matching covers suffixes
+SEARCH_CONFIG = cast(literal("simple"), REGCONFIG)
+
+SCHEMA_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_text text",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_product_variations_sku_trgm ON product_variations USING gin (sku gin_trgm_ops)",
+]
+
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+class ProductSearch:
+
+    def refresh(self, db: Session, product_ids: Iterable[int]):
+        """Rebuild the search documents of the given products; flush pending changes first."""
+        documents = self._documents(db, list(product_ids))
+        if not documents:
+            return
+        table = Product.__table__
+        values = {"search_text": bindparam("document", type_=Text)}
+        if _is_postgres(db):
+            weighted = [
+                func.setweight(func.to_tsvector(SEARCH_CONFIG, bindparam(name, type_=Text)), weight)
+                for name, weight in (("name_text", "A"), ("description_text", "B"), ("attribute_text", "C"))
+            ]
+            values["search_vector"] = weighted[0].op("||")(weighted[1]).op("||")(weighted[2])
+        statement = update(table).where(table.c.id == bindparam("product_id")).values(**values)
+        db.execute(statement, [
+            {
+                "product_id": product_id,
+                "document": " ".join(part for part in parts if part),
+                "name_text": parts[0],
+                "description_text": parts[1],
+                "attribute_text": parts[2],
+            }
+            for product_id, parts in documents.items()
+        ])
+
+    def apply(self, query: Query, keyword: Optional[str]) -> Tuple[Query, Optional[object]]:
+        """
+        Filter `query` to products matching every keyword term (as a word prefix).
+        Returns the filtered query and a relevance expression to order by, or None
+        when the database has no ranking (SQLite stand-in).
+        """
+        terms = tokens(keyword)
+        if not terms:
+            return query, None
+        if _is_postgres(query.session):
+            ts_query = func.to_tsquery(SEARCH_CONFIG, prefix_tsquery(keyword))
+            return query.filter(Product.search_vector.op("@@")(ts_query)), func.ts_rank_cd(Product.search_vector, ts_query)
+        for term in terms:
+            query = query.filter(Product.search_text.contains(term))
+        return query, None
+
+    def reindex(self, db: Session, batch_size: int = 500) -> int:
+        last_id, total = 0, 0
+        while True:
+            product_ids = [
+                product_id for (product_id,) in
+                db.query(Product.id).filter(Product.id > last_id).order_by(Product.id).limit(batch_size)
+            ]
+            if not product_ids:
+                return total
+            self.refresh(db, product_ids)
+            db.commit()
+            last_id, total = product_ids[-1], total + len(product_ids)
+
+    def ensure_schema(self, db: Session):
+        if not _is_postgres(db):
+            return
+        for statement in SCHEMA_STATEMENTS:
+            db.execute(text(statement))
+        db.commit()
+
+    def _documents(self, db: Session, product_ids: List[int]) -> Dict[int, Tuple[str, str, str]]:
+        if not product_ids:
+            return {}
+        attributes: Dict[int, List[str]] = {}
+        attribute_rows = (
+            db.query(ProductAttribute.product_id, ProductAttribute.value)
+            .filter(ProductAttribute.product_id.in_(product_ids))
+            .order_by(ProductAttribute.id)
+        )
+        for product_id, value in attribute_rows:
+            attributes.setdefault(product_id, []).append(normalize(value))
+        return {
+            product_id: (normalize(name), normalize(description), " ".join(attributes.get(product_id, [])))
+            for product_id, name, description in
+            db.query(Product.id, Product.name, Product.description).filter(Product.id.in_(product_ids))
+        }
+
+
+product_search = ProductSearch()
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reindex", action="store_true", help="prepare the schema and rebuild every search document")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.reindex:
+        with SessionLocal() as session:
+            product_search.ensure_schema(session)
+            print(f"indexed {product_search.reindex(session, args.batch_size)} products")
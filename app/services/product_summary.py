@@ -0,0 +1,111 @@
+"""
+Maintained per-product listing summary (`product_summaries`).
+
+Storefront and admin listings read the cheapest variation of every product from
+this table instead of ranking all variations per request, so filtering and
+sorting by price are index lookups. ProductService keeps it current: `refresh`
+after product/variation changes (price, status, type), `sync_stock` after
+quantity-only changes such as reservations.
+
+Create the table on an existing database and fill it:
+
+    python -m services.product_summary --rebuild
+"""
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, List
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+from models.product import InventoryStatus, Product, ProductSummary, ProductType, ProductVariation
+
+
+class ProductSummaryService:
+
+    def refresh(self, db: Session, product_ids: Iterable[int]):
+        """Recompute the summaries of the given products; flush pending changes first."""
+        product_ids = list(set(product_ids))
+        if not product_ids:
+            return
+        PV = ProductVariation
+        rows = (
+            db.query(PV.id, PV.product_id, PV.sku, PV.unit_price, PV.sales_price, PV.quantity, PV.reserved_quantity, PV.status, Product.type)
+            .join(Product, Product.id == PV.product_id)
+            .filter(PV.product_id.in_(product_ids))
+            .order_by(PV.product_id, PV.sales_price, PV.id)
+        )
+        summaries: Dict[int, dict] = {}
+        now = datetime.now()
+        for row in rows:
+            summary = summaries.get(row.product_id)
+            if summary is None:
+                # rows come cheapest first, so the first one is the overall minimum
+                summary = summaries[row.product_id] = {
+                    "product_id": row.product_id,
+                    "variation_id": None,
+                    "sku": None,
+                    "unit_price": None,
+                    "sales_price": None,
+                    "quantity": None,
+                    "reserved_quantity": None,
+                    "status": None,
+                    "min_variation_id": row.id,
+                    "min_sales_price": row.sales_price,
+                    "updated_at": now,
+                }
+            listable = row.status == InventoryStatus.INSTOCK or row.type == ProductType.SIMPLE
+            if summary["variation_id"] is None and listable:
+                summary.update(
+                    variation_id=row.id,
+                    sku=row.sku,
+                    unit_price=row.unit_price,
+                    sales_price=row.sales_price,
+                    quantity=row.quantity,
+                    reserved_quantity=row.reserved_quantity,
+                    status=row.status,
+                )
+
+        db.execute(delete(ProductSummary).where(ProductSummary.product_id.in_(product_ids)))
+        if summaries:
+            db.execute(insert(ProductSummary), list(summaries.values()))
+
+    def sync_stock(self, db: Session, variation_ids: Iterable[int]):
+        """Copy quantity and reserved quantity of the given variations into their summaries."""
+        variation_ids = list(set(variation_ids))
+        if not variation_ids:
+            return
+        PV = ProductVariation
+        db.execute(
+            update(ProductSummary)
+            .where(ProductSummary.variation_id == PV.id, PV.id.in_(variation_ids))
+            .values(quantity=PV.quantity, reserved_quantity=PV.reserved_quantity, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+
+    def rebuild(self, db: Session, batch_size: int = 500) -> int:
+        last_id, total = 0, 0
+        while True:
+            product_ids: List[int] = [
+                product_id for (product_id,) in
+                db.query(Product.id).filter(Product.id > last_id).order_by(Product.id).limit(batch_size)
+            ]
+            if not product_ids:
+                return total
+            self.refresh(db, product_ids)
+            db.commit()
+            last_id, total = product_ids[-1], total + len(product_ids)
+
+
+product_summary = ProductSummaryService()
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="create the table if missing and recompute every summary")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.rebuild:
+        ProductSummary.__table__.create(engine, checkfirst=True)
+        with SessionLocal() as session:
+            print(f"summarized {product_summary.rebuild(session, args.batch_size)} products")
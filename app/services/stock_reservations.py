@@ -0,0 +1,187 @@
+"""
+Stock reservation ledger.
+
+ProductService.reserve_quantities moves units from `quantity` to
+`reserved_quantity` and records each reservation here with an expiry
+(PENDING_ORDER_TTL seconds). A reservation then ends in one of two ways:
+
+* committed when its order is paid: the units leave `reserved_quantity`. A
+  payment that arrives after the order's reservations were released finds
+  nothing to commit; OrderService.finalize_order then leaves the order
+  cancelled and the payment is credited back to the customer's wallet
+* released when it expires: the units go back to `quantity` and its order, if
+  still pending, is cancelled
+
+Both are single set-based statements. A release batch locks up to `batch_size`
+expired reservations (`FOR UPDATE SKIP LOCKED`, so concurrent sweepers split
+the work), marks them released, returns their units per variation and cancels
+their pending orders, all in one data-modifying CTE. Batch time, released
+reservations and released units are exported at /metrics.
+
+Create the table and record the reservations of pending orders placed before
+the ledger existed with:
+
+    python -m services.stock_reservations --migrate
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Integer, cast, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.metrics import registry
+from models.order import Order, OrderItem, OrderStatus
+from models.product import ProductVariation, ReservationStatus, StockReservation
+
+release_seconds = registry.histogram(
+    "stock_reservation_release_seconds",
+    "Time of one expired reservation release batch",
+)
+released_reservations = registry.counter(
+    "stock_reservations_released_total",
+    "Expired reservations released",
+)
+released_units = registry.counter(
+    "stock_reservation_released_units_total",
+    "Reserved units returned to sellable stock",
+)
+
+# (variation id, units, reservations) released by one batch
+Released = Tuple[int, int, int]
+
+
+class StockReservations:
+
+    def record(self, db: Session, quantities: Dict[int, int], order_id: Optional[int] = None, ttl: Optional[int] = None):
+        """Record reservations already applied to the variations; the caller commits."""
+        if not quantities:
+            return
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=ttl or settings.pending_order_ttl)
+        db.execute(insert(StockReservation), [
+            {
+                "variation_id": variation_id,
+                "order_id": order_id,
+                "quantity": quantity,
+                "status": ReservationStatus.ACTIVE,
+                "expires_at": expires_at,
+                "created_at": now,
+            }
+            for variation_id, quantity in quantities.items()
+        ])
+
+    def commit(self, db: Session, order_id: int) -> Dict[int, int]:
+        """Commit the order's active reservations; returns the committed units per variation. The caller commits."""
+        R, PV = StockReservation, ProductVariation
+        committed = (
+            update(R)
+            .where(R.order_id == order_id, R.status == ReservationStatus.ACTIVE)
+            .values(status=ReservationStatus.COMMITTED, closed_at=datetime.now())
+            .returning(R.variation_id, R.quantity)
+            .cte("committed")
+        )
+        totals = (
+            select(committed.c.variation_id, func.sum(committed.c.quantity).label("quantity"))
+            .group_by(committed.c.variation_id)
+            .cte("totals")
+        )
+        unreserved = (
+            update(PV)
+            .where(PV.id == totals.c.variation_id)
+            .values(reserved_quantity=func.greatest(PV.reserved_quantity - totals.c.quantity, 0))
+            .cte("unreserved")
+        )
+        rows = db.execute(select(totals.c.variation_id, totals.c.quantity).add_cte(unreserved)).all()
+        return {row.variation_id: int(row.quantity) for row in rows}
+
+    def release_expired(self, db: Session, batch_size: int = 500) -> List[Released]:
+        """Release one batch of expired reservations in one statement; the caller commits."""
+        R, PV = StockReservation, ProductVariation
+        now = datetime.now()
+        started = time.perf_counter()
+        expired = (
+            select(R.id)
+            .where(R.status == ReservationStatus.ACTIVE, R.expires_at < now)
+            .order_by(R.expires_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        released = (
+            update(R)
+            .where(R.id.in_(expired))
+            .values(status=ReservationStatus.RELEASED, closed_at=now)
+            .returning(R.variation_id, R.quantity, R.order_id)
+            .cte("released")
+        )
+        totals = (
+            select(
+                released.c.variation_id,
+                func.sum(released.c.quantity).label("quantity"),
+                func.count().label("reservations"),
+            )
+            .group_by(released.c.variation_id)
+            .cte("totals")
+        )
+        restocked = (
+            update(PV)
+            .where(PV.id == totals.c.variation_id)
+            .values(
+                quantity=PV.quantity + totals.c.quantity,
+                reserved_quantity=func.greatest(PV.reserved_quantity - totals.c.quantity, 0),
+            )
+            .cte("restocked")
+        )
+        cancelled = (
+            update(Order)
+            .where(Order.id.in_(select(released.c.order_id)), Order.status == OrderStatus.PENDING)
+            .values(status=OrderStatus.CANCELED, updated_at=now)
+            .cte("cancelled")
+        )
+        # data-modifying CTEs run once whether or not the outer select reads them
+        rows = db.execute(
+            select(totals.c.variation_id, totals.c.quantity, totals.c.reservations).add_cte(restocked, cancelled)
+        ).all()
+        release_seconds.observe(time.perf_counter() - started)
+        if rows:
+            released_reservations.inc(sum(row.reservations for row in rows))
+            released_units.inc(sum(row.quantity for row in rows))
+        return [(row.variation_id, row.quantity, row.reservations) for row in rows]
+
+    def backfill(self, db: Session) -> int:
+        """Record the reservations of pending orders that have none; returns the rows added."""
+        R = StockReservation
+        variation_id = cast(OrderItem.product_metadata, Integer)
+        missing = (
+            select(
+                variation_id,
+                Order.id,
+                func.sum(OrderItem.quantity),
+                literal(ReservationStatus.ACTIVE, R.status.type),
+                Order.created_at + timedelta(seconds=settings.pending_order_ttl),
+                literal(datetime.now()),
+            )
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .where(Order.status == OrderStatus.PENDING, ~select(R.id).where(R.order_id == Order.id).exists())
+            .group_by(variation_id, Order.id, Order.created_at)
+        )
+        result = db.execute(
+            insert(R).from_select(["variation_id", "order_id", "quantity", "status", "expires_at", "created_at"], missing)
+        )
+        db.commit()
+        return result.rowcount
+
+
+stock_reservations = StockReservations()
+
+
+if __name__ == "__main__":
+    from core.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="create the table if missing and record reservations of pending orders")
+    args = parser.parse_args()
+    if args.migrate:
+        StockReservation.__table__.create(engine, checkfirst=True)
+        with SessionLocal() as session:
+            print(f"recorded {stock_reservations.backfill(session)} reservations")
@@ -0,0 +1,255 @@
+"""
+Database-backed background jobs.
+
+Jobs are rows in the `jobs` table. Every runner (a thread in each web worker
+when JOB_RUNNER is on, or a dedicated `python -m tasks.runner` process) polls it
+every JOB_POLL_INTERVAL seconds and claims due jobs with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so each job runs exactly once however many
+runners there are. Claimed jobs get a lease; a job whose runner died is picked
+up again once the lease expires.
+
+Each run gets a fresh session. A failing job is retried with exponential backoff
+up to `max_attempts`. Periodic jobs (`every=`) keep one queued occurrence,
+guarded by the unique `dedupe_key`, and queue the next one when a run finishes.
+
+    @job_runner.job("orders.expire_reservations", every=timedelta(minutes=5))
+    def expire_reservations(db: Session, payload: dict): ...
+
+    job_runner.enqueue(db, "orders.expire_reservations", payload={...})
+
+Create the table once with:
+
+    python -m tasks.runner --migrate
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.database import SessionLocal, engine
+from core.metrics import registry
+from models.job import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# modules whose jobs every runner registers
+TASK_MODULES = ["tasks.order_tasks"]
+
+RETRY_BACKOFF = timedelta(seconds=30)
+
+job_runs = registry.counter(
+    "job_runs_total",
+    "Background job runs by result (done, retry, failed)",
+    ["job", "result"],
+)
+job_duration = registry.histogram(
+    "job_duration_seconds",
+    "Background job run time",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+Handler = Callable[[Session, dict], None]
+# (id, name, payload, attempts) of a claimed job
+Claimed = Tuple[int, str, dict, int]
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    name: str
+    handler: Handler
+    every: Optional[timedelta] = None
+    max_attempts: int = 3
+    # a run longer than this is considered dead and the job is claimed again
+    lease: timedelta = timedelta(minutes=10)
+
+
+class JobRunner:
+
+    def __init__(self, session_factory=SessionLocal, poll_interval: float = settings.job_poll_interval, batch_size: int = 10):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs: Dict[str, JobSpec] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def job(self, name: str, every: Optional[timedelta] = None, max_attempts: int = 3, lease: timedelta = timedelta(minutes=10)):
+        """Register the decorated function as the handler of job `name`."""
+        def register(handler: Handler) -> Handler:
+            self._jobs[name] = JobSpec(name, handler, every, max_attempts, lease)
+            return handler
+        return register
+
+    def enqueue(self, db: Session, name: str, payload: Optional[dict] = None, run_at: Optional[datetime] = None,
+                dedupe_key: Optional[str] = None, max_attempts: Optional[int] = None) -> Optional[int]:
+        """
+        Queue a job in the caller's transaction (the caller commits). Returns the job
+        id, or None when an unfinished job with the same `dedupe_key` exists.
+        """
+        spec = self._jobs.get(name)
+        job = Job(
+            name=name,
+            payload=json.dumps(payload) if payload is not None else None,
+            status=JobStatus.QUEUED,
+            run_at=run_at or datetime.now(),
+            dedupe_key=dedupe_key,
+            max_attempts=max_attempts or (spec.max_attempts if spec else 3),
+        )
+        try:
+            with db.begin_nested():
+                db.add(job)
+        except IntegrityError:
+            return None
+        return job.id
+
+    def schedule_periodic(self):
+        """Make sure every periodic job has a queued occurrence."""
+        with self.session_factory() as db:
+            for spec in self._jobs.values():
+                if spec.every:
+                    self.enqueue(db, spec.name, dedupe_key=spec.name)
+            db.commit()
+
+    def claim(self, db: Session) -> List[Claimed]:
+        now = datetime.now()
+        jobs = (
+            db.query(Job)
+            .filter(
+                Job.name.in_(self._jobs),
+                or_(
+                    and_(Job.status == JobStatus.QUEUED, Job.run_at <= now),
+                    and_(Job.status == JobStatus.RUNNING, Job.locked_until < now),
+                ),
+            )
+            .order_by(Job.run_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        claimed = []
+        for job in jobs:
+            job.status = JobStatus.RUNNING
+            job.attempts += 1
+            job.locked_by = self.worker_id
+            job.locked_until = now + self._jobs[job.name].lease
+            claimed.append((job.id, job.name, json.loads(job.payload) if job.payload else {}, job.attempts))
+        db.commit()
+        return claimed
+
+    def run_job(self, job_id: int, name: str, payload: dict, attempts: int):
+        spec = self._jobs[name]
+        started = time.perf_counter()
+        error = None
+        try:
+            with self.session_factory() as db:
+                spec.handler(db, payload)
+        except Exception:
+            logger.exception("job %s (%s) failed on attempt %s", job_id, name, attempts)
+            error = traceback.format_exc()
+        finally:
+            job_duration.observe(time.perf_counter() - started, job=name)
+        job_runs.inc(job=name, result=self._finish(job_id, spec, attempts, error))
+
+    def _finish(self, job_id: int, spec: JobSpec, attempts: int, error: Optional[str]) -> str:
+        now = datetime.now()
+        with self.session_factory() as db:
+            job = db.get(Job, job_id)
+            job.locked_by = None
+            job.locked_until = None
+            job.last_error = error
+            if error and attempts < job.max_attempts:
+                job.status = JobStatus.QUEUED
+                job.run_at = now + RETRY_BACKOFF * 2 ** (attempts - 1)
+                result = "retry"
+            else:
+                job.status = JobStatus.FAILED if error else JobStatus.DONE
+                job.finished_at = now
+                job.dedupe_key = None
+                result = "failed" if error else "done"
+                if spec.every:
+                    db.flush()
+                    self.enqueue(db, spec.name, run_at=now + spec.every, dedupe_key=spec.name)
+            db.commit()
+        return result
+
+    def run_pending(self) -> int:
+        """Claim and run the due jobs once; returns how many ran."""
+        with self.session_factory() as db:
+            claimed = self.claim(db)
+        for job in claimed:
+            self.run_job(*job)
+        return len(claimed)
+
+    def load_tasks(self):
+        for module in TASK_MODULES:
+            importlib.import_module(module)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.load_tasks()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval + 1)
+
+    def _run(self):
+        scheduled = False
+        while not self._stop.is_set():
+            ran = 0
+            try:
+                if not scheduled:
+                    self.schedule_periodic()
+                    scheduled = True
+                ran = self.run_pending()
+            except Exception:
+                logger.exception("job runner poll failed, retrying in %ss", self.poll_interval)
+            if not ran:
+                self._stop.wait(self.poll_interval)
+
+
+job_runner = JobRunner()
+
+
+@job_runner.job("jobs.purge", every=timedelta(days=1))
+def purge_finished_jobs(db: Session, payload: dict):
+    """Drop finished jobs older than a week."""
+    cutoff = datetime.now() - timedelta(days=7)
+    db.query(Job).filter(Job.status.in_([JobStatus.DONE, JobStatus.FAILED]), Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="create the jobs table if missing and exit")
+    args = parser.parse_args()
+    if args.migrate:
+        Job.__table__.create(engine, checkfirst=True)
+    else:
+        # the task modules register on tasks.runner.job_runner, not on this __main__ copy
+        from tasks.runner import job_runner as runner
+
+        logging.basicConfig(level=logging.INFO)
+        runner.start()
+        try:
+            while runner._thread.is_alive():
+                runner._thread.join(timeout=1)
+        except KeyboardInterrupt:
+            runner.stop()
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# settings are read at import time, so the test environment is set up first
+_db_path = os.path.join(tempfile.mkdtemp(prefix="bazaarche-tests-"), "test.db")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_db_path}",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "DEBUG": "false",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "KV_STORE_URL": "",
+    "JOB_RUNNER": "false",
+    "SMS_PROVIDER": "fake",
+    "FAKE_SMS_LATENCY": "0",
+})
+
+import pytest
+from core.database import SessionLocal, engine
+from models import Base
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
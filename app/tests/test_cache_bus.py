@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from sqlalchemy.dialects import postgresql
+from core.cache import TTLCache
+from core.cache_bus import CACHE_CHANNEL, MAX_PAYLOAD, CacheBus
+
+
+class FakeListener:
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def subscribe(self, channel, callback):
+        self.callbacks[channel] = callback
+
+
+class FakeSession:
+
+    def __init__(self, dialect: str):
+        self.bind = SimpleNamespace(dialect=SimpleNamespace(name=dialect))
+        self.statements = []
+
+    def get_bind(self):
+        return self.bind
+
+    def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})))
+
+
+def make_bus(dialect="sqlite"):
+    listener = FakeListener()
+    bus = CacheBus(SimpleNamespace(dialect=SimpleNamespace(name=dialect)), listener)
+    caches = [bus.register(TTLCache()), bus.register(TTLCache())]
+    for cache in caches:
+        cache.set("detail", 1, tags=["variation:1"])
+        cache.set("listing", 2, tags=["products"])
+    return bus, caches, listener
+
+
+def test_invalidate_reaches_every_registered_cache():
+    bus, caches, _ = make_bus()
+    bus.invalidate("variation:1")
+    assert [cache.get("detail") for cache in caches] == [None, None]
+    assert [cache.get("listing") for cache in caches] == [2, 2]
+
+
+def test_publish_notifies_inside_the_callers_transaction():
+    bus, caches, _ = make_bus()
+    db = FakeSession("postgresql")
+    bus.publish(db, "variation:1", "variation:2")
+    assert caches[0].get("detail") is None
+    assert len(db.statements) == 1
+    assert f"pg_notify('{CACHE_CHANNEL}', 'variation:1,variation:2')" in db.statements[0]
+
+
+def test_publish_stays_local_without_postgres():
+    bus, caches, _ = make_bus()
+    db = FakeSession("sqlite")
+    bus.publish(db, "variation:1")
+    assert db.statements == []
+    assert caches[1].get("detail") is None
+
+
+def test_notifications_from_other_workers_invalidate_and_reconnects_clear():
+    bus, caches, listener = make_bus()
+    on_message = listener.callbacks[CACHE_CHANNEL]
+    on_message("products,category:3")
+    assert caches[0].get("listing") is None and caches[0].get("detail") == 1
+    on_message(None)
+    assert len(caches[0]) == 0 and len(caches[1]) == 0
+
+
+def test_large_tag_sets_are_split_into_valid_payloads():
+    tags = [f"variation:{index}" for index in range(3000)]
+    payloads = CacheBus._payloads(tags)
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= MAX_PAYLOAD for payload in payloads)
+    assert sorted(tag for payload in payloads for tag in payload.split(",")) == sorted(tags)
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+import core.circuit_breaker as circuit_breaker
+from core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from external_services.payment_service import ZarinpalGateway
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # only the breaker's clock; the event loop keeps the real one
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test-open", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_single_trial_after_reset_timeout(clock):
+    breaker = CircuitBreaker("test-trial", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_abandoned_trial_is_given_up_after_reset_timeout(clock):
+    breaker = CircuitBreaker("test-abandoned", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    # the trial never records an outcome
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def make_gateway(handler, breaker):
+    gateway = ZarinpalGateway(
+        base_url="https://gateway.test/", start_pay_url="https://gateway.test/pay/", merchant_id="m",
+        callback_url="https://shop.test/callback", timeout=httpx.Timeout(5), max_connections=1,
+        verify_attempts=1, retry_backoff=0, breaker=breaker,
+    )
+    gateway._client = httpx.AsyncClient(base_url=gateway.base_url, transport=httpx.MockTransport(handler))
+    return gateway
+
+
+def test_cancelled_trial_reopens_the_circuit(clock):
+    breaker = CircuitBreaker("test-cancelled", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    async def slow(request):
+        await asyncio.sleep(10)
+
+    gateway = make_gateway(slow, breaker)
+
+    async def scenario():
+        trial = asyncio.create_task(gateway._post("request", "v4/payment/request.json", {}))
+        await asyncio.sleep(0.01)
+        # the client disconnects while the trial is in flight
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        with pytest.raises(CircuitOpenError):
+            await gateway._post("request", "v4/payment/request.json", {})
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
+
+
+def test_successful_trial_closes_the_circuit(clock):
+    breaker = CircuitBreaker("test-success", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    gateway = make_gateway(lambda request: httpx.Response(200, json={"data": {"code": 100}}), breaker)
+    assert asyncio.run(gateway._post("request", "v4/payment/request.json", {})) == {"data": {"code": 100}}
+    assert breaker.state == CLOSED
@@ -0,0 +1,37 @@
+from core.conditional import Version, is_not_modified
+from crud.product import product_service
+from schemas.product import ProductConfig
+
+
+def config(**overrides):
+    data = {"paginate": {"page": 1, "size": 10}, **overrides}
+    return ProductConfig(**data)
+
+
+def test_weak_and_strong_etags_match():
+    version = Version.of("product", 1, "x")
+    assert is_not_modified({"if-none-match": version.etag}, version.etag, None)
+    assert is_not_modified({"if-none-match": version.etag[2:]}, version.etag, None)
+    assert not is_not_modified({"if-none-match": '"other"'}, version.etag, None)
+
+
+def test_listing_etag_depends_on_the_request_body(db):
+    first_page = product_service.get_home_version(db, config())
+    second_page = product_service.get_home_version(db, config(paginate={"page": 2, "size": 10}))
+    filtered = product_service.get_home_version(db, config(keyword="phone"))
+    ordered = product_service.get_home_version(db, config(order_by="cheapest"))
+    assert len({first_page.etag, second_page.etag, filtered.etag, ordered.etag}) == 4
+    # revalidating page 2 with page 1's validator must not produce a 304
+    assert not is_not_modified({"if-none-match": first_page.etag}, second_page.etag, second_page.last_modified)
+
+
+def test_listing_etag_is_stable_for_the_same_request(db):
+    assert product_service.get_home_version(db, config(categories=[2, 1])).etag == \
+        product_service.get_home_version(db, config(categories=[1, 2])).etag
+
+
+def test_listing_sends_no_last_modified(db):
+    version = product_service.get_home_version(db, config())
+    assert version.last_modified is None
+    assert "Last-Modified" not in version.headers()
+    assert not is_not_modified({"if-modified-since": "Sun, 01 Jan 2090 00:00:00 GMT"}, version.etag, version.last_modified)
@@ -0,0 +1,117 @@
+import threading
+import time
+from services.facet_index import FacetIndex
+
+
+class CountingIndex(FacetIndex):
+    """Facet index whose loads are counted and slowed down instead of querying."""
+
+    def __init__(self, ttl=300, delay=0.05):
+        super().__init__(ttl=ttl, session_factory=lambda: _NullSession())
+        self.delay = delay
+        self.loads = 0
+        self.loading = threading.Event()
+        self._count_lock = threading.Lock()
+
+    def _load_products(self, db, product_ids=None):
+        with self._count_lock:
+            self.loads += 1
+        self.loading.set()
+        time.sleep(self.delay)
+        return {}
+
+    def _load_categories(self, db, category_ids=None):
+        return {}
+
+
+class _NullSession:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_first_build_runs_once_for_concurrent_requests():
+    index = CountingIndex()
+    threads = [threading.Thread(target=index.ensure, args=(None,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert index.loads == 1
+    assert index.built and not index.is_stale()
+
+
+def test_stale_index_is_served_while_one_background_rebuild_runs():
+    index = CountingIndex(delay=0.2)
+    index.ensure(None)
+    old = index._products
+    index.loading.clear()
+    index.invalidate()
+
+    for _ in range(5):
+        index.ensure(None)
+        # the request path returns at once with the old index
+        assert index._products is old
+    assert index.loading.wait(1)
+    with index._build_lock:
+        pass
+    assert index.loads == 2
+    assert index._products is not old
+    assert not index.is_stale()
+
+
+def test_invalidate_during_rebuild_keeps_index_stale():
+    index = CountingIndex(delay=0.2)
+    index.ensure(None)
+    index.invalidate()
+    index.loading.clear()
+    index.ensure(None)
+    assert index.loading.wait(1)
+    # changed while the rebuild was loading: its result is already out of date
+    index.invalidate()
+    with index._build_lock:
+        pass
+    assert index.is_stale()
+
+
+def test_cold_index_is_built_off_the_loop_for_concurrent_async_listings(db, monkeypatch):
+    import asyncio
+    from core.database import AsyncSessionLocal, async_engine
+    from crud.aio import async_product_service
+    import crud.product as product_module
+    import crud.aio as aio_module
+    from schemas.product import ProductConfig
+
+    index = CountingIndex(delay=0.2)
+    index.session_factory = lambda: _NullSession()
+    monkeypatch.setattr(product_module, "facet_index", index)
+    monkeypatch.setattr(aio_module, "facet_index", index)
+    config = ProductConfig(paginate={"page": 1, "size": 10})
+
+    async def listing():
+        async with AsyncSessionLocal() as session:
+            return await async_product_service.get_home_products(session, config)
+
+    async def scenario():
+        try:
+            return await asyncio.wait_for(asyncio.gather(*[listing() for _ in range(3)]), 10)
+        finally:
+            await async_engine.dispose()
+
+    results = asyncio.run(scenario())
+    assert len(results) == 3
+    assert index.loads == 1
+
+
+def test_building_on_the_event_loop_is_refused():
+    import asyncio
+    import pytest
+
+    async def scenario():
+        CountingIndex().ensure(None)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import pytest
+from core.database import AsyncSessionLocal, async_engine
+from core.kv_store import kv_store
+from crud.aio import async_cart_service
+from crud.cart import GUEST_CART_MERGE_PREFIX, GUEST_CART_PREFIX, cart_service
+from models.product import InventoryStatus, Product, ProductType, ProductVariation, Status
+from models.user import User
+from schemas.cart import CartBatch
+
+TOKEN = "guest-token"
+
+
+@pytest.fixture
+def catalog(db):
+    db.add(User(id=1, phone_number="09120000000", is_active=True))
+    db.add(Product(id=1, user_id=1, name="p", slug="p", type=ProductType.SIMPLE, status=Status.PUBLISHED))
+    db.add(ProductVariation(id=7, product_id=1, sku="p-7", unit_price=100, sales_price=90, quantity=5, status=InventoryStatus.INSTOCK))
+    db.commit()
+    cart_service.save_guest_lines(TOKEN, {7: (2, 180)})
+    yield db
+    kv_store.delete(GUEST_CART_PREFIX + TOKEN)
+    kv_store.delete(GUEST_CART_MERGE_PREFIX + TOKEN)
+
+
+def test_merge_moves_the_guest_cart_and_then_deletes_it(catalog):
+    merged = cart_service.merge_guest_cart(catalog, 1, TOKEN)
+    assert [(item.variation_id, item.quantity) for item in merged.cart_items] == [(7, 2)]
+    assert kv_store.get(GUEST_CART_PREFIX + TOKEN) is None
+
+
+def test_failed_merge_keeps_the_guest_cart(catalog, monkeypatch):
+    def failing_apply(*args):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(cart_service, "_apply", failing_apply)
+    with pytest.raises(RuntimeError):
+        cart_service.merge_guest_cart(catalog, 1, TOKEN)
+    assert cart_service.guest_lines(TOKEN) == {7: (2, 180)}
+    # the merge claim is released, so the next login can merge it
+    assert kv_store.get(GUEST_CART_MERGE_PREFIX + TOKEN) is None
+
+
+def test_concurrent_merge_of_the_same_guest_cart_is_skipped(catalog):
+    kv_store.add(GUEST_CART_MERGE_PREFIX + TOKEN, 2, ttl=60)
+    assert cart_service.merge_guest_cart(catalog, 1, TOKEN) is None
+    assert cart_service.guest_lines(TOKEN) is not None
+
+
+def test_async_guest_paths_call_the_store_off_the_event_loop(catalog, monkeypatch):
+    threads = []
+    guest_lines, save_guest_lines = cart_service.guest_lines, cart_service.save_guest_lines
+
+    def recording(method):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return method(*args)
+        return wrapper
+
+    monkeypatch.setattr(cart_service, "guest_lines", recording(guest_lines))
+    monkeypatch.setattr(cart_service, "save_guest_lines", recording(save_guest_lines))
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            batch = CartBatch(upserts=[{"variation_id": 7, "quantity": 3}])
+            token, cart = await async_cart_service.apply_guest_batch(session, TOKEN, batch)
+            _, fetched = await async_cart_service.get_guest_cart(session, token)
+        # connections belong to this event loop
+        await async_engine.dispose()
+        return token, cart, fetched, threading.current_thread()
+
+    token, cart, fetched, loop_thread = asyncio.run(scenario())
+    assert token == TOKEN
+    assert [(item.variation_id, item.quantity) for item in fetched.cart_items] == [(7, 3)]
+    assert len(threads) == 3
+    assert loop_thread not in threads
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+import pytest
+from core.database import SessionLocal
+from models.job import Job, JobStatus
+from tasks.runner import JobRunner
+
+
+@pytest.fixture
+def runner(db):
+    runner = JobRunner(session_factory=SessionLocal, poll_interval=0.01)
+    runner.calls = []
+
+    @runner.job("test.ok")
+    def ok(session, payload):
+        runner.calls.append(payload)
+
+    @runner.job("test.broken", max_attempts=2)
+    def broken(session, payload):
+        raise RuntimeError("boom")
+
+    @runner.job("test.periodic", every=timedelta(minutes=5))
+    def periodic(session, payload):
+        runner.calls.append("periodic")
+
+    return runner
+
+
+def job(db, job_id):
+    db.expire_all()
+    return db.get(Job, job_id)
+
+
+def test_due_job_is_claimed_once(runner, db):
+    job_id = runner.enqueue(db, "test.ok", payload={"n": 1})
+    runner.enqueue(db, "test.ok", payload={"n": 2}, run_at=datetime.now() + timedelta(hours=1))
+    db.commit()
+
+    claimed = runner.claim(db)
+    assert claimed == [(job_id, "test.ok", {"n": 1}, 1)]
+    # leased: another runner polling now gets nothing
+    assert runner.claim(db) == []
+    claimed_job = job(db, job_id)
+    assert claimed_job.status == JobStatus.RUNNING
+    assert claimed_job.locked_by == runner.worker_id
+    assert claimed_job.locked_until > datetime.now()
+
+
+def test_job_of_a_dead_runner_is_claimed_again_after_its_lease(runner, db):
+    job_id = runner.enqueue(db, "test.ok")
+    db.commit()
+    runner.claim(db)
+    db.query(Job).filter_by(id=job_id).update({Job.locked_until: datetime.now() - timedelta(seconds=1)})
+    db.commit()
+
+    assert runner.claim(db) == [(job_id, "test.ok", {}, 2)]
+
+
+def test_run_pending_finishes_the_job(runner, db):
+    job_id = runner.enqueue(db, "test.ok", payload={"n": 1})
+    db.commit()
+
+    assert runner.run_pending() == 1
+    assert runner.calls == [{"n": 1}]
+    finished = job(db, job_id)
+    assert finished.status == JobStatus.DONE
+    assert finished.locked_by is None and finished.finished_at is not None
+
+
+def test_failing_job_is_retried_with_backoff_then_failed(runner, db):
+    job_id = runner.enqueue(db, "test.broken")
+    db.commit()
+
+    runner.run_pending()
+    retried = job(db, job_id)
+    assert retried.status == JobStatus.QUEUED
+    assert retried.run_at > datetime.now() + timedelta(seconds=25)
+    assert "boom" in retried.last_error
+
+    db.query(Job).filter_by(id=job_id).update({Job.run_at: datetime.now()})
+    db.commit()
+    runner.run_pending()
+    assert job(db, job_id).status == JobStatus.FAILED
+
+
+def test_periodic_job_keeps_one_queued_occurrence(runner, db):
+    runner.schedule_periodic()
+    runner.schedule_periodic()
+    queued = db.query(Job).filter_by(name="test.periodic").all()
+    assert len(queued) == 1
+
+    runner.run_pending()
+    db.expire_all()
+    jobs = db.query(Job).filter_by(name="test.periodic").order_by(Job.id).all()
+    assert [j.status for j in jobs] == [JobStatus.DONE, JobStatus.QUEUED]
+    assert jobs[1].run_at > datetime.now() + timedelta(minutes=4)
+    assert jobs[1].dedupe_key == "test.periodic"
@@ -0,0 +1,25 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from core.config import settings
+from routers.v1.metrics import metrics_router
+
+
+def client():
+    app = FastAPI()
+    app.include_router(metrics_router)
+    return TestClient(app)
+
+
+def test_metrics_is_off_without_a_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "")
+    assert client().get("/metrics").status_code == 404
+    assert client().get("/metrics", headers={"Authorization": "Bearer "}).status_code == 404
+
+
+def test_metrics_requires_the_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    assert client().get("/metrics").status_code == 401
+    assert client().get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client().get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
@@ -0,0 +1,90 @@
+import json
+from sqlalchemy.dialects import postgresql
+import crud.order as order_module
+from crud.order import FinalizeResult, order_service
+from models import Order, OrderItem, OrderStatus
+from services.stock_reservations import stock_reservations
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return self
+
+    def all(self):
+        return []
+
+
+def make_order(db, status=OrderStatus.PENDING, items=((7, 2), (8, 1))):
+    order = Order(customer_id=1, order_total=100, final_price=100, status=status)
+    db.add(order)
+    db.flush()
+    for variation_id, quantity in items:
+        db.add(OrderItem(
+            order_id=order.id, product_id=1, product_name="p", quantity=quantity,
+            unit_price=10, sales_price=10, product_metadata=json.dumps(variation_id),
+        ))
+    db.commit()
+    return order.id
+
+
+def stub_commit(monkeypatch, committed):
+    calls = []
+
+    def commit_reservations(db, order_id):
+        calls.append(order_id)
+        return committed
+
+    monkeypatch.setattr(order_module.product_service, "commit_reservations", commit_reservations)
+    return calls
+
+
+def status_of(db, order_id):
+    db.expire_all()
+    return db.get(Order, order_id).status
+
+
+def test_paid_order_with_all_reservations_is_processing(db, monkeypatch):
+    order_id = make_order(db)
+    stub_commit(monkeypatch, {7: 2, 8: 1})
+    assert order_service.finalize_order(db, order_id) == FinalizeResult.FINALIZED
+    db.commit()
+    assert status_of(db, order_id) == OrderStatus.PROCESSING
+
+
+def test_released_reservations_cancel_the_order(db, monkeypatch):
+    # the sweep released one of the reservations before the payment arrived
+    order_id = make_order(db)
+    stub_commit(monkeypatch, {7: 2})
+    assert order_service.finalize_order(db, order_id) == FinalizeResult.RELEASED
+    db.commit()
+    assert status_of(db, order_id) == OrderStatus.CANCELED
+
+
+def test_cancelled_order_is_not_finalized(db, monkeypatch):
+    order_id = make_order(db, status=OrderStatus.CANCELED)
+    calls = stub_commit(monkeypatch, {7: 2, 8: 1})
+    assert order_service.finalize_order(db, order_id) == FinalizeResult.RELEASED
+    assert calls == []
+    assert status_of(db, order_id) == OrderStatus.CANCELED
+
+
+def test_commit_touches_only_active_reservations_of_the_order():
+    session = FakeSession()
+    assert stock_reservations.commit(session, 5) == {}
+    sql = session.statements[0]
+    assert "stock_reservations.order_id = %(order_id_1)s" in sql
+    assert "stock_reservations.status = %(status_1)s" in sql
+    assert "reserved_quantity" in sql
+
+
+def test_already_finalized_order_is_left_alone(db, monkeypatch):
+    order_id = make_order(db, status=OrderStatus.PROCESSING)
+    calls = stub_commit(monkeypatch, {})
+    assert order_service.finalize_order(db, order_id) == FinalizeResult.ALREADY_FINALIZED
+    assert calls == []
+    assert status_of(db, order_id) == OrderStatus.PROCESSING
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.orm import Session, declarative_base
+from core.database import engine
+from schemas.pagination import Pagination
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = "pagination_items"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+
+
+@pytest.fixture
+def session():
+    Base.metadata.create_all(engine)
+    now = datetime(2024, 1, 1)
+    with Session(engine) as db:
+        for index in range(1, 13):
+            # every third row has no name and no creation time
+            missing = index % 3 == 0
+            db.add(Item(
+                id=index,
+                name=None if missing else f"item-{index % 4}",
+                created_at=None if missing else now + timedelta(days=index % 5),
+            ))
+        db.commit()
+        yield db
+    Base.metadata.drop_all(engine)
+
+
+def walk(db, keys, row_key, size=3):
+    seen, after = [], None
+    while True:
+        rows, pagination = Pagination.fetch_page(db.query(Item), keys, row_key, size=size, cursor=True, after=after)
+        seen.extend(row.id for row in rows)
+        if not pagination.next_cursor:
+            return seen
+        after = pagination.next_cursor
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_cursor_pages_cover_every_row_once_with_null_keys(session, descending):
+    keys = [(Item.created_at, descending), (Item.id, descending)]
+    row_key = lambda item: (item.created_at, item.id)
+    expected = [item.id for item in session.query(Item).order_by(*Pagination.ordering(keys))]
+
+    assert walk(session, keys, row_key) == expected
+    # NULLs come last whatever the direction
+    assert expected[-4:] == sorted([3, 6, 9, 12], reverse=descending)
+
+
+def test_mixed_directions_with_null_keys(session):
+    keys = [(Item.name, False), (Item.created_at, True), (Item.id, False)]
+    row_key = lambda item: (item.name, item.created_at, item.id)
+    expected = [item.id for item in session.query(Item).order_by(*Pagination.ordering(keys))]
+
+    assert walk(session, keys, row_key, size=2) == expected
+    assert sorted(expected) == list(range(1, 13))
+
+
+def test_cursor_from_another_ordering_is_rejected(session):
+    by_date = [(Item.created_at, True), (Item.id, True)]
+    by_name = [(Item.name, True), (Item.id, True)]
+    _, pagination = Pagination.fetch_page(session.query(Item), by_date, lambda item: (item.created_at, item.id), size=2, cursor=True)
+
+    with pytest.raises(HTTPException) as error:
+        Pagination.fetch_page(session.query(Item), by_name, lambda item: (item.name, item.id), size=2, after=pagination.next_cursor)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        Pagination.fetch_page(session.query(Item), [(Item.created_at, False), (Item.id, False)], lambda item: (item.created_at, item.id),
+                              size=2, after=pagination.next_cursor)
+
+
+def test_malformed_cursor_is_rejected(session):
+    with pytest.raises(HTTPException) as error:
+        Pagination.fetch_page(session.query(Item), [(Item.id, True)], lambda item: (item.id,), after="not-a-cursor")
+    assert error.value.status_code == 400
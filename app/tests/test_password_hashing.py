@@ -0,0 +1,72 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import anyio.to_thread
+import httpx
+from fastapi import FastAPI
+import core.security as security
+from models.user import Role, User
+from routers.v1.auth import auth_router
+
+PHONE = "09120000000"
+
+
+class SlowContext:
+    """Stands in for bcrypt: every verify takes `delay` seconds of the hash pool."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def verify(self, plain, hashed):
+        time.sleep(self.delay)
+        return plain == hashed
+
+
+def test_login_burst_does_not_hold_request_threads(db, monkeypatch):
+    db.add(Role(id=3, name="customer"))
+    db.add(User(id=1, phone_number=PHONE, role_id=3, password="secret", is_active=True))
+    db.commit()
+    monkeypatch.setattr(security, "pwd_context", SlowContext(0.3))
+    monkeypatch.setattr(security, "password_executor", ThreadPoolExecutor(max_workers=1))
+
+    app = FastAPI()
+    app.include_router(auth_router)
+
+    @app.get("/ping")
+    def ping():
+        return {}
+
+    async def scenario():
+        # only two request threads, so a login holding one for its hash would starve /ping
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 2
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"username": PHONE, "password": "secret", "hasPassword": True}
+            logins = [asyncio.create_task(client.post("/auth/login", json=body)) for _ in range(4)]
+            await asyncio.sleep(0.1)
+            started = time.perf_counter()
+            await client.get("/ping")
+            ping_seconds = time.perf_counter() - started
+            responses = await asyncio.gather(*logins)
+        return ping_seconds, responses
+
+    ping_seconds, responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200] * 4
+    # four hashes queue for 1.2s on the single-worker pool; /ping is not stuck behind them
+    assert ping_seconds < 0.25
+
+
+def test_wrong_password_is_rejected(db, monkeypatch):
+    db.add(Role(id=3, name="customer"))
+    db.add(User(id=1, phone_number=PHONE, role_id=3, password="secret", is_active=True))
+    db.commit()
+    monkeypatch.setattr(security, "pwd_context", SlowContext(0))
+    app = FastAPI()
+    app.include_router(auth_router)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/auth/login", json={"username": PHONE, "password": "wrong", "hasPassword": True})
+
+    assert asyncio.run(scenario()).status_code == 401
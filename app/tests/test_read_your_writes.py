@@ -0,0 +1,56 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+import core.database as database
+from core.kv_store import kv_store
+from core.security import create_access_token
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # a replica is configured, so writes open a read-your-writes window
+    monkeypatch.setattr(database, "replica_urls", ["postgresql://replica/db"])
+    app = FastAPI()
+    app.middleware("http")(database.read_your_writes)
+
+    @app.post("/write")
+    def write(request: Request):
+        request.state.db_wrote = True
+        return {}
+
+    @app.get("/primary")
+    def primary(request: Request):
+        return {"primary": database._use_primary(request)}
+
+    yield TestClient(app)
+    kv_store.delete(database._read_your_writes_key("7"))
+    kv_store.delete(database._read_your_writes_key("8"))
+
+
+def test_window_follows_the_user_not_a_cookie(client):
+    headers = {"Authorization": f"Bearer {create_access_token(7)}"}
+    assert client.get("/primary", headers=headers).json() == {"primary": False}
+
+    response = client.post("/write", headers=headers)
+    assert database.READ_YOUR_WRITES_COOKIE not in response.cookies
+    client.cookies.clear()
+
+    # same user, no cookie (another device, a bearer-only API client)
+    assert client.get("/primary", headers=headers).json() == {"primary": True}
+    other = {"Authorization": f"Bearer {create_access_token(8)}"}
+    assert client.get("/primary", headers=other).json() == {"primary": False}
+
+
+def test_anonymous_clients_fall_back_to_the_cookie(client):
+    response = client.post("/write")
+    assert database.READ_YOUR_WRITES_COOKIE in response.cookies
+    assert client.get("/primary").json() == {"primary": True}
+    client.cookies.clear()
+    assert client.get("/primary").json() == {"primary": False}
+
+
+def test_invalid_token_is_treated_as_anonymous(client):
+    headers = {"Authorization": "Bearer not-a-jwt"}
+    client.post("/write", headers=headers)
+    client.cookies.clear()
+    assert client.get("/primary", headers=headers).json() == {"primary": False}
@@ -0,0 +1,128 @@
+import asyncio
+import httpx
+from fastapi import FastAPI
+from core.response_cache import LocalBackend, ResponseCache, ResponseCacheMiddleware, cache_response, tag_response
+
+
+def make_app(handler_gate=None, swr=0):
+    cache = ResponseCache(LocalBackend(maxsize=100))
+    app = FastAPI()
+    app.add_middleware(ResponseCacheMiddleware, cache=cache)
+    app.state.calls = 0
+
+    @app.get("/items/{item_id}")
+    @cache_response(ttl=60, swr=swr, tags=["item:{item_id}"])
+    async def item(item_id: int):
+        app.state.calls += 1
+        tag_response("items")
+        if handler_gate is not None:
+            await handler_gate()
+        return {"id": item_id, "calls": app.state.calls}
+
+    return app, cache
+
+
+def run(app, scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+def test_key_ignores_query_order_and_body_formatting():
+    cache = ResponseCache(LocalBackend(maxsize=10))
+    scope = {"method": "GET", "path": "/products/"}
+    first = cache.key({**scope, "query_string": b"b=2&a=1"}, b'{"page": 1, "size": 10}')
+    second = cache.key({**scope, "query_string": b"a=1&b=2"}, b'{"size":10,"page":1}')
+    assert first == second
+    assert first != cache.key({**scope, "query_string": b"a=1&b=2"}, b'{"size":10,"page":2}')
+
+
+def test_hit_after_miss_and_tag_invalidation():
+    app, cache = make_app()
+
+    async def scenario(client):
+        first = await client.get("/items/1")
+        second = await client.get("/items/1")
+        cache.invalidate_tags("item:1")
+        third = await client.get("/items/1")
+        # runtime tags added with tag_response drop the entry as well
+        cache.invalidate_tags("items")
+        fourth = await client.get("/items/1")
+        return first, second, third, fourth
+
+    first, second, third, fourth = run(app, scenario)
+    assert [r.headers["x-cache"] for r in (first, second, third, fourth)] == ["MISS", "HIT", "MISS", "MISS"]
+    assert [r.json()["calls"] for r in (first, second, third, fourth)] == [1, 1, 2, 3]
+
+
+def test_fill_invalidated_mid_flight_is_not_stored():
+    cache_holder = {}
+
+    async def invalidate_during_handler():
+        # a write lands while this response is still being produced
+        cache_holder["cache"].invalidate_tags("item:1")
+
+    app, cache = make_app(invalidate_during_handler)
+    cache_holder["cache"] = cache
+
+    async def scenario(client):
+        return await client.get("/items/1")
+
+    assert run(app, scenario).headers["x-cache"] == "MISS"
+    assert len(cache.backend.cache) == 0
+
+
+def test_generation_only_rejects_fills_older_than_the_invalidation():
+    cache = ResponseCache(LocalBackend(maxsize=10))
+    before = cache.generation()
+    cache.invalidate_tags("item:1")
+    after = cache.generation()
+    assert cache.moved({"item:1"}, before)
+    assert not cache.moved({"item:1"}, after)
+    assert not cache.moved({"item:2"}, before)
+    cache.clear()
+    assert cache.moved({"item:2"}, after)
+
+
+def test_stale_revalidation_task_is_held_until_done():
+    app, cache = make_app(swr=300)
+
+    async def scenario(client):
+        await client.get("/items/1")
+        # older than the ttl, within the swr window
+        key = next(iter(cache.backend.cache._data))
+        cache.backend.cache._data[key][0]["stored_at"] -= 120
+        stale = await client.get("/items/1")
+        pending = set(cache._tasks)
+        await asyncio.gather(*pending)
+        return stale, pending
+
+    stale, pending = run(app, scenario)
+    assert stale.headers["x-cache"] == "STALE"
+    assert len(pending) == 1
+    assert not cache._tasks
+    assert app.state.calls == 2
+
+
+def test_shared_backend_is_invalidated_off_the_event_loop():
+    import threading
+
+    class BlockingBackend(LocalBackend):
+        blocking = True
+
+        def invalidate_tags(self, *tags):
+            self.thread = threading.current_thread()
+            super().invalidate_tags(*tags)
+
+    cache = ResponseCache(BlockingBackend(maxsize=10))
+
+    async def scenario():
+        cache.invalidate_tags("item:1")
+        await asyncio.gather(*cache._tasks)
+
+    asyncio.run(scenario())
+    assert cache.backend.thread is not threading.main_thread()
+    cache.invalidate_tags("item:2")
+    assert cache.backend.thread is threading.main_thread()
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql
+from models.product import ReservationStatus, StockReservation
+from services.stock_reservations import stock_reservations
+
+
+class CompilingSession:
+    """Records the Postgres SQL of executed statements; the ledger statements need Postgres."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, *args):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return self
+
+    def all(self):
+        return []
+
+
+def test_record_stores_active_reservations_with_an_expiry(db):
+    stock_reservations.record(db, {7: 2, 8: 1}, order_id=5, ttl=60)
+    db.commit()
+    rows = db.query(StockReservation).order_by(StockReservation.variation_id).all()
+    assert [(row.variation_id, row.quantity, row.order_id, row.status) for row in rows] == [
+        (7, 2, 5, ReservationStatus.ACTIVE), (8, 1, 5, ReservationStatus.ACTIVE),
+    ]
+    assert all(datetime.now() < row.expires_at <= datetime.now() + timedelta(seconds=60) for row in rows)
+
+
+def test_release_batch_skips_locked_rows_and_cancels_only_pending_orders():
+    session = CompilingSession()
+    assert stock_reservations.release_expired(session, batch_size=50) == []
+    sql = session.statements[0]
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "LIMIT %(param_" in sql
+    assert "UPDATE orders SET status=" in sql and "orders.status = %(status_" in sql
+    assert "quantity=(product_variations.quantity + totals.quantity)" in sql
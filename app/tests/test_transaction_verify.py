@@ -0,0 +1,106 @@
+import asyncio
+import json
+import pytest
+import crud.order as order_module
+import crud.transaction as transaction_module
+from crud.transaction import TransactionService
+from models import Order, OrderItem, OrderStatus
+from models.transaction import Transaction
+from models.user import User
+from schemas.transaction import VerifyTransactionReq, VerifyTransactionRes
+
+RES_NUMBER = "A0000000000000000000000000000123456"
+
+
+class FakeGateway:
+    """Answers every verification with success, as the gateway does for a repeat (code 101)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def verify_pay(self, data):
+        self.calls += 1
+        return VerifyTransactionRes(status="success", ref_id=201)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    gateway = FakeGateway()
+    monkeypatch.setattr(transaction_module, "payment_gateway", gateway)
+    return gateway
+
+
+def make_paid_order(db, order_status=OrderStatus.PENDING):
+    db.add(User(id=1, phone_number="09120000000", balance=0, is_active=True))
+    order = Order(id=1, customer_id=1, order_total=500, final_price=500, status=order_status)
+    db.add(order)
+    db.add(OrderItem(order_id=1, product_id=1, product_name="p", quantity=2, unit_price=250, sales_price=250,
+                     product_metadata=json.dumps(7)))
+    db.add(Transaction(id=1, order_id=1, user_id=1, transaction_type="order", amount=500, status="pending",
+                       res_number=RES_NUMBER))
+    db.commit()
+
+
+def verify(db):
+    request = VerifyTransactionReq(status="OK", res_number=RES_NUMBER)
+    return asyncio.run(TransactionService(db).verify(request, 1))
+
+
+def balance(db):
+    db.expire_all()
+    return db.get(User, 1).balance
+
+
+def test_replayed_verification_changes_nothing(db, gateway, monkeypatch):
+    make_paid_order(db)
+    monkeypatch.setattr(order_module.product_service, "commit_reservations", lambda db, order_id: {7: 2})
+
+    assert verify(db).status == "success"
+    assert verify(db).status == "success"
+
+    assert gateway.calls == 1
+    assert balance(db) == 0
+    assert db.get(Order, 1).status == OrderStatus.PROCESSING
+
+
+def test_payment_for_a_released_order_is_refunded_once(db, gateway, monkeypatch):
+    # the expiry sweep released the reservations and cancelled the order before the payment arrived
+    make_paid_order(db, order_status=OrderStatus.CANCELED)
+
+    verify(db)
+    verify(db)
+
+    assert gateway.calls == 1
+    assert balance(db) == 500
+
+
+def test_already_verified_answer_on_a_settled_deposit_is_a_no_op(db, monkeypatch):
+    import httpx
+    from core.circuit_breaker import CircuitBreaker
+    from external_services.payment_service import ZarinpalGateway
+
+    answers = iter([100, 101, 101])
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"data": {"code": next(answers), "ref_id": 201}})
+
+    gateway = ZarinpalGateway(
+        base_url="https://gateway.test/", start_pay_url="https://gateway.test/pay/", merchant_id="m",
+        callback_url="https://shop.test/callback", timeout=httpx.Timeout(5), max_connections=1,
+        verify_attempts=1, retry_backoff=0, breaker=CircuitBreaker("test-verify-replay"),
+    )
+    gateway._client = httpx.AsyncClient(base_url=gateway.base_url, transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(transaction_module, "payment_gateway", gateway)
+    db.add(User(id=1, phone_number="09120000000", balance=0, is_active=True))
+    db.add(Transaction(id=1, user_id=1, transaction_type="wallet_deposit", amount=300, status="pending",
+                       res_number=RES_NUMBER))
+    db.commit()
+
+    for _ in range(3):
+        assert verify(db).status == "success"
+
+    # the gateway would answer 101 to the replays; they never reach it and pay nothing
+    assert len(requests) == 1
+    assert balance(db) == 300
@@ -0,0 +1,84 @@
+import pytest
+from fastapi import HTTPException
+import crud.verification_code as verification_code
+from core.config import settings
+from core.kv_store import kv_store
+from crud.verification_code import verification_code_service as vc_service
+from models.verification_code import VerificationCode
+
+PHONE = "09120000000"
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    yield
+    for prefix in ("otp:", "otp-attempts:", "otp-resend:", "otp-phone:"):
+        kv_store.delete(prefix + PHONE)
+    kv_store.delete("otp-ip:10.0.0.1")
+
+
+def test_code_is_accepted_once(db):
+    code = vc_service.create_verification_code(db, PHONE)
+    assert vc_service.consume_code(db, PHONE, code) is True
+    assert vc_service.consume_code(db, PHONE, code) is False
+
+
+def test_wrong_guesses_lock_the_code(db, monkeypatch):
+    monkeypatch.setattr(settings, "otp_max_attempts", 3)
+    code = vc_service.create_verification_code(db, PHONE)
+    wrong = "00000" if code != "00000" else "11111"
+    assert vc_service.consume_code(db, PHONE, wrong) is False
+    assert vc_service.consume_code(db, PHONE, wrong) is False
+    with pytest.raises(HTTPException) as error:
+        vc_service.consume_code(db, PHONE, wrong)
+    assert error.value.status_code == 429
+    # the right code no longer works once the code is locked
+    with pytest.raises(HTTPException):
+        vc_service.consume_code(db, PHONE, code)
+
+
+def test_code_issued_during_an_outage_works_after_the_store_is_back(db, monkeypatch):
+    class DownStore:
+        def __getattr__(self, name):
+            def unavailable(*args, **kwargs):
+                raise ConnectionError("store is down")
+            return unavailable
+
+    monkeypatch.setattr(verification_code, "kv_store", DownStore())
+    code = vc_service.create_verification_code(db, PHONE)
+    assert db.query(VerificationCode).filter_by(phone_number=PHONE).one().code == code
+    monkeypatch.setattr(verification_code, "kv_store", kv_store)
+
+    assert vc_service.consume_code(db, PHONE, code) is True
+    assert vc_service.consume_code(db, PHONE, code) is False
+
+
+def test_lockout_also_stops_guessing_a_code_stored_in_the_table(db, monkeypatch):
+    monkeypatch.setattr(settings, "otp_max_attempts", 3)
+    # issued during a store outage, so only the table has it
+    code = VerificationCode.create_code(db, PHONE, ttl=600).code
+    wrong = "00000" if code != "00000" else "11111"
+    assert vc_service.consume_code(db, PHONE, wrong) is False
+    assert vc_service.consume_code(db, PHONE, wrong) is False
+    with pytest.raises(HTTPException):
+        vc_service.consume_code(db, PHONE, wrong)
+
+    with pytest.raises(HTTPException) as error:
+        vc_service.consume_code(db, PHONE, code)
+    assert error.value.status_code == 429
+    db.expire_all()
+    assert db.query(VerificationCode).filter_by(phone_number=PHONE).one().is_used is False
+
+
+def test_counter_is_read_back(db):
+    assert kv_store.count("otp-attempts:" + PHONE) == 0
+    kv_store.incr("otp-attempts:" + PHONE, ttl=60)
+    kv_store.incr("otp-attempts:" + PHONE, ttl=60)
+    assert kv_store.count("otp-attempts:" + PHONE) == 2
+
+
+def test_resend_is_throttled_per_phone(db):
+    vc_service.create_verification_code(db, PHONE, "10.0.0.1")
+    with pytest.raises(HTTPException) as error:
+        vc_service.create_verification_code(db, PHONE, "10.0.0.1")
+    assert error.value.status_code == 429